@@ -3,6 +3,7 @@ from django.utils.html import format_html
 from django.utils.safestring import mark_safe
 from django.urls import reverse
 from django.db.models import Count
+from core.exportar import ExportarMixin
 from .models import Perro, SolicitudAdopcion, FiltroAdopcion
 
 @admin.register(Perro)
@@ -89,8 +90,12 @@ class PerroAdmin(admin.ModelAdmin):
         )
     salud_status.short_description = "Salud"
     
+    def get_queryset(self, request):
+        # El número de solicitudes del listado, en la misma consulta que los perros
+        return super().get_queryset(request).annotate(num_solicitudes=Count('solicitudes'))
+    
     def solicitudes_count(self, obj):
-        count = obj.solicitudes.count()
+        count = obj.num_solicitudes
         if count > 0:
             url = reverse('admin:adopciones_solicitudadopcion_changelist') + f'?perro__id__exact={obj.id}'
             return format_html(
@@ -101,6 +106,7 @@ class PerroAdmin(admin.ModelAdmin):
             )
         return "0 solicitudes"
     solicitudes_count.short_description = "Solicitudes"
+    solicitudes_count.admin_order_field = 'num_solicitudes'
     
     def marcar_disponible(self, request, queryset):
         updated = queryset.update(estado='disponible')
@@ -118,13 +124,15 @@ class PerroAdmin(admin.ModelAdmin):
     marcar_en_proceso.short_description = "⏳ Marcar como en proceso"
 
 @admin.register(SolicitudAdopcion)
-class SolicitudAdopcionAdmin(admin.ModelAdmin):
+class SolicitudAdopcionAdmin(ExportarMixin, admin.ModelAdmin):
     list_display = ['solicitante_info', 'perro_link', 'perro_estado', 'contacto', 'vivienda_info', 'patio_info', 'estado_badge', 'fecha_solicitud']
     list_filter = ['estado', 'fecha_solicitud', 'vivienda_tipo', 'patio', 'perro__estado']
     search_fields = ['nombre_solicitante', 'email', 'perro__nombre', 'telefono']
     readonly_fields = ['fecha_solicitud']
-    actions = ['aprobar_solicitudes', 'rechazar_solicitudes', 'marcar_en_revision']
+    actions = ['aprobar_solicitudes', 'rechazar_solicitudes', 'marcar_en_revision', 'exportar_csv', 'exportar_xlsx']
+    exportacion = 'solicitudes'
     list_per_page = 25
+    list_select_related = ['perro']
     date_hierarchy = 'fecha_solicitud'
     
     fieldsets = (
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-19 16:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adopciones', '0002_change_patio_to_charfield'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='perro',
+            index=models.Index(fields=['estado', '-fecha_ingreso', '-id'], name='perro_catalogo_idx'),
+        ),
+    ]
@@ -54,6 +54,10 @@ class Perro(models.Model):
         verbose_name = "Perro"
         verbose_name_plural = "Perros"
         ordering = ['-fecha_ingreso']
+        indexes = [
+            # Catálogo y scroll infinito: filtro por estado + cursor (fecha_ingreso, id)
+            models.Index(fields=['estado', '-fecha_ingreso', '-id'], name='perro_catalogo_idx'),
+        ]
 
 class SolicitudAdopcion(models.Model):
     ESTADO_SOLICITUD_CHOICES = [
@@ -1,3 +1,75 @@
+import datetime
+import re
+
 from django.test import TestCase
+from django.urls import reverse
+
+from core.testing import QueryBudgetMixin
+
+from .models import Perro
+from .views import PERROS_POR_LOTE, cursor_perro, parse_cursor
+
+
+class VistasAdopcionQueryBudgetTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.perro = Perro.objects.filter(estado='disponible').order_by('-fecha_ingreso', '-id').first()
+
+    def test_lista_perros(self):
+        self.assertQueryBudget(reverse('adopciones:lista_perros'), 3)
+
+    def test_lista_perros_con_filtros(self):
+        self.assertQueryBudget(reverse('adopciones:lista_perros') + '?tamano=mediano&edad_min=1&edad_max=10', 3)
+
+    def test_lista_perros_segunda_pagina(self):
+        self.assertQueryBudget(reverse('adopciones:lista_perros') + '?page=2', 3)
+
+    def test_perros_siguientes(self):
+        self.assertQueryBudget(reverse('adopciones:perros_siguientes') + f'?cursor={cursor_perro(self.perro)}', 1)
+
+    def test_detalle_perro(self):
+        self.assertQueryBudget(reverse('adopciones:detalle_perro', args=[self.perro.id]), 2)
+
+    def test_solicitar_adopcion(self):
+        self.assertQueryBudget(reverse('adopciones:solicitar_adopcion', args=[self.perro.id]), 2)
+
+
+class CursorPerroTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # Tres fechas y varios perros por fecha: empates en fecha_ingreso que deshace el id
+        Perro.objects.bulk_create([
+            Perro(nombre=f'Perro {n}', edad=2, tamano='mediano', sexo='macho', color='negro', descripcion='-')
+            for n in range(PERROS_POR_LOTE * 3)
+        ])
+        for indice, perro in enumerate(Perro.objects.order_by('id')):
+            dias = indice % 3
+            Perro.objects.filter(id=perro.id).update(fecha_ingreso=datetime.date(2024, 5, 10) - datetime.timedelta(days=dias))
+
+    def test_ida_y_vuelta(self):
+        perro = Perro.objects.first()
+        self.assertEqual(parse_cursor(cursor_perro(perro)), (perro.fecha_ingreso, perro.id))
+
+    def test_cursor_invalido(self):
+        for cursor in (None, '', 'x', '2024-05-10', '2024-05-10_', '2024-05-10_abc', '2024-13-01_5',
+                       '2024-05-10_5_6', 'abc_5'):
+            with self.subTest(cursor=cursor):
+                self.assertIsNone(parse_cursor(cursor))
+
+    def test_vista_rechaza_cursor_manipulado(self):
+        url = reverse('adopciones:perros_siguientes')
+        for cursor in ('x', '2024-05-10_abc', '2024-05-10_1 OR 1=1'):
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.client.get(url, {'cursor': cursor}).status_code, 400)
 
-# Create your tests here.
+    def test_empates_sin_repetidos_ni_omitidos(self):
+        orden = list(Perro.objects.order_by('-fecha_ingreso', '-id').values_list('id', flat=True))
+        vistos = orden[:PERROS_POR_LOTE]
+        cursor = cursor_perro(Perro.objects.get(id=vistos[-1]))
+        while cursor:
+            response = self.client.get(reverse('adopciones:perros_siguientes'), {'cursor': cursor})
+            self.assertEqual(response.status_code, 200)
+            html = response.content.decode()
+            vistos += [int(perro_id) for perro_id in re.findall(r'/adopciones/perro/(\d+)/"', html)]
+            siguiente = re.search(r'data-cursor="([^"]+)"', html)
+            cursor = siguiente.group(1) if siguiente else ''
+        self.assertEqual(vistos, orden)
@@ -1,58 +1,91 @@
 from django.shortcuts import render, get_object_or_404, redirect
+from django.http import HttpResponse, HttpResponseBadRequest
+from django.template.loader import render_to_string
 from django.contrib import messages
 from django.core.paginator import Paginator
 from django.db.models import Q
+from datetime import date
 from .models import Perro, SolicitudAdopcion
 from .forms import SolicitudAdopcionForm, FiltroPerrosForm
 
+# Campos que usa la tarjeta de perro (partial_perro_card.html)
+CAMPOS_TARJETA = [
+    'id', 'nombre', 'imagen', 'sexo', 'descripcion', 'edad', 'tamano', 'color', 'peso',
+    'vacunado', 'esterilizado', 'bueno_con_niños', 'bueno_con_otros_perros', 'fecha_ingreso',
+]
+
+# Perros por lote en el scroll infinito
+PERROS_POR_LOTE = 12
+
+def filtrar_perros(perros, cleaned_data):
+    """Aplicar los filtros del FiltroPerrosForm a un queryset de perros"""
+    # Filtrar por tamaño
+    tamano = cleaned_data.get('tamano')
+    if tamano:
+        perros = perros.filter(tamano=tamano)
+    
+    # Filtrar por sexo
+    sexo = cleaned_data.get('sexo')
+    if sexo:
+        perros = perros.filter(sexo=sexo)
+    
+    # Filtrar por color
+    color = cleaned_data.get('color')
+    if color:
+        perros = perros.filter(color=color)
+    
+    # Filtrar por edad mínima
+    edad_min = cleaned_data.get('edad_min')
+    if edad_min is not None:
+        perros = perros.filter(edad__gte=edad_min)
+    
+    # Filtrar por edad máxima
+    edad_max = cleaned_data.get('edad_max')
+    if edad_max is not None:
+        perros = perros.filter(edad__lte=edad_max)
+    
+    return perros
+
+def cursor_perro(perro):
+    """Cursor keyset de un perro: fecha de ingreso e id (orden de la lista)"""
+    return f"{perro.fecha_ingreso.isoformat()}_{perro.id}"
+
+def parse_cursor(cursor):
+    """Devolver (fecha_ingreso, id) a partir del cursor, o None si no es válido"""
+    try:
+        fecha, perro_id = cursor.split('_')
+        return date.fromisoformat(fecha), int(perro_id)
+    except (AttributeError, ValueError):
+        return None
+
 def lista_perros(request):
     """Vista para mostrar la lista de perros disponibles"""
     # Inicializar el formulario con los datos GET
     form = FiltroPerrosForm(request.GET)
-    perros = Perro.objects.filter(estado='disponible')
+    perros = Perro.objects.filter(estado='disponible').order_by('-fecha_ingreso', '-id')
     
     
     # Aplicar filtros si hay datos en el formulario
     if form.is_bound and form.data:
         # Validar el formulario para obtener cleaned_data
         if form.is_valid():
-            
-            # Filtrar por tamaño
-            tamano = form.cleaned_data.get('tamano')
-            if tamano:
-                perros = perros.filter(tamano=tamano)
-            
-            # Filtrar por sexo
-            sexo = form.cleaned_data.get('sexo')
-            if sexo:
-                perros = perros.filter(sexo=sexo)
-            
-            # Filtrar por color
-            color = form.cleaned_data.get('color')
-            if color:
-                perros = perros.filter(color=color)
-            
-            # Filtrar por edad mínima
-            edad_min = form.cleaned_data.get('edad_min')
-            if edad_min is not None:
-                perros = perros.filter(edad__gte=edad_min)
-            
-            # Filtrar por edad máxima
-            edad_max = form.cleaned_data.get('edad_max')
-            if edad_max is not None:
-                perros = perros.filter(edad__lte=edad_max)
+            perros = filtrar_perros(perros, form.cleaned_data)
         else:
             messages.error(request, 'Por favor, corrija los errores en el formulario.')
     
     # Paginación
-    paginator = Paginator(perros, 12)
+    paginator = Paginator(perros, PERROS_POR_LOTE)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
     
+    # Cursor para continuar con scroll infinito desde el último perro de la página
+    next_cursor = cursor_perro(page_obj[-1]) if page_obj.has_next() else ''
+    
     context = {
         'perros': page_obj,
         'form': form,
-        'total_perros': perros.count(),
+        'total_perros': paginator.count,
+        'next_cursor': next_cursor,
     }
     
     # Si es una petición AJAX, devolver solo el contenido necesario
@@ -61,6 +94,41 @@ def lista_perros(request):
     
     return render(request, 'adopciones/lista_perros.html', context)
 
+def perros_siguientes(request):
+    """
+    Siguiente lote de tarjetas para el scroll infinito.
+    Usa un cursor keyset (sin OFFSET ni COUNT) y solo los campos de la tarjeta.
+    """
+    cursor = parse_cursor(request.GET.get('cursor'))
+    if cursor is None:
+        return HttpResponseBadRequest('Cursor inválido')
+    
+    form = FiltroPerrosForm(request.GET)
+    if not form.is_valid():
+        return HttpResponseBadRequest('Filtros inválidos')
+    
+    fecha, perro_id = cursor
+    perros = filtrar_perros(
+        Perro.objects.filter(estado='disponible').only(*CAMPOS_TARJETA),
+        form.cleaned_data
+    ).filter(
+        Q(fecha_ingreso__lt=fecha) | Q(fecha_ingreso=fecha, id__lt=perro_id)
+    ).order_by('-fecha_ingreso', '-id')
+    
+    # Un elemento extra indica si hay más lotes
+    lote = list(perros[:PERROS_POR_LOTE + 1])
+    hay_mas = len(lote) > PERROS_POR_LOTE
+    lote = lote[:PERROS_POR_LOTE]
+    
+    context = {
+        'perros': lote,
+        'next_cursor': cursor_perro(lote[-1]) if hay_mas else '',
+    }
+    
+    # Sin request: se omiten los context processors (y sus consultas)
+    html = render_to_string('adopciones/partial_perros_siguientes.html', context)
+    return HttpResponse(html)
+
 def detalle_perro(request, perro_id):
     """Vista para mostrar los detalles de un perro específico"""
     perro = get_object_or_404(Perro, id=perro_id)
@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.utils.html import format_html
 from django.utils.safestring import mark_safe
+from .exportar import ExportarMixin
 from .models import InformacionAlbergue, Voluntario, Testimonio
 
 @admin.register(InformacionAlbergue)
@@ -58,12 +59,13 @@ class InformacionAlbergueAdmin(admin.ModelAdmin):
     redes_sociales.short_description = "Redes sociales"
 
 @admin.register(Voluntario)
-class VoluntarioAdmin(admin.ModelAdmin):
+class VoluntarioAdmin(ExportarMixin, admin.ModelAdmin):
     list_display = ['voluntario_info', 'contacto', 'direccion', 'fecha_nacimiento', 'experiencia', 'disponibilidad', 'motivacion', 'estado_badges', 'fecha_solicitud']
     list_filter = ['aprobado', 'activo', 'fecha_solicitud']
     search_fields = ['nombre', 'apellidos', 'email', 'telefono']
     readonly_fields = ['fecha_solicitud']
-    actions = ['aprobar_voluntarios', 'desactivar_voluntarios', 'activar_voluntarios']
+    actions = ['aprobar_voluntarios', 'desactivar_voluntarios', 'activar_voluntarios', 'exportar_csv', 'exportar_xlsx']
+    exportacion = 'voluntarios'
     date_hierarchy = 'fecha_solicitud'
     list_per_page = 25
     
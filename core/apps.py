@@ -1,6 +1,17 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class CoreConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "core"
+
+    def ready(self):
+        from . import contention, metrics, slow_queries
+
+        # Consultas por petición para MetricsMiddleware
+        connection_created.connect(metrics.install_db_wrapper, dispatch_uid='core.metrics.install_db_wrapper')
+        # Registro de consultas lentas (/admin/consultas-lentas/)
+        connection_created.connect(slow_queries.slow_query_log.install, dispatch_uid='core.slow_queries.install')
+        # Esperas y reintentos por "database is locked" (el último: el más interno)
+        connection_created.connect(contention.monitor.install, dispatch_uid='core.contention.install')
@@ -0,0 +1,206 @@
+"""
+Circuit breaker con estado compartido entre procesos.
+
+El estado (cerrado / abierto / semiabierto, fallos consecutivos, transiciones) se
+guarda en un fichero SQLite pequeño e independiente de la base de datos del sitio,
+de modo que todos los workers de gunicorn ven el mismo circuito. Cada cambio se
+hace en una transacción `BEGIN IMMEDIATE`, así que contadores y sondeos son
+atómicos entre procesos; la consulta del estado es una lectura sin bloqueo.
+
+Desde código asíncrono se usan los métodos con prefijo `a` (aallow_request...):
+una transacción puede esperar al bloqueo del fichero hasta 5 s y no debe
+hacerlo en el event loop.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+
+logger = logging.getLogger(__name__)
+
+CERRADO = 'cerrado'
+ABIERTO = 'abierto'
+SEMIABIERTO = 'semiabierto'
+
+
+class CircuitBreaker:
+    """
+    - cerrado: las llamadas pasan; `failure_threshold` fallos seguidos lo abren.
+    - abierto: las llamadas se rechazan sin intentarlas durante `recovery_timeout` segundos.
+    - semiabierto: pasado ese tiempo se deja pasar una única llamada de sondeo;
+      si va bien el circuito se cierra y si falla vuelve a abrirse.
+    """
+
+    def __init__(self, name, path, failure_threshold=5, recovery_timeout=30.0):
+        self.name = name
+        self.path = str(path)
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self._local = threading.local()
+
+    def allow_request(self):
+        """True si la llamada puede hacerse; en semiabierto solo la primera que llegue (el sondeo)"""
+        state, _, opened_at, probe_at = self._read()
+        if state == CERRADO:
+            return True
+        now = time.time()
+        if now - opened_at < self.recovery_timeout:
+            return False
+        if state == SEMIABIERTO and now - probe_at < self.recovery_timeout:
+            return False  # ya hay un sondeo en curso (o murió hace poco)
+        with self._transaction() as db:
+            state, _, opened_at, probe_at = self._row(db)
+            if state == CERRADO:
+                return True
+            if now - opened_at < self.recovery_timeout or (
+                state == SEMIABIERTO and now - probe_at < self.recovery_timeout
+            ):
+                return False
+            db.execute('UPDATE circuit SET probe_at = ? WHERE name = ?', (now, self.name))
+            self._transition(db, state, SEMIABIERTO)
+            return True
+
+    def is_available(self):
+        """Como allow_request pero sin reservar el sondeo (para decidir antes de trabajar)"""
+        state, _, opened_at, probe_at = self._read()
+        if state == CERRADO:
+            return True
+        now = time.time()
+        if state == SEMIABIERTO:
+            return now - probe_at >= self.recovery_timeout
+        return now - opened_at >= self.recovery_timeout
+
+    def retry_after(self):
+        """Segundos hasta el próximo sondeo (0 si el circuito está cerrado)"""
+        state, _, opened_at, probe_at = self._read()
+        if state == CERRADO:
+            return 0
+        start = probe_at if state == SEMIABIERTO else opened_at
+        return max(0, int(start + self.recovery_timeout - time.time()) + 1)
+
+    def record_success(self):
+        state, failures, _, _ = self._read()
+        if state == CERRADO and not failures:
+            return
+        with self._transaction() as db:
+            state, _, _, _ = self._row(db)
+            db.execute('UPDATE circuit SET failures = 0 WHERE name = ?', (self.name,))
+            if state != CERRADO:
+                self._transition(db, state, CERRADO)
+
+    def record_failure(self):
+        with self._transaction() as db:
+            state, failures, _, _ = self._row(db)
+            failures += 1
+            db.execute('UPDATE circuit SET failures = ? WHERE name = ?', (failures, self.name))
+            if state == SEMIABIERTO or (state == CERRADO and failures >= self.failure_threshold):
+                db.execute('UPDATE circuit SET opened_at = ? WHERE name = ?', (time.time(), self.name))
+                self._transition(db, state, ABIERTO)
+
+    # Versiones asíncronas: la misma operación en un hilo del pool, fuera del event loop
+    # (thread_sensitive=False: no esperan a las consultas de Django del hilo principal)
+
+    async def aallow_request(self):
+        return await sync_to_async(self.allow_request, thread_sensitive=False)()
+
+    async def ais_available(self):
+        return await sync_to_async(self.is_available, thread_sensitive=False)()
+
+    async def aretry_after(self):
+        return await sync_to_async(self.retry_after, thread_sensitive=False)()
+
+    async def arecord_success(self):
+        await sync_to_async(self.record_success, thread_sensitive=False)()
+
+    async def arecord_failure(self):
+        await sync_to_async(self.record_failure, thread_sensitive=False)()
+
+    def snapshot(self):
+        """Estado actual y número de transiciones por estado de destino"""
+        state, failures, opened_at, _ = self._read()
+        db = self._connection()
+        transitions = dict(db.execute(
+            'SELECT to_state, count FROM circuit_transitions WHERE name = ?', (self.name,)
+        ).fetchall())
+        return {
+            'state': state,
+            'failures': failures,
+            'opened_at': opened_at or None,
+            'retry_after': self.retry_after(),
+            'transitions': transitions,
+        }
+
+    def reset(self):
+        with self._transaction() as db:
+            state, _, _, _ = self._row(db)
+            db.execute(
+                'UPDATE circuit SET failures = 0, opened_at = 0, probe_at = 0 WHERE name = ?', (self.name,)
+            )
+            if state != CERRADO:
+                self._transition(db, state, CERRADO)
+
+    def _transition(self, db, old, new):
+        db.execute('UPDATE circuit SET state = ? WHERE name = ?', (new, self.name))
+        db.execute(
+            'INSERT INTO circuit_transitions (name, to_state, count) VALUES (?, ?, 1) '
+            'ON CONFLICT (name, to_state) DO UPDATE SET count = count + 1',
+            (self.name, new),
+        )
+        log = logger.warning if new == ABIERTO else logger.info
+        log(f'Circuito {self.name}: {old} → {new}')
+
+    def _read(self):
+        return self._row(self._connection())
+
+    def _row(self, db):
+        row = db.execute(
+            'SELECT state, failures, opened_at, probe_at FROM circuit WHERE name = ?', (self.name,)
+        ).fetchone()
+        return row or (CERRADO, 0, 0.0, 0.0)
+
+    def _transaction(self):
+        return _ImmediateTransaction(self._connection(), self.name)
+
+    def _connection(self):
+        # Una conexión por hilo y proceso: sqlite3 no permite compartirlas entre hilos
+        # y una conexión heredada de un fork (workers de gunicorn) no es segura
+        db = getattr(self._local, 'db', None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            db.execute('PRAGMA journal_mode = WAL')
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS circuit ('
+                'name TEXT PRIMARY KEY, state TEXT NOT NULL, failures INTEGER NOT NULL, '
+                'opened_at REAL NOT NULL, probe_at REAL NOT NULL)'
+            )
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS circuit_transitions ('
+                'name TEXT NOT NULL, to_state TEXT NOT NULL, count INTEGER NOT NULL, '
+                'PRIMARY KEY (name, to_state))'
+            )
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
+
+
+class _ImmediateTransaction:
+    """BEGIN IMMEDIATE ... COMMIT, creando la fila del circuito si no existe"""
+
+    def __init__(self, db, name):
+        self.db = db
+        self.name = name
+
+    def __enter__(self):
+        self.db.execute('BEGIN IMMEDIATE')
+        self.db.execute(
+            'INSERT OR IGNORE INTO circuit (name, state, failures, opened_at, probe_at) VALUES (?, ?, 0, 0, 0)',
+            (self.name, CERRADO),
+        )
+        return self.db
+
+    def __exit__(self, exc_type, exc, tb):
+        self.db.execute('ROLLBACK' if exc_type else 'COMMIT')
+        return False
@@ -0,0 +1,155 @@
+"""
+Compresores incrementales (br, zstd, gzip) y estadísticas de compresión por vista
+"""
+import secrets
+import struct
+import threading
+import zlib
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - dependencia opcional
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - dependencia opcional
+    zstandard = None
+
+
+GZIP_FNAME = 0x08
+
+
+class GzipEncoder:
+    """
+    Con `max_random_bytes` la cabecera lleva un nombre de fichero de longitud aleatoria:
+    el relleno contra BREACH de compress_string/compress_sequence de Django
+    """
+
+    def __init__(self, level, max_random_bytes=0):
+        # Deflate sin cabecera (wbits negativo): la cabecera y el pie gzip se escriben aquí
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+        self._crc = 0
+        self._size = 0
+        flags, name = 0, b''
+        if max_random_bytes:
+            flags, name = GZIP_FNAME, b'a' * secrets.randbelow(max_random_bytes) + b'\0'
+        # ID1 ID2 CM FLG MTIME XFL OS (255: desconocido)
+        self._header = struct.pack('<BBBBIBB', 0x1f, 0x8b, zlib.DEFLATED, flags, 0, 0, 255) + name
+
+    def compress(self, data):
+        self._crc = zlib.crc32(data, self._crc)
+        self._size += len(data)
+        return self._take_header() + self._compressor.compress(data)
+
+    def flush(self):
+        return self._take_header() + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        trailer = struct.pack('<II', self._crc, self._size & 0xffffffff)
+        return self._take_header() + self._compressor.flush(zlib.Z_FINISH) + trailer
+
+    def _take_header(self):
+        header, self._header = self._header, b''
+        return header
+
+
+class BrotliEncoder:
+    def __init__(self, level):
+        self._compressor = brotli.Compressor(quality=level, mode=brotli.MODE_TEXT)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+class ZstdEncoder:
+    def __init__(self, level):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+
+# Codificaciones disponibles en orden de preferencia del servidor
+ENCODERS = {}
+if brotli is not None:
+    ENCODERS['br'] = BrotliEncoder
+if zstandard is not None:
+    ENCODERS['zstd'] = ZstdEncoder
+ENCODERS['gzip'] = GzipEncoder
+
+
+def parse_accept_encoding(header):
+    """Devolver {codificación: q} a partir de la cabecera Accept-Encoding"""
+    accepted = {}
+    for part in header.split(','):
+        name, _, params = part.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name] = q
+    return accepted
+
+
+def negotiate_encoding(header, available=None):
+    """Elegir la mejor codificación aceptada por el cliente, o None"""
+    accepted = parse_accept_encoding(header)
+    wildcard = accepted.get('*', 0.0)
+    best, best_q = None, 0.0
+    for name in (available or ENCODERS):
+        q = accepted.get(name, wildcard)
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+
+class CompressionStats:
+    """Acumulado por vista de bytes originales/comprimidos y tiempo de CPU"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = {}
+
+    def record(self, view_name, encoding, original, compressed, cpu_seconds):
+        key = (view_name or '<sin vista>', encoding)
+        with self._lock:
+            entry = self._data.setdefault(key, {'responses': 0, 'original': 0, 'compressed': 0, 'cpu': 0.0})
+            entry['responses'] += 1
+            entry['original'] += original
+            entry['compressed'] += compressed
+            entry['cpu'] += cpu_seconds
+
+    def snapshot(self):
+        """Copia de las estadísticas con el ratio calculado"""
+        with self._lock:
+            result = {}
+            for (view_name, encoding), entry in self._data.items():
+                ratio = entry['original'] / entry['compressed'] if entry['compressed'] else 0
+                result[(view_name, encoding)] = dict(entry, ratio=ratio)
+            return result
+
+    def reset(self):
+        with self._lock:
+            self._data.clear()
+
+
+stats = CompressionStats()
@@ -0,0 +1,139 @@
+"""
+Contención de escritura en SQLite ("database is locked").
+
+SQLite admite un único escritor: el resto espera dentro del driver hasta
+SQLITE_BUSY_TIMEOUT segundos y después falla con "database is locked". Además,
+una transacción que primero lee y luego escribe falla al momento si otro
+escritor confirmó entre medias, porque su instantánea ha quedado obsoleta: esperar no
+sirve, hay que repetir la transacción entera.
+
+- `ContentionMonitor.execute_wrapper` (en cada conexión, desde CoreConfig.ready)
+  cuenta las escrituras, las que esperaron al bloqueo (tardaron más de
+  SQLITE_LOCK_WAIT_MS) y los errores de bloqueo. Repite la sentencia solo si es
+  una transacción por sí misma (autocommit): dentro de `atomic` el error sube.
+- `atomic_with_retry` / `retry_transaction` repiten una transacción completa,
+  siempre desde fuera (la transacción más externa).
+
+Ambos esperan con backoff exponencial con jitter, como mucho SQLITE_LOCK_RETRIES
+veces y sin pasar de SQLITE_LOCK_RETRY_BUDGET segundos en total. Todo se
+registra por vista en metrics.shared (/metrics/ y `manage.py db_contention`).
+"""
+import functools
+import random
+import time
+
+from django.conf import settings
+from django.db import OperationalError, transaction
+
+from . import metrics
+
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE', 'REPLAC')
+
+
+def is_lock_error(error):
+    return isinstance(error, OperationalError) and (
+        'database is locked' in str(error) or 'database table is locked' in str(error)
+    )
+
+
+def backoff(attempt):
+    """50 ms × 2^(n-1) hasta 1 s, con jitter: la mitad fija y la otra mitad aleatoria"""
+    delay = min(1.0, 0.05 * 2 ** (attempt - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def _labels(**extra):
+    return metrics.format_labels(vista=metrics.current_view() or 'sin_peticion', **extra)
+
+
+class ContentionMonitor:
+    def __init__(self, wait_threshold_ms=10, retries=3, budget=10.0):
+        self.wait_threshold = wait_threshold_ms / 1000
+        self.retries = retries
+        self.budget = budget
+
+    def can_retry(self, attempt, start):
+        return attempt < self.retries and time.perf_counter() - start < self.budget
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        write = sql.lstrip()[:6].upper() in WRITE_STATEMENTS
+        first_start = time.perf_counter()
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                result = execute(sql, params, many, context)
+            except OperationalError as error:
+                if not is_lock_error(error):
+                    raise
+                self._record_wait(time.perf_counter() - start, error=True)
+                # Solo se repite lo que es una transacción completa: dentro de `atomic`
+                # lo ya hecho en la transacción se pierde y debe repetirla quien la abrió
+                if context['connection'].in_atomic_block:
+                    raise
+                if not self.can_retry(attempt, first_start):
+                    metrics.shared.inc('protectora_db_lock_failures_total', _labels(nivel='sentencia'))
+                    raise
+                attempt += 1
+                metrics.shared.inc('protectora_db_lock_retries_total', _labels(nivel='sentencia'))
+                time.sleep(backoff(attempt))
+                continue
+            if write:
+                metrics.shared.inc('protectora_db_writes_total', _labels())
+                duration = time.perf_counter() - start
+                if duration >= self.wait_threshold:
+                    self._record_wait(duration)
+            return result
+
+    def _record_wait(self, duration, error=False):
+        labels = _labels()
+        metrics.shared.inc('protectora_db_lock_waits_total', labels)
+        metrics.shared.observe('protectora_db_lock_wait_seconds', labels, duration)
+        if error:
+            metrics.shared.inc('protectora_db_lock_errors_total', labels)
+
+    def install(self, sender, connection, **kwargs):
+        """Receptor de connection_created (solo SQLite)"""
+        if connection.vendor == 'sqlite' and self.execute_wrapper not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self.execute_wrapper)
+
+
+monitor = ContentionMonitor(
+    wait_threshold_ms=getattr(settings, 'SQLITE_LOCK_WAIT_MS', 10),
+    retries=getattr(settings, 'SQLITE_LOCK_RETRIES', 3),
+    budget=getattr(settings, 'SQLITE_LOCK_RETRY_BUDGET', 10.0),
+)
+
+
+def retry_transaction(func, using=None):
+    """
+    Ejecutar func() en transaction.atomic y repetirla entera si SQLite devuelve
+    "database is locked". func no debe tener efectos fuera de la base de datos.
+    Dentro de otra transacción no se repite: solo la más externa puede hacerlo.
+    """
+    if transaction.get_connection(using).in_atomic_block:
+        with transaction.atomic(using=using):
+            return func()
+    start = time.perf_counter()
+    attempt = 0
+    while True:
+        try:
+            with transaction.atomic(using=using):
+                return func()
+        except OperationalError as error:
+            if not is_lock_error(error):
+                raise
+            if not monitor.can_retry(attempt, start):
+                metrics.shared.inc('protectora_db_lock_failures_total', _labels(nivel='transaccion'))
+                raise
+            attempt += 1
+            metrics.shared.inc('protectora_db_lock_retries_total', _labels(nivel='transaccion'))
+            time.sleep(backoff(attempt))
+
+
+def atomic_with_retry(func):
+    """Decorador: como transaction.atomic, repitiendo la transacción con retry_transaction"""
+    @functools.wraps(func)
+    def inner(*args, **kwargs):
+        return retry_transaction(lambda: func(*args, **kwargs))
+    return inner
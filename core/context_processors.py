@@ -1,6 +1,38 @@
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import staticfiles_storage
+
 from .models import InformacionAlbergue
 
+# Salida de `manage.py build_css`
+LOCAL_CSS = ('css/build/tailwind.min.css', 'vendor/fontawesome/css/icons.min.css')
+
 def info_albergue(request):
     return {
         'info_albergue': InformacionAlbergue.objects.first()
     }
+
+def assets(request):
+    """Indica a las plantillas si usar el CSS local generado o los CDN"""
+    return {
+        'use_local_css': use_local_css(),
+    }
+
+def use_local_css():
+    """
+    USE_LOCAL_CSS y el CSS de build_css publicado. Sin él se vuelve a los CDN:
+    con el manifiesto de WhiteNoise {% static %} fallaría en cada página.
+    """
+    return settings.USE_LOCAL_CSS and all(_published(path) for path in LOCAL_CSS)
+
+def _published(path):
+    if settings.DEBUG:
+        # En DEBUG {% static %} no consulta el manifiesto y runserver sirve desde STATICFILES_DIRS
+        return finders.find(path) is not None
+    if hasattr(staticfiles_storage, 'stored_name'):
+        try:
+            staticfiles_storage.stored_name(path)
+        except ValueError:
+            return False
+        return True
+    return staticfiles_storage.exists(path)
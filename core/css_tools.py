@@ -0,0 +1,208 @@
+"""
+Utilidades para analizar y depurar hojas de estilo sin dependencias externas
+"""
+import re
+from pathlib import Path
+
+# At-rules cuyo contenido son otras reglas (se procesan recursivamente)
+NESTED_AT_RULES = ('@media', '@supports', '@layer', '@container', '@document')
+
+# Tokens candidatos a clase CSS dentro de plantillas y JavaScript
+CLASS_TOKEN_RE = re.compile(r"[\w\-:/\[\]#.!]+")
+SELECTOR_CLASS_RE = re.compile(r"\.((?:\\[0-9a-fA-F]{1,6}\s?|\\.|[\w-])+)")
+HEX_ESCAPE_RE = re.compile(r"\\([0-9a-fA-F]{1,6})\s?")
+KEYFRAMES_NAME_RE = re.compile(r"@(?:-webkit-)?keyframes\s+([\w-]+)")
+
+
+class CssNode:
+    """Regla CSS: un selector (o at-rule) con su cuerpo o sus reglas hijas"""
+
+    def __init__(self, prelude, body='', children=None):
+        self.prelude = prelude.strip()
+        self.body = body.strip()
+        self.children = children
+
+    @property
+    def is_at_rule(self):
+        return self.prelude.startswith('@')
+
+    def render(self):
+        prelude = ' '.join(self.prelude.split())
+        if self.children is not None:
+            inner = ''.join(child.render() for child in self.children)
+            return f"{prelude}{{{inner}}}"
+        if not self.body and prelude.startswith('@') and not prelude.startswith('@font-face'):
+            # Sentencias sin bloque: @charset, @import...
+            return f"{prelude};"
+        body = ' '.join(self.body.split())
+        return f"{prelude}{{{body}}}"
+
+
+def _strip_comments(text):
+    return re.sub(r"/\*.*?\*/", '', text, flags=re.S)
+
+
+def parse_css(text):
+    """Convertir una hoja de estilos en una lista de CssNode"""
+    text = _strip_comments(text)
+    nodes, _ = _parse_block(text, 0)
+    return nodes
+
+
+def _parse_block(text, pos):
+    nodes = []
+    start = pos
+    quote = None
+    length = len(text)
+    while pos < length:
+        char = text[pos]
+        if quote:
+            if char == '\\':
+                pos += 2
+                continue
+            if char == quote:
+                quote = None
+        elif char in ('"', "'"):
+            quote = char
+        elif char == ';' and text[start:pos].strip().startswith('@'):
+            # At-rule sin bloque
+            nodes.append(CssNode(text[start:pos]))
+            start = pos + 1
+        elif char == '{':
+            prelude = text[start:pos]
+            if prelude.strip().lower().startswith(NESTED_AT_RULES):
+                children, pos = _parse_block(text, pos + 1)
+                nodes.append(CssNode(prelude, children=children))
+            else:
+                end = _find_block_end(text, pos + 1)
+                nodes.append(CssNode(prelude, body=text[pos + 1:end]))
+                pos = end
+            start = pos + 1
+        elif char == '}':
+            return nodes, pos
+        pos += 1
+    return nodes, pos
+
+
+def _find_block_end(text, pos):
+    depth = 1
+    quote = None
+    while pos < len(text):
+        char = text[pos]
+        if quote:
+            if char == '\\':
+                pos += 2
+                continue
+            if char == quote:
+                quote = None
+        elif char in ('"', "'"):
+            quote = char
+        elif char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth == 0:
+                return pos
+        pos += 1
+    return pos
+
+
+def render_css(nodes):
+    return ''.join(node.render() for node in nodes)
+
+
+def unescape_class(name):
+    """Convertir un nombre de clase escapado en CSS (hover\\:bg-x) a su forma HTML"""
+    name = HEX_ESCAPE_RE.sub(lambda m: chr(int(m.group(1), 16)), name)
+    return re.sub(r"\\(.)", r"\1", name)
+
+
+def selector_classes(selector):
+    return {unescape_class(match) for match in SELECTOR_CLASS_RE.findall(selector)}
+
+
+def split_selectors(prelude):
+    """Separar una lista de selectores respetando paréntesis y corchetes"""
+    parts, depth, current = [], 0, ''
+    for char in prelude:
+        if char in '([':
+            depth += 1
+        elif char in ')]':
+            depth -= 1
+        if char == ',' and depth == 0:
+            parts.append(current)
+            current = ''
+        else:
+            current += char
+    parts.append(current)
+    return [part.strip() for part in parts if part.strip()]
+
+
+def collect_used_classes(paths):
+    """Extraer todos los tokens que podrían ser clases desde plantillas y JS"""
+    used = set()
+    for path in paths:
+        text = Path(path).read_text(encoding='utf-8', errors='ignore')
+        for token in CLASS_TOKEN_RE.findall(text):
+            token = token.strip('.:')
+            if token:
+                used.add(token)
+                # "!important" de Tailwind se escribe como prefijo
+                used.add(token.lstrip('!'))
+    return used
+
+
+def purge_nodes(nodes, used_classes):
+    """Conservar solo las reglas cuyos selectores usan clases presentes"""
+    kept = []
+    for node in nodes:
+        if node.children is not None:
+            children = purge_nodes(node.children, used_classes)
+            if children:
+                kept.append(CssNode(node.prelude, children=children))
+        elif node.is_at_rule:
+            kept.append(node)
+        else:
+            selectors = [
+                selector for selector in split_selectors(node.prelude)
+                if selector_classes(selector) <= used_classes
+            ]
+            if selectors:
+                kept.append(CssNode(', '.join(selectors), body=node.body))
+    return kept
+
+
+def drop_unused_keyframes(nodes):
+    """Eliminar @keyframes que ninguna regla conservada referencia"""
+    css = render_css(node for node in _walk(nodes) if not _is_keyframes(node))
+    return _filter_keyframes(nodes, css)
+
+
+def _filter_keyframes(nodes, css):
+    result = []
+    for node in nodes:
+        if _is_keyframes(node):
+            name = KEYFRAMES_NAME_RE.match(node.prelude).group(1)
+            if not re.search(rf"\b{re.escape(name)}\b", css):
+                continue
+        elif node.children is not None:
+            node = CssNode(node.prelude, children=_filter_keyframes(node.children, css))
+        result.append(node)
+    return result
+
+
+def _is_keyframes(node):
+    return bool(KEYFRAMES_NAME_RE.match(node.prelude))
+
+
+def _walk(nodes):
+    for node in nodes:
+        yield node
+        if node.children is not None:
+            yield from _walk(node.children)
+
+
+def purge_css(text, used_classes):
+    """Depurar una hoja de estilos completa y devolverla minificada"""
+    nodes = purge_nodes(parse_css(text), used_classes)
+    return render_css(drop_unused_keyframes(nodes))
@@ -0,0 +1,340 @@
+"""
+Exportación en streaming (CSV y XLSX) de donaciones, solicitudes de adopción y voluntarios.
+
+Las filas se leen con `values_list(...).iterator(chunk_size=2000)`: las claves
+ajenas (`perro__nombre`, `tipo_donacion__nombre`) salen del mismo JOIN, sin un
+objeto por fila, y el fichero se genera por bloques a medida que se envía. La
+memoria no depende del número de filas y la cabecera sale antes de consultar.
+
+El XLSX se escribe a mano (un ZIP con el XML mínimo de una hoja) porque las
+librerías habituales necesitan el fichero entero o uno temporal antes de enviarlo.
+"""
+import csv
+import re
+import zipfile
+from datetime import date, datetime
+from decimal import Decimal
+from html import escape
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.db import models
+from django.utils import timezone
+
+from adopciones.models import SolicitudAdopcion
+from core.models import Voluntario
+from donaciones.models import Donacion
+
+CHUNK_SIZE = 2000
+TAMANO_BLOQUE = 64 * 1024  # bytes acumulados antes de entregar un bloque
+
+
+class Exportacion:
+    """Columnas (cabecera, campo de values_list) de un modelo"""
+
+    def __init__(self, nombre, modelo, columnas):
+        self.nombre = nombre
+        self.modelo = modelo
+        self.cabeceras = [cabecera for cabecera, _ in columnas]
+        self.campos = [campo for _, campo in columnas]
+        # Valores con choices se exportan con su etiqueta
+        self.etiquetas = {}
+        self.booleanos = []
+        self.fechas_hora = []
+        self.textos = []  # texto libre escrito por los usuarios
+        for i, campo in enumerate(self.campos):
+            field = self._field(campo)
+            if field.choices:
+                self.etiquetas[i] = dict(field.flatchoices)
+            elif isinstance(field, models.BooleanField):
+                self.booleanos.append(i)
+            elif isinstance(field, models.DateTimeField):
+                self.fechas_hora.append(i)
+            elif isinstance(field, (models.CharField, models.TextField)):
+                self.textos.append(i)
+
+    def _field(self, campo):
+        modelo = self.modelo
+        *relaciones, nombre = campo.split('__')
+        for relacion in relaciones:
+            modelo = modelo._meta.get_field(relacion).related_model
+        return modelo._meta.get_field(nombre)
+
+    def filas(self, queryset=None):
+        """Tuplas de valores ya listos para escribir, leídas por lotes"""
+        if queryset is None:
+            queryset = self.modelo.objects.all()
+        # Orden por clave primaria: recorre el índice sin ordenar la tabla antes de la primera fila
+        filas = queryset.order_by('-pk').values_list(*self.campos).iterator(chunk_size=CHUNK_SIZE)
+        if not self.etiquetas:
+            return filas
+        return (
+            tuple(self.etiquetas[i].get(v, v) if i in self.etiquetas else v for i, v in enumerate(fila))
+            for fila in filas
+        )
+
+
+EXPORTACIONES = {
+    'donaciones': Exportacion('donaciones', Donacion, [
+        ('ID', 'id'),
+        ('Fecha', 'fecha_donacion'),
+        ('Tipo de donación', 'tipo_donacion__nombre'),
+        ('Cantidad (CLP)', 'cantidad'),
+        ('Estado', 'estado'),
+        ('Nombre', 'nombre_donante'),
+        ('Email', 'email_donante'),
+        ('Teléfono', 'telefono_donante'),
+        ('Anónimo', 'anonimo'),
+        ('Mensaje', 'mensaje'),
+        ('Orden de compra', 'buy_order'),
+        ('Código de autorización', 'authorization_code'),
+        ('Fecha de transacción', 'transaction_date'),
+    ]),
+    'solicitudes': Exportacion('solicitudes', SolicitudAdopcion, [
+        ('ID', 'id'),
+        ('Fecha', 'fecha_solicitud'),
+        ('Perro', 'perro__nombre'),
+        ('Estado', 'estado'),
+        ('Solicitante', 'nombre_solicitante'),
+        ('Email', 'email'),
+        ('Teléfono', 'telefono'),
+        ('Dirección', 'direccion'),
+        ('Vivienda', 'vivienda_tipo'),
+        ('Patio', 'patio'),
+        ('Otros animales', 'otros_animales'),
+        ('Experiencia con mascotas', 'experiencia_mascotas'),
+        ('Motivo', 'motivo_adopcion'),
+        ('Notas', 'notas_admin'),
+    ]),
+    'voluntarios': Exportacion('voluntarios', Voluntario, [
+        ('ID', 'id'),
+        ('Fecha de solicitud', 'fecha_solicitud'),
+        ('Nombre', 'nombre'),
+        ('Apellidos', 'apellidos'),
+        ('Email', 'email'),
+        ('Teléfono', 'telefono'),
+        ('Dirección', 'direccion'),
+        ('Fecha de nacimiento', 'fecha_nacimiento'),
+        ('Disponibilidad', 'disponibilidad'),
+        ('Experiencia', 'experiencia'),
+        ('Motivación', 'motivacion'),
+        ('Aprobado', 'aprobado'),
+        ('Activo', 'activo'),
+    ]),
+}
+
+
+_SI_NO = {True: 'Sí', False: 'No', None: ''}
+
+# Un texto que empieza así Excel/LibreOffice lo evalúan como fórmula al abrir el CSV
+# (`=HYPERLINK(...)` en el mensaje de una donación): se antepone una comilla simple
+_INICIO_FORMULA = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _texto_seguro(valor):
+    if valor and valor.startswith(_INICIO_FORMULA):
+        return "'" + valor
+    return valor
+
+
+class _Buffer:
+    """Destino de csv.writer / zipfile que acumula lo escrito hasta que se recoge"""
+
+    def __init__(self):
+        self.partes = []
+        self.tamano = 0
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self.partes.append(bytes(data))
+        self.tamano += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def recoger(self):
+        data = b''.join(self.partes)
+        self.partes.clear()
+        self.tamano = 0
+        return data
+
+
+def generar_csv(exportacion, queryset=None):
+    buffer = _Buffer()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')  # BOM: Excel abre el UTF-8 con tildes correctamente
+    writer.writerow(exportacion.cabeceras)
+    yield buffer.recoger()
+    # Conversión solo de las columnas que la necesitan, decidida una vez por columna
+    zona = timezone.get_current_timezone()
+    booleanos, fechas_hora, textos = exportacion.booleanos, exportacion.fechas_hora, exportacion.textos
+    for fila in exportacion.filas(queryset):
+        fila = list(fila)
+        for i in booleanos:
+            fila[i] = _SI_NO[fila[i]]
+        for i in fechas_hora:
+            if fila[i] is not None:
+                fila[i] = fila[i].astimezone(zona).strftime('%Y-%m-%d %H:%M:%S')
+        for i in textos:
+            fila[i] = _texto_seguro(fila[i])
+        writer.writerow(fila)
+        if buffer.tamano >= TAMANO_BLOQUE:
+            yield buffer.recoger()
+    yield buffer.recoger()
+
+
+# --- XLSX ---
+
+_CARACTERES_INVALIDOS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+_EPOCA_EXCEL = datetime(1899, 12, 30)
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '</Types>'
+)
+_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{nombre}" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '<Relationship Id="rId2" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+    'Target="styles.xml"/>'
+    '</Relationships>'
+)
+# Estilos: 0 normal, 1 fecha y hora, 2 fecha, 3 cabecera en negrita
+_STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<numFmts count="2"><numFmt numFmtId="164" formatCode="dd/mm/yyyy hh:mm"/>'
+    '<numFmt numFmtId="165" formatCode="dd/mm/yyyy"/></numFmts>'
+    '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+    '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="4"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '<xf numFmtId="165" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/></cellXfs>'
+    '</styleSheet>'
+)
+_HOJA_INICIO = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<sheetViews><sheetView workbookViewId="0"><pane ySplit="1" topLeftCell="A2" activePane="bottomLeft" '
+    'state="frozen"/></sheetView></sheetViews><sheetData>'
+)
+_HOJA_FIN = '</sheetData></worksheet>'
+
+
+def _celda(valor, zona=None, estilo_texto=''):
+    if valor is None:
+        return '<c/>'
+    if isinstance(valor, bool):
+        valor = 'Sí' if valor else 'No'
+    elif isinstance(valor, datetime):
+        local = valor.astimezone(zona).replace(tzinfo=None) if valor.tzinfo is not None else valor
+        return f'<c s="1"><v>{(local - _EPOCA_EXCEL).total_seconds() / 86400:.6f}</v></c>'
+    elif isinstance(valor, date):
+        return f'<c s="2"><v>{(valor - _EPOCA_EXCEL.date()).days}</v></c>'
+    elif isinstance(valor, (int, float, Decimal)):
+        return f'<c><v>{valor}</v></c>'
+    texto = escape(_CARACTERES_INVALIDOS.sub('', str(valor)), quote=False)
+    return f'<c t="inlineStr"{estilo_texto}><is><t xml:space="preserve">{texto}</t></is></c>'
+
+
+def generar_xlsx(exportacion, queryset=None):
+    buffer = _Buffer()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as xlsx:
+        xlsx.writestr('[Content_Types].xml', _CONTENT_TYPES)
+        xlsx.writestr('_rels/.rels', _RELS)
+        xlsx.writestr('xl/workbook.xml', _WORKBOOK.format(nombre=escape(exportacion.nombre.capitalize(), quote=False)))
+        xlsx.writestr('xl/_rels/workbook.xml.rels', _WORKBOOK_RELS)
+        xlsx.writestr('xl/styles.xml', _STYLES)
+        with xlsx.open('xl/worksheets/sheet1.xml', 'w') as hoja:
+            hoja.write(_HOJA_INICIO.encode())
+            hoja.write(
+                ('<row>' + ''.join(_celda(c, estilo_texto=' s="3"') for c in exportacion.cabeceras) + '</row>').encode()
+            )
+            yield buffer.recoger()
+            zona = timezone.get_current_timezone()
+            for fila in exportacion.filas(queryset):
+                hoja.write(('<row>' + ''.join([_celda(valor, zona) for valor in fila]) + '</row>').encode())
+                if buffer.tamano >= TAMANO_BLOQUE:
+                    yield buffer.recoger()
+            hoja.write(_HOJA_FIN.encode())
+    yield buffer.recoger()
+
+
+FORMATOS = {
+    'csv': (generar_csv, 'text/csv; charset=utf-8'),
+    'xlsx': (generar_xlsx, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+}
+
+
+async def _iterar_async(bloques):
+    """
+    Bajo ASGI, Django 4.2 convierte un iterador síncrono en lista antes de enviarlo:
+    se entrega uno asíncrono que pide cada bloque en el hilo de la petición.
+    """
+    siguiente = sync_to_async(next)
+    while True:
+        bloque = await siguiente(bloques, None)
+        if bloque is None:
+            return
+        yield bloque
+
+
+def respuesta_exportacion(request, nombre, formato, queryset=None):
+    generar, content_type = FORMATOS[formato]
+    bloques = generar(EXPORTACIONES[nombre], queryset)
+    if isinstance(request, ASGIRequest):
+        bloques = _iterar_async(bloques)
+    response = StreamingHttpResponse(bloques, content_type=content_type)
+    fecha = timezone.localdate().isoformat()
+    response['Content-Disposition'] = f'attachment; filename="{nombre}-{fecha}.{formato}"'
+    return response
+
+
+class ExportarMixin:
+    """Acciones de admin para exportar los registros seleccionados (añadir a `actions`)"""
+
+    exportacion = None  # clave de EXPORTACIONES
+
+    def exportar_csv(self, request, queryset):
+        return respuesta_exportacion(request, self.exportacion, 'csv', queryset)
+    exportar_csv.short_description = "⬇️ Exportar seleccionados a CSV"
+
+    def exportar_xlsx(self, request, queryset):
+        return respuesta_exportacion(request, self.exportacion, 'xlsx', queryset)
+    exportar_xlsx.short_description = "⬇️ Exportar seleccionados a XLSX"
@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand, CommandError
+import statistics
+
+# Páginas medidas por defecto (rutas relativas al servidor local)
+DEFAULT_PATHS = ['/', '/adopciones/', '/donaciones/donar/']
+
+# Marca de tiempo del primer renderizado según la Paint Timing API
+PAINT_SCRIPT = """
+() => new Promise(resolve => {
+    const read = () => {
+        const entry = performance.getEntriesByName('first-contentful-paint')[0];
+        const nav = performance.getEntriesByType('navigation')[0];
+        if (!entry) { return setTimeout(read, 50); }
+        resolve({fcp: entry.startTime, bytes: nav ? nav.transferSize : 0});
+    };
+    read();
+})
+"""
+
+
+class Command(BaseCommand):
+    help = 'Mide el First Contentful Paint de las páginas principales con un navegador headless'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000', help='Servidor en ejecución a medir')
+        parser.add_argument('--runs', type=int, default=5, help='Repeticiones por página')
+        parser.add_argument('paths', nargs='*', help='Rutas a medir (por defecto las páginas principales)')
+
+    def handle(self, *args, **options):
+        try:
+            from playwright.sync_api import sync_playwright
+        except ImportError:
+            raise CommandError(
+                'Se necesita playwright: pip install playwright && playwright install chromium'
+            )
+
+        paths = options['paths'] or DEFAULT_PATHS
+        base_url = options['base_url'].rstrip('/')
+
+        with sync_playwright() as p:
+            browser = p.chromium.launch(headless=True)
+            for path in paths:
+                samples = []
+                for _ in range(options['runs']):
+                    # Contexto nuevo en cada repetición: sin caché ni cookies
+                    context = browser.new_context()
+                    page = context.new_page()
+                    page.goto(base_url + path, wait_until='load')
+                    samples.append(page.evaluate(PAINT_SCRIPT))
+                    context.close()
+
+                fcp = [s['fcp'] for s in samples]
+                self.stdout.write(
+                    f'{path:<25} FCP mediana {statistics.median(fcp):7.1f} ms | '
+                    f'mín {min(fcp):7.1f} ms | HTML {samples[0]["bytes"]:,} bytes'
+                )
+            browser.close()
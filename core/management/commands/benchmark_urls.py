@@ -0,0 +1,209 @@
+import json
+import logging
+import platform
+import statistics
+import subprocess
+import time
+
+import django
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, get_resolver, reverse
+from django.utils import timezone
+from django.utils.http import urlencode
+
+from adopciones.models import Perro, SolicitudAdopcion
+from adopciones.views import cursor_perro
+from core.models import Testimonio, Voluntario
+from donaciones.models import Aviso, Donacion
+
+# Vistas que llaman a Transbank: no se miden
+EXCLUIDAS = {'donaciones:webpay_resultado', 'donaciones:test_webpay'}
+# Vistas fuera del admin que solo responden a staff
+SOLO_STAFF = {'core:metrics', 'donaciones:webpay_metricas'}
+
+# Valor de los parámetros de las URL: el registro más reciente
+PARAMETROS = {
+    'perro_id': lambda: Perro.objects.filter(estado='disponible').order_by('-id').values_list('id', flat=True).first(),
+    'donacion_id': lambda: Donacion.objects.order_by('-id').values_list('id', flat=True).first(),
+}
+# Parámetros GET obligatorios: el lote que sigue al primer perro del catálogo
+CONSULTAS = {
+    'adopciones:perros_siguientes': lambda: {
+        'cursor': cursor_perro(perro)
+        for perro in Perro.objects.filter(estado='disponible').order_by('-fecha_ingreso', '-id')[:1]
+    },
+}
+
+# Tamaño de los datos, para comparar solo ejecuciones sobre datos equivalentes
+MODELOS = {
+    'perros': Perro,
+    'solicitudes': SolicitudAdopcion,
+    'donaciones': Donacion,
+    'voluntarios': Voluntario,
+    'avisos': Aviso,
+    'testimonios': Testimonio,
+}
+
+
+def percentil(valores, fraccion):
+    if len(valores) == 1:
+        return valores[0]
+    return statistics.quantiles(valores, n=100, method='inclusive')[round(fraccion * 100) - 1]
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide p50/p95 de latencia y número de consultas de cada URL del sitio y de cada listado '
+        'del admin con el cliente de pruebas de Django (en el proceso, sin servidor) y guarda un '
+        'JSON para comparar ejecuciones (--comparar). Datos: `manage.py seed_synthetic`'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticiones', type=int, default=20, help='Peticiones medidas por URL (tras una de calentamiento)')
+        parser.add_argument('--usuario', help='Superusuario para el admin (por defecto, el primero)')
+        parser.add_argument('--solo', action='append', default=[], help='Medir solo las URL que contengan este texto (repetible)')
+        parser.add_argument('--salida', help='Fichero JSON de resultados')
+        parser.add_argument('--comparar', help='JSON de una ejecución anterior con el que comparar')
+
+    def handle(self, *args, **options):
+        if options['repeticiones'] < 1:
+            raise CommandError('--repeticiones debe ser al menos 1')
+        anterior = None
+        if options['comparar']:
+            with open(options['comparar'], encoding='utf-8') as f:
+                anterior = {r['url']: r for r in json.load(f)['resultados']}
+
+        usuarios = get_user_model().objects.filter(is_superuser=True, is_active=True)
+        if options['usuario']:
+            usuarios = usuarios.filter(username=options['usuario'])
+        usuario = usuarios.order_by('id').first()
+        if usuario is None:
+            raise CommandError('Hace falta un superusuario activo para medir el admin (createsuperuser)')
+
+        host = next((h for h in settings.ALLOWED_HOSTS if h != '*' and not h.startswith('.')), 'localhost')
+        # Los errores de las vistas se registran como estado 500 en vez de interrumpir la medición
+        anonimo = Client(HTTP_HOST=host, raise_request_exception=False)
+        staff = Client(HTTP_HOST=host, raise_request_exception=False)
+        staff.force_login(usuario)
+        prefijo_admin = reverse('admin:index')
+
+        urls = [url for url in self.urls() if not options['solo'] or any(t in url[1] for t in options['solo'])]
+        resultados = []
+        # Sin el aviso de django.request en cada 4xx/5xx repetido
+        logger = logging.getLogger('django.request')
+        nivel = logger.level
+        logger.setLevel(logging.CRITICAL)
+        try:
+            for nombre, url in urls:
+                cliente = staff if url.startswith(prefijo_admin) or nombre in SOLO_STAFF else anonimo
+                resultado = self.medir(cliente, nombre, url, options['repeticiones'])
+                resultados.append(resultado)
+                self.escribir(resultado, anterior.get(url) if anterior else None)
+        finally:
+            logger.setLevel(nivel)
+
+        informe = {
+            'fecha': timezone.now().isoformat(),
+            'commit': self.commit(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'base_de_datos': connection.vendor,
+            'repeticiones': options['repeticiones'],
+            'datos': {clave: modelo.objects.count() for clave, modelo in MODELOS.items()},
+            'resultados': resultados,
+        }
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8') as f:
+                json.dump(informe, f, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'✅ Resultados en {options["salida"]}'))
+
+    def urls(self):
+        """(nombre, ruta) de las URL con nombre del sitio y de los listados del admin"""
+        urls = []
+        for nombre, patron in self.patrones(get_resolver().url_patterns):
+            if nombre in EXCLUIDAS:
+                continue
+            kwargs = {}
+            for parametro in patron.pattern.converters:
+                valor = PARAMETROS[parametro]() if parametro in PARAMETROS else None
+                if valor is None:
+                    break
+                kwargs[parametro] = valor
+            else:
+                url = reverse(nombre, kwargs=kwargs)
+                if nombre in CONSULTAS:
+                    url += '?' + urlencode(CONSULTAS[nombre]())
+                urls.append((nombre, url))
+        for modelo in admin.site._registry:
+            nombre = f'admin:{modelo._meta.app_label}_{modelo._meta.model_name}_changelist'
+            urls.append((nombre, reverse(nombre)))
+        return urls
+
+    def patrones(self, patrones, namespace=''):
+        for patron in patrones:
+            if isinstance(patron, URLResolver):
+                # El admin se mide por sus listados; el resto de sus URL necesita objetos o son acciones
+                if patron.namespace == 'admin':
+                    continue
+                ns = f'{namespace}{patron.namespace}:' if patron.namespace else namespace
+                yield from self.patrones(patron.url_patterns, ns)
+            elif isinstance(patron, URLPattern) and patron.name:
+                yield f'{namespace}{patron.name}', patron
+
+    def medir(self, cliente, nombre, url, repeticiones):
+        cliente.get(url)  # calentamiento: plantillas compiladas, cachés, conexión
+        tiempos, consultas = [], []
+        for _ in range(repeticiones):
+            with CaptureQueriesContext(connection) as capturadas:
+                inicio = time.perf_counter()
+                response = cliente.get(url)
+                tamano = (
+                    sum(len(bloque) for bloque in response.streaming_content)
+                    if response.streaming else len(response.content)
+                )
+                tiempos.append((time.perf_counter() - inicio) * 1000)
+            consultas.append(len(capturadas))
+        return {
+            'nombre': nombre,
+            'url': url,
+            'estado': response.status_code,
+            'bytes': tamano,
+            'p50_ms': round(statistics.median(tiempos), 2),
+            'p95_ms': round(percentil(tiempos, 0.95), 2),
+            'max_ms': round(max(tiempos), 2),
+            'consultas': consultas[-1],
+            'consultas_max': max(consultas),
+        }
+
+    def escribir(self, resultado, anterior):
+        linea = (
+            f'{resultado["url"][:50]:<50} {resultado["estado"]:>3} p50 {resultado["p50_ms"]:8.1f} ms '
+            f'p95 {resultado["p95_ms"]:8.1f} ms  {resultado["consultas"]:>4} consultas'
+        )
+        if anterior is None:
+            self.stdout.write(linea)
+            return
+        cambio = (resultado['p50_ms'] - anterior['p50_ms']) / anterior['p50_ms'] * 100 if anterior['p50_ms'] else 0
+        delta_consultas = resultado['consultas'] - anterior['consultas']
+        linea += f'  | p50 {cambio:+6.1f}%  consultas {delta_consultas:+d}'
+        if cambio > 20 or delta_consultas > 0:
+            self.stdout.write(self.style.WARNING(linea))
+        elif cambio < -20 or delta_consultas < 0:
+            self.stdout.write(self.style.SUCCESS(linea))
+        else:
+            self.stdout.write(linea)
+
+    def commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                capture_output=True, text=True, timeout=5,
+            ).stdout.strip() or None
+        except (OSError, subprocess.SubprocessError):
+            return None
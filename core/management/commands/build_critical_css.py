@@ -0,0 +1,70 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from pathlib import Path
+import re
+
+from core.css_tools import CLASS_TOKEN_RE, purge_css
+
+# Plantillas principales: nombre de página → plantilla
+PAGES = {
+    'home': 'home.html',
+    'lista_perros': 'adopciones/lista_perros.html',
+    'detalle_perro': 'adopciones/detalle_perro.html',
+    'donar': 'donaciones/donar.html',
+}
+
+# Hojas de estilo de las que se extrae el CSS crítico
+STYLESHEETS = ['css/style.css', 'css/build/tailwind.min.css']
+
+OUTPUT_DIR = 'css/critical'
+
+
+class Command(BaseCommand):
+    help = 'Extrae el CSS "above the fold" de las plantillas principales para incrustarlo en el HTML'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lines',
+            type=int,
+            default=80,
+            help='Líneas del bloque content consideradas visibles sin hacer scroll (por defecto 80)',
+        )
+
+    def handle(self, *args, **options):
+        static_dir = Path(settings.STATICFILES_DIRS[0])
+        templates_dir = Path(settings.TEMPLATES[0]['DIRS'][0])
+
+        stylesheets = [static_dir / name for name in STYLESHEETS if (static_dir / name).exists()]
+        if not stylesheets:
+            self.stdout.write(self.style.ERROR('No se encontró ninguna hoja de estilos de origen'))
+            return
+
+        css = '\n'.join(path.read_text(encoding='utf-8') for path in stylesheets)
+
+        # La navegación de base.html siempre está visible
+        base = (templates_dir / 'base.html').read_text(encoding='utf-8')
+        base_fold = base[:base.find('<main')]
+
+        output_dir = static_dir / OUTPUT_DIR
+        output_dir.mkdir(parents=True, exist_ok=True)
+
+        for page, template in PAGES.items():
+            source = (templates_dir / template).read_text(encoding='utf-8')
+            fold = base_fold + self._above_the_fold(source, options['lines'])
+            used_classes = {token.strip('.:') for token in CLASS_TOKEN_RE.findall(fold)}
+
+            critical = purge_css(css, used_classes)
+            (output_dir / f'{page}.css').write_text(critical, encoding='utf-8')
+
+            self.stdout.write(f'  ✓ {page}: {len(critical.encode()):,} bytes ({template})')
+
+        self.stdout.write(
+            self.style.SUCCESS(f'✅ CSS crítico generado en static/{OUTPUT_DIR}/')
+        )
+
+    def _above_the_fold(self, source, lines):
+        """Devolver los estilos propios y las primeras líneas del bloque content"""
+        extra_css = re.search(r'{% block extra_css %}(.*?){% endblock %}', source, re.S)
+        content = source.split('{% block content %}', 1)[-1]
+        fold = '\n'.join(content.splitlines()[:lines])
+        return (extra_css.group(1) if extra_css else '') + fold
@@ -0,0 +1,68 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from pathlib import Path
+import gzip
+import hashlib
+
+from core.css_tools import collect_used_classes, purge_css
+
+# Hojas de estilo completas guardadas en el repositorio (sin CDN) y su versión depurada.
+# La salida de iconos se escribe junto a la fuente para que las rutas ../webfonts/ sigan válidas.
+# La de Tailwind se genera desde tailwind/input.css (con la paleta de tailwind/tailwind.config.js).
+BUNDLES = [
+    ('Tailwind', 'vendor/tailwind/tailwind.css', 'css/build/tailwind.min.css'),
+    ('Font Awesome', 'vendor/fontawesome/css/all.css', 'vendor/fontawesome/css/icons.min.css'),
+]
+
+
+class Command(BaseCommand):
+    help = 'Genera CSS mínimo (Tailwind + iconos) a partir de las clases usadas en plantillas y JS'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Mostrar el informe de tamaños sin escribir archivos',
+        )
+
+    def handle(self, *args, **options):
+        static_dir = Path(settings.STATICFILES_DIRS[0])
+        templates_dir = Path(settings.TEMPLATES[0]['DIRS'][0])
+
+        sources = sorted(templates_dir.glob('**/*.html')) + sorted(static_dir.glob('js/*.js'))
+        used_classes = collect_used_classes(sources)
+        self.stdout.write(f'Analizados {len(sources)} archivos, {len(used_classes)} tokens candidatos')
+
+        # Antes de escribir nada: un paquete a medias dejaría páginas sin estilos o sin iconos
+        for label, source, _ in BUNDLES:
+            if not (static_dir / source).exists():
+                raise CommandError(
+                    f'{label}: fuente no encontrada en {static_dir / source} (ver docs/FRONTEND_ASSETS.md)'
+                )
+
+        for label, source, output in BUNDLES:
+            source_path = static_dir / source
+            output_path = static_dir / output
+
+            original = source_path.read_text(encoding='utf-8')
+            purged = purge_css(original, used_classes)
+
+            if not options['dry_run']:
+                output_path.parent.mkdir(parents=True, exist_ok=True)
+                output_path.write_text(purged, encoding='utf-8')
+
+            digest = hashlib.md5(purged.encode()).hexdigest()[:12]
+            self.stdout.write(f'{label}: {source} → {output} ({digest})')
+            self._report('antes', original)
+            self._report('después', purged)
+
+        if not options['dry_run']:
+            self.stdout.write(
+                self.style.SUCCESS('✅ CSS generado. Ejecuta collectstatic para publicar las versiones con hash')
+            )
+
+    def _report(self, label, text):
+        raw = text.encode('utf-8')
+        self.stdout.write(
+            f'  {label:>8}: {len(raw):>9,} bytes | gzip {len(gzip.compress(raw, 9)):>8,} bytes'
+        )
@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand
+
+from core import metrics
+
+
+class Command(BaseCommand):
+    help = (
+        'Contención de escritura en SQLite por vista (suma de todos los workers desde que '
+        'existe el fichero de métricas): escrituras, esperas al bloqueo, tiempo bloqueado, '
+        'errores "database is locked", reintentos y errores que llegaron a la vista'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Poner a cero todas las métricas después de mostrarlas')
+
+    def handle(self, *args, **options):
+        samples = metrics.shared.samples()
+        vistas = {}
+
+        def fila(labels):
+            vista = metrics.parse_labels(labels).get('vista', '')
+            return vistas.setdefault(vista, {
+                'escrituras': 0, 'esperas': 0, 'bloqueado': 0.0, 'errores': 0,
+                'reintentos': 0, 'fallos': 0,
+            })
+
+        for nombre, clave in (
+            ('protectora_db_writes_total', 'escrituras'),
+            ('protectora_db_lock_waits_total', 'esperas'),
+            ('protectora_db_lock_errors_total', 'errores'),
+            ('protectora_db_lock_retries_total', 'reintentos'),
+            ('protectora_db_lock_failures_total', 'fallos'),
+        ):
+            for labels, valores in samples.get(nombre, {}).items():
+                fila(labels)[clave] += int(valores.get('', 0))
+        for labels, valores in samples.get('protectora_db_lock_wait_seconds', {}).items():
+            fila(labels)['bloqueado'] += valores.get('sum', 0)
+
+        if not vistas:
+            self.stdout.write('Sin escrituras registradas todavía')
+        else:
+            self.stdout.write(
+                f'{"Vista":<45} {"Escrit.":>8} {"Esperas":>8} {"%":>6} {"Bloq. (s)":>10} '
+                f'{"Media (ms)":>10} {"Errores":>8} {"Reint.":>7} {"Fallos":>7}'
+            )
+            for vista, datos in sorted(vistas.items(), key=lambda item: -item[1]['bloqueado']):
+                porcentaje = datos['esperas'] / datos['escrituras'] * 100 if datos['escrituras'] else 0
+                media = datos['bloqueado'] / datos['esperas'] * 1000 if datos['esperas'] else 0
+                estilo = self.style.ERROR if datos['fallos'] else (
+                    self.style.WARNING if porcentaje >= 5 else str
+                )
+                self.stdout.write(estilo(
+                    f'{vista[:45]:<45} {datos["escrituras"]:>8} {datos["esperas"]:>8} {porcentaje:>5.1f}% '
+                    f'{datos["bloqueado"]:>10.2f} {media:>10.1f} {datos["errores"]:>8} '
+                    f'{datos["reintentos"]:>7} {datos["fallos"]:>7}'
+                ))
+
+        if options['reset']:
+            metrics.shared.reset()
+            self.stdout.write(self.style.SUCCESS('✅ Métricas puestas a cero'))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+import sys
+import time
+
+from core.exportar import EXPORTACIONES, FORMATOS
+
+
+class Command(BaseCommand):
+    help = 'Exporta donaciones, solicitudes de adopción o voluntarios a CSV o XLSX sin cargarlos en memoria'
+
+    def add_arguments(self, parser):
+        parser.add_argument('modelo', choices=sorted(EXPORTACIONES))
+        parser.add_argument('--format', choices=sorted(FORMATOS), default='csv')
+        parser.add_argument('--output', '-o', default='-', help='Fichero de salida ("-" = salida estándar)')
+
+    def handle(self, *args, **options):
+        generar, _ = FORMATOS[options['format']]
+        bloques = generar(EXPORTACIONES[options['modelo']])
+        inicio = time.monotonic()
+        escritos = 0
+
+        if options['output'] == '-':
+            salida = sys.stdout.buffer
+            for bloque in bloques:
+                salida.write(bloque)
+            salida.flush()
+            return
+
+        with open(options['output'], 'wb') as salida:
+            for bloque in bloques:
+                salida.write(bloque)
+                escritos += len(bloque)
+        self.stderr.write(self.style.SUCCESS(
+            f'✅ {options["output"]}: {escritos / 1024:.0f} KiB en {time.monotonic() - inicio:.1f} s'
+        ))
@@ -0,0 +1,450 @@
+import asyncio
+import ipaddress
+import json
+import random
+import re
+import socket
+import statistics
+import time
+from collections import Counter, defaultdict
+from urllib.parse import urljoin, urlsplit
+
+import httpx
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import urlencode
+
+from adopciones.models import Perro, SolicitudAdopcion
+from donaciones.webpay_standin import WebPayStandInServer
+
+from .benchmark_urls import percentil
+
+CSRF_INPUT_RE = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+TIPO_DONACION_RE = re.compile(r'<select name="tipo_donacion".*?</select>', re.S)
+OPCION_RE = re.compile(r'<option value="(\d+)"')
+
+ESCENARIOS = ('navegar', 'adoptar', 'donar')
+# Pasos de los escenarios, en el orden del informe
+PASOS = (
+    'inicio', 'catalogo', 'detalle', 'formulario_adopcion', 'solicitud',
+    'formulario_donacion', 'donacion', 'pasarela', 'resultado', 'gracias',
+)
+PESOS = {'navegar': 8, 'adoptar': 1, 'donar': 1}
+
+
+class Fallo(Exception):
+    """Paso de un escenario que no respondió lo esperado: termina el escenario"""
+
+    def __init__(self, paso, causa):
+        super().__init__(f'{paso}: {causa}')
+        self.paso = paso
+        self.causa = causa
+
+
+def peso(valor):
+    nombre, _, numero = valor.partition('=')
+    if nombre not in ESCENARIOS or not numero:
+        raise ValueError(valor)
+    numero = float(numero)
+    if numero < 0:
+        raise ValueError(valor)
+    return nombre, numero
+
+
+def es_local(url):
+    """El host de la URL resuelve solo a direcciones de loopback o privadas"""
+    host = urlsplit(url).hostname
+    if not host:
+        return False
+    try:
+        direcciones = {info[4][0] for info in socket.getaddrinfo(host, None)}
+    except OSError:
+        return False
+    return all(
+        ipaddress.ip_address(d.split('%')[0]).is_loopback or ipaddress.ip_address(d.split('%')[0]).is_private
+        for d in direcciones
+    )
+
+
+class Resultados:
+    def __init__(self, inicio_medida):
+        self.inicio_medida = inicio_medida
+        self.peticiones = Counter()
+        self.tiempos = defaultdict(list)
+        self.errores = Counter()
+        self.escenarios = Counter()
+        self.fallos = Counter()
+        self.descartadas = 0
+
+    def midiendo(self):
+        return time.perf_counter() >= self.inicio_medida
+
+    def registrar(self, paso, segundos=None, error=None):
+        """Una petición: su latencia si hubo respuesta, la causa si no fue la esperada"""
+        if not self.midiendo():
+            return
+        self.peticiones[paso] += 1
+        if segundos is not None:
+            self.tiempos[paso].append(segundos)
+        if error is not None:
+            self.errores[(paso, error)] += 1
+
+
+class Sesion:
+    """Un visitante: cookies propias (sesión, CSRF) sobre las conexiones compartidas"""
+
+    def __init__(self, comando, rng):
+        self.comando = comando
+        self.rng = rng
+        self.cliente = httpx.AsyncClient(
+            base_url=comando.url, transport=comando.transporte, timeout=comando.timeout,
+        )
+
+    async def pedir(self, paso, metodo, url, esperado=(200,), **kwargs):
+        inicio = time.perf_counter()
+        try:
+            response = await self.cliente.request(metodo, url, **kwargs)
+        except httpx.HTTPError as e:
+            self.comando.resultados.registrar(paso, error=type(e).__name__)
+            raise Fallo(paso, type(e).__name__)
+        error = None if response.status_code in esperado else f'HTTP {response.status_code}'
+        self.comando.resultados.registrar(paso, time.perf_counter() - inicio, error)
+        if error:
+            raise Fallo(paso, error)
+        return response
+
+    async def pensar(self):
+        if self.comando.pausa:
+            await asyncio.sleep(self.rng.expovariate(1 / self.comando.pausa))
+
+    def filtros(self):
+        """Cada filtro del catálogo con probabilidad 1/2"""
+        filtros = {}
+        for campo, opciones in (
+            ('tamano', Perro.TAMANO_CHOICES), ('sexo', Perro.SEXO_CHOICES), ('color', Perro.COLOR_CHOICES),
+        ):
+            if self.rng.random() < 0.5:
+                filtros[campo] = self.rng.choice(opciones)[0]
+        if self.rng.random() < 0.5:
+            edad_min = self.rng.randint(0, 8)
+            filtros.update(edad_min=edad_min, edad_max=edad_min + self.rng.randint(1, 8))
+        return '?' + urlencode(filtros) if filtros else ''
+
+    def elegir_perro(self, response):
+        ids = self.comando.perro_re.findall(response.text)
+        return self.rng.choice(ids) if ids else None
+
+    def csrf(self, response, paso):
+        match = CSRF_INPUT_RE.search(response.text)
+        if match is None:
+            raise Fallo(paso, 'sin token CSRF')
+        return match.group(1)
+
+    async def navegar(self):
+        await self.pedir('inicio', 'GET', reverse('core:home'))
+        await self.pensar()
+        catalogo = await self.pedir('catalogo', 'GET', reverse('adopciones:lista_perros') + self.filtros())
+        perro_id = self.elegir_perro(catalogo)
+        if perro_id is None:
+            return  # ningún perro con esos filtros
+        await self.pensar()
+        await self.pedir('detalle', 'GET', reverse('adopciones:detalle_perro', args=[perro_id]))
+
+    async def adoptar(self):
+        catalogo = await self.pedir('catalogo', 'GET', reverse('adopciones:lista_perros'))
+        perro_id = self.elegir_perro(catalogo)
+        if perro_id is None:
+            raise Fallo('catalogo', 'sin perros disponibles')
+        await self.pensar()
+        await self.pedir('detalle', 'GET', reverse('adopciones:detalle_perro', args=[perro_id]))
+        await self.pensar()
+        url = reverse('adopciones:solicitar_adopcion', args=[perro_id])
+        formulario = await self.pedir('formulario_adopcion', 'GET', url)
+        await self.pensar()
+        numero = self.rng.randrange(10 ** 6)
+        await self.pedir('solicitud', 'POST', url, esperado=(302,), data={
+            'csrfmiddlewaretoken': self.csrf(formulario, 'formulario_adopcion'),
+            'nombre_solicitante': f'Carga {numero}',
+            'email': f'carga{numero}@example.com',
+            'telefono': f'+569{numero:08d}',
+            'direccion': 'Calle de prueba 123, Santiago',
+            'experiencia_mascotas': 'Prueba de carga',
+            'motivo_adopcion': 'Prueba de carga',
+            'vivienda_tipo': self.rng.choice(SolicitudAdopcion.VIVIENDA_TIPO_CHOICES)[0],
+            'patio': self.rng.choice(SolicitudAdopcion.PATIO_CHOICES)[0],
+            'otros_animales': '',
+        })
+
+    async def donar(self):
+        url = reverse('donaciones:donar')
+        formulario = await self.pedir('formulario_donacion', 'GET', url)
+        select = TIPO_DONACION_RE.search(formulario.text)
+        tipos = OPCION_RE.findall(select.group(0)) if select else []
+        if not tipos:
+            raise Fallo('formulario_donacion', 'sin tipos de donación activos')
+        await self.pensar()
+        datos = {
+            'csrfmiddlewaretoken': self.csrf(formulario, 'formulario_donacion'),
+            'tipo_donacion': self.rng.choice(tipos),
+            'nombre_donante': 'Carga',
+            'email_donante': 'carga@example.com',
+            'cantidad': str(self.rng.choice((5000, 10000, 25000, 50000))),
+        }
+        comando = self.comando
+        pasarela = None
+        if not comando.pasarela_comprobada:
+            # Hasta saber que la instancia usa una pasarela local, solo dona un visitante a la vez
+            async with comando.comprobando_pasarela:
+                if comando.pasarela_local and not comando.pasarela_comprobada:
+                    pasarela = await self.pagar(url, datos)
+                    if not es_local(pasarela):
+                        comando.pasarela_local = False
+                        raise Fallo('pasarela', f'no local ({urlsplit(pasarela).hostname})')
+                    comando.pasarela_comprobada = True
+        if not comando.pasarela_local:
+            raise Fallo('pasarela', 'no local')
+        pasarela = pasarela or await self.pagar(url, datos)
+
+        # El formulario de la pasarela local "paga" al instante y redirige a return_url
+        vuelta = await self.pedir('pasarela', 'GET', pasarela, esperado=(302,))
+        resultado = await self.pedir('resultado', 'GET', vuelta.headers['Location'], esperado=(302,))
+        await self.pedir('gracias', 'GET', urljoin(str(resultado.url), resultado.headers['Location']))
+
+    async def pagar(self, url, datos):
+        """Crear la donación: la instancia redirige al formulario de la pasarela"""
+        respuesta = await self.pedir('donacion', 'POST', url, esperado=(302,), data=datos)
+        return respuesta.headers['Location']
+
+    async def cerrar(self):
+        # Sin aclose: cerraría el transporte compartido
+        self.cliente.cookies.clear()
+
+
+class Command(BaseCommand):
+    help = (
+        'Prueba de carga contra una instancia en marcha (runserver, gunicorn, uvicorn) con escenarios '
+        'ponderados: navegar (inicio → catálogo con filtros → ficha), adoptar (envía una solicitud) y donar '
+        '(pasa por la pasarela WebPay local). Lazo cerrado (--usuarios) o abierto (--ritmo), con pausas '
+        'entre pasos. Informa de peticiones por segundo, errores y percentiles de latencia por paso'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Instancia a probar (local o de red privada)')
+        parser.add_argument('--duracion', type=float, default=60.0, help='Segundos de prueba (sin contar el calentamiento)')
+        parser.add_argument('--calentamiento', type=float, default=5.0, help='Segundos iniciales que no se miden')
+        modo = parser.add_mutually_exclusive_group()
+        modo.add_argument(
+            '--usuarios', type=int,
+            help='Lazo cerrado: visitantes simultáneos; cada uno empieza otro escenario al terminar el anterior (por defecto 10)',
+        )
+        modo.add_argument(
+            '--ritmo', type=float,
+            help='Lazo abierto: visitantes nuevos por segundo (llegadas de Poisson), sin esperar a que terminen los anteriores',
+        )
+        parser.add_argument(
+            '--max-sesiones', type=int, default=2000,
+            help='Lazo abierto: visitantes en curso a partir de los cuales se descartan las llegadas',
+        )
+        parser.add_argument('--pausa', type=float, default=1.0, help='Pausa media entre pasos en segundos (exponencial; 0 sin pausa)')
+        parser.add_argument(
+            '--peso', action='append', type=peso, default=[], metavar='ESCENARIO=PESO',
+            help='Peso de un escenario (' + ', '.join(f'{n}={p}' for n, p in PESOS.items()) + ' por defecto); repetible',
+        )
+        parser.add_argument(
+            '--pasarela', type=int, metavar='PUERTO',
+            help='Levantar la pasarela WebPay local en 127.0.0.1:PUERTO (la instancia debe tener WEBPAY_API_HOST apuntando ahí)',
+        )
+        parser.add_argument('--timeout', type=float, default=30.0, help='Tiempo máximo por petición en segundos')
+        parser.add_argument('--semilla', type=int, help='Semilla del generador aleatorio')
+        parser.add_argument('--salida', help='Fichero JSON de resultados')
+
+    def handle(self, *args, **options):
+        self.url = options['url'].rstrip('/')
+        if not es_local(self.url):
+            raise CommandError(f'{self.url} no es una dirección local ni privada: la carga solo se lanza contra instancias propias')
+        if options['duracion'] <= 0 or options['calentamiento'] < 0 or options['pausa'] < 0:
+            raise CommandError('--duracion debe ser positiva; --calentamiento y --pausa, no negativos')
+        if options['usuarios'] is not None and options['usuarios'] < 1:
+            raise CommandError('--usuarios debe ser al menos 1')
+        if options['ritmo'] is not None and options['ritmo'] <= 0:
+            raise CommandError('--ritmo debe ser positivo')
+        pesos = dict(PESOS, **dict(options['peso']))
+        if not any(pesos.values()):
+            raise CommandError('Todos los escenarios tienen peso 0')
+
+        self.pausa = options['pausa']
+        self.timeout = options['timeout']
+        self.rng = random.Random(options['semilla'])
+        self.pesos = pesos
+        # Enlaces a las fichas en el HTML del catálogo
+        self.perro_re = re.compile(re.escape(reverse('adopciones:detalle_perro', args=[0])).replace('0', r'(\d+)', 1))
+
+        pasarela = None
+        if options['pasarela'] is not None:
+            try:
+                pasarela = WebPayStandInServer(('127.0.0.1', options['pasarela']))
+            except OSError as e:
+                raise CommandError(f'No se pudo abrir 127.0.0.1:{options["pasarela"]}: {e}')
+            pasarela.start_in_thread()
+            self.stdout.write(f'🧪 Pasarela WebPay local en {pasarela.base_url}')
+
+        if options['ritmo'] is not None:
+            descripcion = f'lazo abierto, {options["ritmo"]:g} visitantes/s'
+        else:
+            options['usuarios'] = options['usuarios'] or 10
+            descripcion = f'lazo cerrado, {options["usuarios"]} visitantes'
+        self.stdout.write(
+            f'{self.url}: {descripcion}, pausa media {self.pausa:g} s, '
+            f'{options["calentamiento"]:g} + {options["duracion"]:g} s | '
+            + ', '.join(f'{n} {p:g}' for n, p in pesos.items())
+        )
+
+        try:
+            asyncio.run(self.ejecutar(options))
+        finally:
+            if pasarela is not None:
+                pasarela.shutdown()
+                pasarela.server_close()
+
+        informe = self.informe(options, descripcion)
+        self.escribir(informe)
+        if pasarela is not None:
+            self.stdout.write('Pasarela: ' + ', '.join(f'{k} {v}' for k, v in sorted(pasarela.stats.items())))
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8') as f:
+                json.dump(informe, f, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'✅ Resultados en {options["salida"]}'))
+
+    async def ejecutar(self, options):
+        self.transporte = httpx.AsyncHTTPTransport(
+            limits=httpx.Limits(max_connections=None, max_keepalive_connections=None),
+        )
+        self.pasarela_local = True
+        self.pasarela_comprobada = False
+        self.comprobando_pasarela = asyncio.Lock()
+        inicio = time.perf_counter()
+        self.resultados = Resultados(inicio + options['calentamiento'])
+        self.fin = self.resultados.inicio_medida + options['duracion']
+        try:
+            if options['ritmo'] is not None:
+                await self.lazo_abierto(options['ritmo'], options['max_sesiones'])
+            else:
+                await asyncio.gather(*(self.visitante() for _ in range(options['usuarios'])))
+        finally:
+            await self.transporte.aclose()
+        # Las sesiones del lazo abierto pueden acabar después de `fin`
+        self.segundos = max(time.perf_counter(), self.fin) - self.resultados.inicio_medida
+
+    def escenario(self, rng):
+        nombres = list(self.pesos)
+        return rng.choices(nombres, weights=[self.pesos[n] for n in nombres])[0]
+
+    async def sesion(self, sesion, nombre):
+        try:
+            await getattr(sesion, nombre)()
+        except Fallo as e:
+            if self.resultados.midiendo():
+                self.resultados.escenarios[(nombre, 'fallidos')] += 1
+                self.resultados.fallos[(nombre, str(e))] += 1
+        else:
+            if self.resultados.midiendo():
+                self.resultados.escenarios[(nombre, 'completados')] += 1
+
+    async def visitante(self):
+        """Lazo cerrado: un escenario tras otro, con una pausa entre ellos"""
+        sesion = Sesion(self, random.Random(self.rng.random()))
+        while time.perf_counter() < self.fin:
+            await self.sesion(sesion, self.escenario(sesion.rng))
+            await sesion.pensar()
+        await sesion.cerrar()
+
+    async def lazo_abierto(self, ritmo, max_sesiones):
+        en_curso = set()
+
+        async def visita(rng):
+            sesion = Sesion(self, rng)
+            try:
+                await self.sesion(sesion, self.escenario(rng))
+            finally:
+                await sesion.cerrar()
+
+        siguiente = time.perf_counter()
+        while siguiente < self.fin:
+            await asyncio.sleep(max(0.0, siguiente - time.perf_counter()))
+            if len(en_curso) >= max_sesiones:
+                # Saturado: la instancia no despacha visitantes al ritmo al que llegan
+                if self.resultados.midiendo():
+                    self.resultados.descartadas += 1
+            else:
+                tarea = asyncio.create_task(visita(random.Random(self.rng.random())))
+                en_curso.add(tarea)
+                tarea.add_done_callback(en_curso.discard)
+            siguiente += self.rng.expovariate(ritmo)
+        if en_curso:
+            await asyncio.gather(*en_curso)
+
+    def informe(self, options, descripcion):
+        resultados = self.resultados
+        pasos = []
+        for paso in sorted(resultados.peticiones, key=PASOS.index):
+            numero = resultados.peticiones[paso]
+            fila = {
+                'paso': paso,
+                'peticiones': numero,
+                'errores': sum(n for (p, _), n in resultados.errores.items() if p == paso),
+            }
+            tiempos = resultados.tiempos[paso]
+            if tiempos:  # sin respuesta ninguna (conexión rechazada, timeout) no hay latencias
+                fila.update(
+                    p50_ms=round(statistics.median(tiempos) * 1000, 1),
+                    p95_ms=round(percentil(tiempos, 0.95) * 1000, 1),
+                    p99_ms=round(percentil(tiempos, 0.99) * 1000, 1),
+                    max_ms=round(max(tiempos) * 1000, 1),
+                )
+            pasos.append(fila)
+        peticiones = sum(resultados.peticiones.values())
+        errores = sum(resultados.errores.values())
+        return {
+            'fecha': timezone.now().isoformat(),
+            'url': self.url,
+            'modo': descripcion,
+            'pausa_s': self.pausa,
+            'pesos': self.pesos,
+            'segundos': round(self.segundos, 1),
+            'peticiones': peticiones,
+            'peticiones_por_segundo': round(peticiones / self.segundos, 1),
+            'errores': errores,
+            'tasa_errores': round(errores / peticiones, 4) if peticiones else 0,
+            'visitantes_descartados': resultados.descartadas,
+            'escenarios': {f'{n} {r}': c for (n, r), c in sorted(resultados.escenarios.items())},
+            'escenarios_fallidos': {f'{n} ({f})': c for (n, f), c in resultados.fallos.most_common()},
+            'pasos': pasos,
+        }
+
+    def escribir(self, informe):
+        self.stdout.write('')
+        for paso in informe['pasos']:
+            linea = f'  {paso["paso"]:<20} {paso["peticiones"]:>7} pet.'
+            if 'p50_ms' in paso:
+                linea += (
+                    f'  p50 {paso["p50_ms"]:8.1f} ms  p95 {paso["p95_ms"]:8.1f} ms  '
+                    f'p99 {paso["p99_ms"]:8.1f} ms  máx {paso["max_ms"]:8.1f} ms'
+                )
+            if paso['errores']:
+                self.stdout.write(self.style.WARNING(linea + f'  errores {paso["errores"]}'))
+            else:
+                self.stdout.write(linea)
+        self.stdout.write('')
+        self.stdout.write(
+            f'{informe["peticiones"]} peticiones en {informe["segundos"]:g} s: '
+            f'{informe["peticiones_por_segundo"]:g} pet./s, errores {informe["tasa_errores"]:.2%}'
+        )
+        self.stdout.write('Escenarios: ' + (', '.join(f'{k} {v}' for k, v in informe['escenarios'].items()) or 'ninguno'))
+        for causa, numero in informe['escenarios_fallidos'].items():
+            self.stdout.write(self.style.WARNING(f'  {numero:>6} × {causa}'))
+        if informe['visitantes_descartados']:
+            self.stdout.write(self.style.WARNING(
+                f'{informe["visitantes_descartados"]} visitantes descartados con --max-sesiones en curso: '
+                'la instancia no da abasto con ese ritmo'
+            ))
@@ -0,0 +1,28 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+
+from core import profiling
+
+
+class Command(BaseCommand):
+    help = (
+        'Token firmado para perfilar peticiones con la cabecera X-Perfilar (core.middleware.'
+        'ProfilerMiddleware) sin sesión en el navegador; caduca a los PROFILER_TOKEN_MAX_AGE segundos'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help='Superusuario en cuyo nombre se perfila')
+
+    def handle(self, *args, **options):
+        username = options['username']
+        if not get_user_model().objects.filter(username=username, is_active=True, is_superuser=True).exists():
+            raise CommandError(f'{username} no existe, no está activo o no es superusuario')
+        token = profiling.make_token(username)
+        minutos = settings.PROFILER_TOKEN_MAX_AGE // 60
+        self.stdout.write(token)
+        self.stderr.write(
+            f'Válido durante {minutos} minutos. Ejemplo:\n'
+            f'  curl -H "X-Perfilar: {token}" -o perfil.txt {settings.BASE_URL}/\n'
+            f'  flamegraph.pl perfil.txt > perfil.svg   (o abrir perfil.txt en https://www.speedscope.app)'
+        )
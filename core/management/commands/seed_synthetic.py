@@ -0,0 +1,267 @@
+import random
+import time
+from contextlib import contextmanager
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from adopciones.models import Perro, SolicitudAdopcion
+from core.models import Testimonio, Voluntario
+from donaciones.models import Aviso, Donacion, TipoDonacion
+
+# Filas por modelo con --escala 1
+CANTIDADES = {
+    'perros': 1_000,
+    'solicitudes': 3_000,
+    'donaciones': 10_000,
+    'voluntarios': 500,
+    'avisos': 100,
+    'testimonios': 200,
+}
+
+NOMBRES_PERRO = [
+    'Luna', 'Max', 'Rocky', 'Canela', 'Toby', 'Lola', 'Bruno', 'Nala', 'Coco', 'Simba', 'Kira', 'Thor',
+    'Manchas', 'Pelusa', 'Chispa', 'Negra', 'Copito', 'Tobías', 'Mora', 'Oso', 'Frida', 'Pancho', 'Cholita',
+]
+RAZAS = ['Mestizo', 'Mestizo', 'Mestizo', 'Quiltro', 'Labrador', 'Pastor alemán', 'Poodle', 'Beagle', 'Boxer']
+NOMBRES = [
+    'María', 'José', 'Camila', 'Juan', 'Valentina', 'Diego', 'Fernanda', 'Matías', 'Javiera', 'Benjamín',
+    'Catalina', 'Sebastián', 'Francisca', 'Tomás', 'Constanza', 'Felipe', 'Antonia', 'Nicolás', 'Isidora',
+]
+APELLIDOS = [
+    'González', 'Muñoz', 'Rojas', 'Díaz', 'Pérez', 'Soto', 'Contreras', 'Silva', 'Martínez', 'Sepúlveda',
+    'Morales', 'Rodríguez', 'López', 'Fuentes', 'Hernández', 'Torres', 'Araya', 'Flores', 'Espinoza',
+]
+COMUNAS = ['Santiago', 'Providencia', 'Ñuñoa', 'Maipú', 'La Florida', 'Puente Alto', 'Valparaíso', 'Viña del Mar']
+FRASES = [
+    'Es muy cariñoso y le encanta salir a pasear.',
+    'Llegó al albergue tras ser rescatado de la calle.',
+    'Se lleva bien con niños y con otros perros.',
+    'Necesita una familia paciente que le dé tiempo para adaptarse.',
+    'Tiene mucha energía y disfruta jugando con la pelota.',
+    'Es tranquilo, ideal para departamento.',
+    'Ya conoce órdenes básicas y camina bien con correa.',
+]
+MONTOS = [5_000, 10_000, 10_000, 25_000, 25_000, 50_000, 100_000, 200_000]
+
+
+@contextmanager
+def sin_auto_now_add(*modelos):
+    """bulk_create con fechas propias: auto_now_add las sustituiría por la hora actual"""
+    campos = [
+        campo for modelo in modelos for campo in modelo._meta.concrete_fields
+        if getattr(campo, 'auto_now_add', False)
+    ]
+    for campo in campos:
+        campo.auto_now_add = False
+    try:
+        yield
+    finally:
+        for campo in campos:
+            campo.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = (
+        'Genera datos sintéticos (perros, solicitudes, donaciones, voluntarios, avisos y testimonios) '
+        'con bulk_create para medir el sitio a escala (`manage.py benchmark_urls`). Añade filas: '
+        'usar sobre una base de datos de pruebas'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--escala', type=float, default=1.0,
+            help='Multiplica las cantidades por defecto (' + ', '.join(f'{n:,} {m}' for m, n in CANTIDADES.items()) + ')',
+        )
+        for modelo in CANTIDADES:
+            parser.add_argument(f'--{modelo}', type=int, help=f'Número de {modelo} (sustituye a --escala)')
+        parser.add_argument('--dias', type=int, default=3 * 365, help='Días de histórico hacia atrás (3 años por defecto)')
+        parser.add_argument('--semilla', type=int, default=42, help='Semilla aleatoria: la misma semilla da los mismos datos')
+        parser.add_argument('--batch-size', type=int, default=5_000, help='Filas por bulk_create')
+        parser.add_argument('--forzar', action='store_true', help='Permitir la carga con DEBUG=False')
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options['forzar']:
+            raise CommandError('DEBUG=False: ¿es la base de datos de producción? Usar --forzar si no lo es')
+        if options['dias'] < 1:
+            raise CommandError('--dias debe ser al menos 1')
+
+        cantidades = {
+            modelo: options[modelo] if options[modelo] is not None else int(base * options['escala'])
+            for modelo, base in CANTIDADES.items()
+        }
+        self.rng = random.Random(options['semilla'])
+        self.batch_size = options['batch_size']
+        self.ahora = timezone.now()
+        self.dias = options['dias']
+
+        inicio = time.perf_counter()
+        with sin_auto_now_add(Perro, SolicitudAdopcion, Donacion, Voluntario, Aviso, Testimonio):
+            self.crear(Perro, cantidades['perros'], self.perro)
+            perros = list(Perro.objects.values_list('id', 'estado'))
+            if cantidades['solicitudes'] and not perros:
+                raise CommandError('No hay perros a los que asociar las solicitudes')
+            self.crear(SolicitudAdopcion, cantidades['solicitudes'], lambda: self.solicitud(perros))
+
+            tipos = list(TipoDonacion.objects.filter(activo=True).values_list('id', flat=True))
+            if not tipos and cantidades['donaciones']:
+                tipos = [
+                    TipoDonacion.objects.create(
+                        nombre=nombre, descripcion=f'Donación para {nombre.lower()}', precio_sugerido=precio,
+                    ).id
+                    for nombre, precio in (('Alimento', 10_000), ('Veterinario', 25_000), ('Albergue', 50_000))
+                ]
+            self.crear(Donacion, cantidades['donaciones'], lambda: self.donacion(tipos))
+            self.crear(Voluntario, cantidades['voluntarios'], self.voluntario)
+            self.crear(Aviso, cantidades['avisos'], self.aviso)
+            self.crear(Testimonio, cantidades['testimonios'], self.testimonio)
+
+        if cantidades['donaciones']:
+            # bulk_create no pasa por Donacion.save: el resumen diario se reconstruye entero
+            call_command('backfill_donation_rollups', stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(f'✅ Datos sintéticos generados en {time.perf_counter() - inicio:.1f} s'))
+
+    def crear(self, modelo, total, fabrica):
+        """Insertar `total` filas en lotes, en una sola transacción por modelo"""
+        if total <= 0:
+            return
+        inicio = time.perf_counter()
+        with transaction.atomic():
+            pendientes = total
+            while pendientes:
+                lote = [fabrica() for _ in range(min(self.batch_size, pendientes))]
+                modelo.objects.bulk_create(lote, batch_size=self.batch_size)
+                pendientes -= len(lote)
+        duracion = time.perf_counter() - inicio
+        self.stdout.write(
+            f'{modelo._meta.verbose_name_plural:<25} {total:>10,} filas en {duracion:6.1f} s '
+            f'({total / duracion:,.0f} filas/s)'
+        )
+
+    # --- Fábricas de filas ---
+
+    def fecha(self):
+        """Instante en el histórico, con más actividad reciente"""
+        dias = self.dias * (1 - self.rng.random() ** 0.5)
+        return self.ahora - timedelta(days=dias, seconds=self.rng.randrange(86_400))
+
+    def persona(self):
+        nombre, apellido = self.rng.choice(NOMBRES), self.rng.choice(APELLIDOS)
+        email = f'{nombre}.{apellido}{self.rng.randrange(10_000)}@example.com'.lower()
+        return nombre, apellido, email, f'+569{self.rng.randrange(10_000_000, 99_999_999)}'
+
+    def texto(self, frases=2):
+        return ' '.join(self.rng.sample(FRASES, frases))
+
+    def perro(self):
+        rng = self.rng
+        return Perro(
+            nombre=rng.choice(NOMBRES_PERRO),
+            edad=min(int(rng.expovariate(1 / 4)), 16),
+            tamano=rng.choice(Perro.TAMANO_CHOICES)[0],
+            sexo=rng.choice(Perro.SEXO_CHOICES)[0],
+            color=rng.choice(Perro.COLOR_CHOICES)[0],
+            raza=rng.choice(RAZAS),
+            descripcion=self.texto(3),
+            vacunado=rng.random() < 0.8,
+            esterilizado=rng.random() < 0.6,
+            estado=rng.choices(['disponible', 'en_proceso', 'adoptado'], weights=[50, 10, 40])[0],
+            fecha_ingreso=self.fecha().date(),
+            peso=Decimal(rng.randrange(200, 4_000)) / 100,
+            bueno_con_niños=rng.random() < 0.8,
+            bueno_con_otros_perros=rng.random() < 0.7,
+            necesidades_especiales='Dieta especial' if rng.random() < 0.05 else '',
+        )
+
+    def solicitud(self, perros):
+        perro_id, estado_perro = self.rng.choice(perros)
+        # Coherente con la señal actualizar_estado_perro: solo los adoptados tienen aprobadas
+        if estado_perro == 'adoptado':
+            estado = self.rng.choices(['aprobada', 'rechazada'], weights=[30, 70])[0]
+        elif estado_perro == 'en_proceso':
+            estado = self.rng.choice(['pendiente', 'en_revision'])
+        else:
+            estado = 'rechazada'
+        nombre, apellido, email, telefono = self.persona()
+        return SolicitudAdopcion(
+            perro_id=perro_id,
+            nombre_solicitante=f'{nombre} {apellido}',
+            email=email,
+            telefono=telefono,
+            direccion=f'Calle {self.rng.randrange(1, 3_000)}, {self.rng.choice(COMUNAS)}',
+            experiencia_mascotas='He tenido perros desde pequeño.',
+            motivo_adopcion='Queremos darle un hogar a un perro rescatado.',
+            vivienda_tipo=self.rng.choice(SolicitudAdopcion.VIVIENDA_TIPO_CHOICES)[0],
+            patio=self.rng.choice(SolicitudAdopcion.PATIO_CHOICES)[0],
+            estado=estado,
+            fecha_solicitud=self.fecha(),
+        )
+
+    def donacion(self, tipos):
+        rng = self.rng
+        nombre, apellido, email, telefono = self.persona()
+        estado = rng.choices(
+            ['completada', 'pendiente', 'rechazada', 'cancelada', 'fallida'], weights=[80, 5, 8, 5, 2]
+        )[0]
+        fecha = self.fecha()
+        donacion = Donacion(
+            tipo_donacion_id=rng.choice(tipos),
+            nombre_donante=f'{nombre} {apellido}',
+            email_donante=email,
+            telefono_donante=telefono if rng.random() < 0.5 else '',
+            cantidad=Decimal(rng.choice(MONTOS)),
+            estado=estado,
+            fecha_donacion=fecha,
+            anonimo=rng.random() < 0.15,
+        )
+        if estado in ('completada', 'rechazada'):
+            donacion.buy_order = f'SIN{rng.randrange(10 ** 12):012d}'
+            donacion.token_ws = f'{rng.getrandbits(256):064x}'
+            donacion.transaction_date = fecha + timedelta(minutes=2)
+            if estado == 'completada':
+                donacion.authorization_code = f'{rng.randrange(1_000_000):06d}'
+        return donacion
+
+    def voluntario(self):
+        nombre, apellido, email, telefono = self.persona()
+        return Voluntario(
+            nombre=nombre,
+            apellidos=apellido,
+            email=email,
+            telefono=telefono,
+            direccion=self.rng.choice(COMUNAS),
+            fecha_nacimiento=date(1960, 1, 1) + timedelta(days=self.rng.randrange(45 * 365)),
+            experiencia='Voluntariado en otras protectoras.',
+            disponibilidad=self.rng.choice(['Fines de semana', 'Tardes', 'Mañanas', 'Flexible']),
+            motivacion='Quiero ayudar a los perros del albergue.',
+            fecha_solicitud=self.fecha(),
+            aprobado=self.rng.random() < 0.6,
+            activo=self.rng.random() < 0.9,
+        )
+
+    def aviso(self):
+        creado = self.fecha()
+        return Aviso(
+            titulo=f'Jornada de adopción en {self.rng.choice(COMUNAS)}',
+            contenido=self.texto(2),
+            tipo=self.rng.choice(Aviso.TIPO_CHOICES)[0],
+            activo=self.rng.random() < 0.7,
+            fecha_creacion=creado,
+            fecha_vencimiento=creado + timedelta(days=30) if self.rng.random() < 0.5 else None,
+            destacado=self.rng.random() < 0.1,
+        )
+
+    def testimonio(self):
+        nombre, apellido, _, _ = self.persona()
+        return Testimonio(
+            nombre=f'{nombre} {apellido}',
+            contenido='Adoptar fue la mejor decisión. ' + self.texto(1),
+            perro_adoptado=self.rng.choice(NOMBRES_PERRO),
+            fecha=self.fecha(),
+            mostrar=self.rng.random() < 0.8,
+        )
@@ -0,0 +1,133 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Se cargan bajo demanda (donaciones.webpay_estado, donor_analytics...): al arrancar son una regresión
+PEREZOSOS = ('transbank', 'requests', 'httpx', 'PIL', 'numpy')
+
+# Proceso hijo: importa el módulo WSGI como un worker de gunicorn y atiende una petición
+HIJO = '''
+import importlib, json, sys, time
+inicio = time.perf_counter()
+modulo = importlib.import_module(sys.argv[1])
+listo = time.perf_counter()
+resultado = {"listo_ms": (listo - inicio) * 1000}
+if sys.argv[2]:
+    from wsgiref.util import setup_testing_defaults
+    ruta, _, consulta = sys.argv[2].partition("?")
+    entorno = {"PATH_INFO": ruta, "QUERY_STRING": consulta, "HTTP_HOST": sys.argv[3]}
+    setup_testing_defaults(entorno)
+    estado = []
+    respuesta = modulo.application(entorno, lambda status, headers, *args: estado.append(status))
+    b"".join(respuesta)
+    respuesta.close()
+    resultado["primera_ms"] = (time.perf_counter() - listo) * 1000
+    resultado["estado"] = estado[0]
+print(json.dumps(resultado))
+'''
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide el arranque de un worker (importar el módulo WSGI, con y sin calentamiento) y la primera '
+        'petición en procesos nuevos, y desglosa con `python -X importtime` qué importaciones cuestan más'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticiones', type=int, default=5, help='Arranques medidos por configuración (mediana)')
+        parser.add_argument('--url', default='/', help='Ruta de la primera petición ("" para no hacerla)')
+        parser.add_argument('--limite', type=int, default=15, help='Filas de cada tabla del desglose')
+
+    def handle(self, *args, **options):
+        if options['repeticiones'] < 1:
+            raise CommandError('--repeticiones debe ser al menos 1')
+        self.modulo = settings.WSGI_APPLICATION.rsplit('.', 1)[0]
+        self.url = options['url']
+        self.host = next((h for h in settings.ALLOWED_HOSTS if h != '*' and not h.startswith('.')), 'localhost')
+
+        self.stdout.write(f'Arranque de {self.modulo} ({options["repeticiones"]} procesos por configuración)')
+        for calentamiento in (True, False):
+            medidas = [self.arrancar(calentamiento)[0] for _ in range(options['repeticiones'])]
+            listo = statistics.median(m['listo_ms'] for m in medidas)
+            linea = f'  {"con" if calentamiento else "sin"} calentamiento: listo en {listo:7.1f} ms'
+            if self.url:
+                primera = statistics.median(m['primera_ms'] for m in medidas)
+                linea += (
+                    f' | primera petición GET {self.url} {primera:7.1f} ms ({medidas[-1]["estado"]})'
+                    f' | total {listo + primera:7.1f} ms'
+                )
+            self.stdout.write(linea)
+
+        # El desglose, de un arranque con la configuración actual (importtime añade su propio coste)
+        _, importaciones = self.arrancar(getattr(settings, 'WARMUP', True), importtime=True)
+        self.desglose(importaciones, options['limite'])
+
+    def arrancar(self, calentamiento, importtime=False):
+        entorno = dict(os.environ, WARMUP=str(calentamiento))
+        comando = [sys.executable] + (['-X', 'importtime'] if importtime else []) + [
+            '-c', HIJO, self.modulo, self.url, self.host,
+        ]
+        proceso = subprocess.run(comando, cwd=settings.BASE_DIR, env=entorno, capture_output=True, text=True)
+        if proceso.returncode:
+            raise CommandError(f'El arranque falló:\n{proceso.stderr[-3000:]}')
+        medidas = json.loads(proceso.stdout.strip().splitlines()[-1])
+        return medidas, self.leer_importtime(proceso.stderr) if importtime else []
+
+    def leer_importtime(self, salida):
+        """[(nombre, nivel, propio_us, acumulado_us)] en el orden de -X importtime (hijos antes que el padre)"""
+        importaciones = []
+        for linea in salida.splitlines():
+            if not linea.startswith('import time:') or 'self [us]' in linea:
+                continue
+            propio, acumulado, nombre = linea[len('import time:'):].split('|')
+            nivel = (len(nombre) - len(nombre.lstrip()) - 1) // 2
+            importaciones.append((nombre.strip(), nivel, int(propio), int(acumulado)))
+        return importaciones
+
+    def desglose(self, importaciones, limite):
+        if not importaciones:
+            return
+        total = sum(propio for _, _, propio, _ in importaciones)
+        por_paquete = defaultdict(lambda: [0, 0])
+        for nombre, _, propio, _ in importaciones:
+            paquete = por_paquete[nombre.split('.')[0]]
+            paquete[0] += propio
+            paquete[1] += 1
+        self.stdout.write('')
+        self.stdout.write(f'Importaciones: {len(importaciones)} módulos, {total / 1000:.1f} ms (con -X importtime)')
+        self.stdout.write('Por paquete (tiempo propio de sus módulos):')
+        for paquete, (propio, numero) in sorted(por_paquete.items(), key=lambda p: -p[1][0])[:limite]:
+            self.stdout.write(f'  {paquete:<28} {propio / 1000:8.1f} ms  {numero:>4} módulos')
+
+        propios = {app.split('.')[0] for app in settings.INSTALLED_APPS} | {self.modulo.split('.')[0]}
+        propios = {p for p in propios if (settings.BASE_DIR / p).is_dir()}
+        self.stdout.write('Módulos del proyecto (acumulado, con lo que importan):')
+        del_proyecto = [i for i in importaciones if i[0].split('.')[0] in propios]
+        for nombre, _, _, acumulado in sorted(del_proyecto, key=lambda i: -i[3])[:limite]:
+            self.stdout.write(f'  {nombre:<40} {acumulado / 1000:8.1f} ms')
+
+        cargados = [i for i in range(len(importaciones)) if importaciones[i][0] in PEREZOSOS]
+        for indice in cargados:
+            cadena = ' ← '.join(self.importado_por(importaciones, indice))
+            self.stdout.write(self.style.WARNING(
+                f'⚠️  {importaciones[indice][0]} se importa al arrancar '
+                f'({importaciones[indice][3] / 1000:.1f} ms): {cadena}'
+            ))
+        if not cargados:
+            self.stdout.write(self.style.SUCCESS('✅ Ninguno de ' + ', '.join(PEREZOSOS) + ' se importa al arrancar'))
+
+    def importado_por(self, importaciones, indice):
+        """Cadena de importaciones hasta la raíz: el padre es la siguiente línea de nivel menor"""
+        nombre, nivel, _, _ = importaciones[indice]
+        cadena = [nombre]
+        for otro, otro_nivel, _, _ in importaciones[indice + 1:]:
+            if otro_nivel < nivel:
+                cadena.append(otro)
+                nivel = otro_nivel
+        return cadena
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+
+from core import metrics
+
+
+class Command(BaseCommand):
+    help = (
+        'Tiempo de renderizado por {% block %}, {% include %} y tag de librería, agrupado por '
+        'plantilla (suma de todos los workers, core.template_backend). El tiempo de cada nodo '
+        'incluye el de los nodos que contiene'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--plantilla', help='Solo los nodos de esta plantilla (p. ej. base.html)')
+        parser.add_argument('--limite', type=int, default=40, help='Número de filas (40 por defecto)')
+
+    def handle(self, *args, **options):
+        samples = metrics.shared.samples()
+        nodos = {}
+        for nombre, clave in (
+            ('protectora_template_node_renders_total', 'veces'),
+            ('protectora_template_node_seconds_total', 'segundos'),
+        ):
+            for labels, valores in samples.get(nombre, {}).items():
+                etiquetas = metrics.parse_labels(labels)
+                fila = nodos.setdefault(
+                    (etiquetas.get('plantilla', ''), etiquetas.get('nodo', '')), {'veces': 0, 'segundos': 0.0}
+                )
+                fila[clave] += valores.get('', 0)
+
+        if options['plantilla']:
+            nodos = {clave: datos for clave, datos in nodos.items() if clave[0] == options['plantilla']}
+        if not nodos:
+            self.stdout.write('Sin renderizados registrados todavía (¿está activado TEMPLATE_NODE_METRICS?)')
+            return
+
+        total = sum(datos['segundos'] for datos in nodos.values())
+        self.stdout.write(f'{"Plantilla":<40} {"Nodo":<40} {"Veces":>8} {"Total (s)":>10} {"Media (ms)":>10}')
+        filas = sorted(nodos.items(), key=lambda item: -item[1]['segundos'])[:options['limite']]
+        for (plantilla, nodo), datos in filas:
+            media = datos['segundos'] / datos['veces'] * 1000 if datos['veces'] else 0
+            self.stdout.write(
+                f'{plantilla[:40]:<40} {nodo[:40]:<40} {int(datos["veces"]):>8} '
+                f'{datos["segundos"]:>10.2f} {media:>10.2f}'
+            )
+        self.stdout.write(f'\n{len(nodos)} nodos; suma de totales {total:.2f} s (los nodos anidados cuentan dos veces)')
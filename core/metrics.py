@@ -0,0 +1,353 @@
+"""
+Métricas: histogramas en memoria del proceso y métricas por vista compartidas
+entre workers (SharedMetrics), expuestas en formato Prometheus
+"""
+import atexit
+import bisect
+import contextvars
+import logging
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Límites superiores de los buckets en segundos (estilo Prometheus)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Histograma de latencias con buckets fijos, seguro entre hilos"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._counts = [0] * (len(self.buckets) + 1)  # último bucket: +Inf
+        self._sum = 0.0
+        self._count = 0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    @property
+    def count(self):
+        return self._count
+
+    def snapshot(self):
+        """Copia con conteos acumulados por bucket, suma y total"""
+        with self._lock:
+            counts = list(self._counts)
+            total, value_sum = self._count, self._sum
+        cumulative, running = [], 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            running += count
+            cumulative.append((bound, running))
+        return {'buckets': cumulative, 'sum': value_sum, 'count': total}
+
+    def percentile(self, fraction):
+        """Percentil aproximado, interpolando dentro del bucket que lo contiene (como histogram_quantile)"""
+        snapshot = self.snapshot()
+        if not snapshot['count']:
+            return 0.0
+        target = fraction * snapshot['count']
+        lower, previous = 0.0, 0
+        for bound, cumulative in snapshot['buckets']:
+            if cumulative >= target:
+                if bound == float('inf'):
+                    return lower  # por encima del último límite no hay información
+                in_bucket = cumulative - previous
+                return lower + (bound - lower) * (target - previous) / in_bucket
+            lower, previous = bound, cumulative
+        return lower
+
+
+class HistogramFamily:
+    """Conjunto de histogramas identificados por una etiqueta (vista, operación...)"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._histograms = {}
+
+    def labels(self, label):
+        with self._lock:
+            if label not in self._histograms:
+                self._histograms[label] = Histogram(self.buckets)
+            return self._histograms[label]
+
+    def observe(self, label, value):
+        self.labels(label).observe(value)
+
+    def items(self):
+        with self._lock:
+            return list(self._histograms.items())
+
+
+# --- Métricas por vista compartidas entre workers (core.middleware.MetricsMiddleware) ---
+
+SIZE_BUCKETS = (512, 2048, 8192, 32768, 131072, 524288, 2097152, 8388608)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+LOCK_WAIT_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# nombre: (tipo, buckets, descripción)
+METRICS = {
+    'protectora_http_requests_total': (
+        'counter', None, 'Peticiones por vista, método y código de estado',
+    ),
+    'protectora_http_request_duration_seconds': (
+        'histogram', DEFAULT_BUCKETS, 'Duración de la petición (hasta el último bloque en respuestas streaming)',
+    ),
+    'protectora_http_response_size_bytes': (
+        'histogram', SIZE_BUCKETS, 'Bytes del cuerpo de la respuesta, ya comprimido',
+    ),
+    'protectora_db_queries_per_request': (
+        'histogram', QUERY_BUCKETS, 'Consultas SQL por petición',
+    ),
+    'protectora_db_duration_seconds': (
+        'histogram', DEFAULT_BUCKETS, 'Tiempo en consultas SQL por petición',
+    ),
+    'protectora_template_render_seconds': (
+        'histogram', DEFAULT_BUCKETS, 'Tiempo renderizando plantillas por petición',
+    ),
+    # Por nodo de plantilla: {% block %}, {% include %} y tags de librerías (core.template_backend)
+    'protectora_template_node_renders_total': (
+        'counter', None, 'Veces que se ha renderizado el nodo (plantilla y nodo)',
+    ),
+    'protectora_template_node_seconds_total': (
+        'counter', None, 'Segundos renderizando el nodo, incluidos los nodos que contiene',
+    ),
+    # Contención de escritura en SQLite (core.contention)
+    'protectora_db_writes_total': (
+        'counter', None, 'Sentencias de escritura (INSERT, UPDATE, DELETE)',
+    ),
+    'protectora_db_lock_waits_total': (
+        'counter', None, 'Escrituras que esperaron al bloqueo de escritura de SQLite',
+    ),
+    'protectora_db_lock_wait_seconds': (
+        'histogram', LOCK_WAIT_BUCKETS, 'Tiempo bloqueado en cada espera',
+    ),
+    'protectora_db_lock_errors_total': (
+        'counter', None, 'Errores "database is locked" devueltos por SQLite',
+    ),
+    'protectora_db_lock_retries_total': (
+        'counter', None, 'Reintentos tras "database is locked" (nivel: sentencia o transaccion)',
+    ),
+    'protectora_db_lock_failures_total': (
+        'counter', None, 'Errores de bloqueo que llegaron a la vista tras agotar los reintentos',
+    ),
+}
+
+
+class RequestMetrics:
+    """Acumuladores de una petición, accesibles desde el wrapper de consultas y las plantillas"""
+
+    __slots__ = ('request', 'queries', 'db_time', 'template_time', 'template_depth', 'template_nodes')
+
+    def __init__(self, request=None):
+        self.request = request
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+        # (plantilla, nodo): [renderizados, segundos]
+        self.template_nodes = {}
+
+
+# ContextVar y no threading.local: bajo ASGI sync_to_async copia el contexto al hilo
+# que ejecuta la vista o las consultas, así que todos ven la misma petición
+current_request = contextvars.ContextVar('metricas_peticion', default=None)
+
+
+def current_view():
+    """
+    Nombre de la URL de la petición en curso ('' fuera de una petición). Sin URL
+    resuelta (404, middleware) es 'sin_vista', como en MetricsMiddleware: con la
+    ruta cada URL inventada crearía una serie de etiquetas nueva.
+    """
+    request_metrics = current_request.get()
+    if request_metrics is None or request_metrics.request is None:
+        return ''
+    match = request_metrics.request.resolver_match
+    return match.view_name if match else 'sin_vista'
+
+
+def db_execute_wrapper(execute, sql, params, many, context):
+    """Wrapper de connection.execute_wrappers: cuenta y cronometra las consultas de la petición"""
+    request_metrics = current_request.get()
+    if request_metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        request_metrics.queries += 1
+        request_metrics.db_time += time.perf_counter() - start
+
+
+def install_db_wrapper(sender, connection, **kwargs):
+    """Receptor de connection_created: instala el wrapper en cada conexión nueva"""
+    if db_execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(db_execute_wrapper)
+
+
+def format_labels(**labels):
+    """`vista="x",metodo="GET"` con el escapado de Prometheus"""
+    return ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n'))
+        for name, value in labels.items()
+    )
+
+
+_LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def parse_labels(labels):
+    """Inversa de format_labels"""
+    return {
+        name: value.replace(r'\n', '\n').replace(r'\"', '"').replace('\\\\', '\\')
+        for name, value in _LABEL.findall(labels)
+    }
+
+
+class SharedMetrics:
+    """
+    Contadores e histogramas sumados entre todos los workers en un fichero SQLite.
+
+    Cada proceso acumula incrementos en memoria y un hilo en segundo plano los suma
+    al fichero cada `flush_interval` segundos (en una transacción `BEGIN IMMEDIATE`),
+    así las peticiones nunca esperan al fichero. Al leer se vuelca antes lo pendiente
+    del propio proceso; lo de los demás puede llegar con hasta `flush_interval` de retraso.
+    """
+
+    def __init__(self, path, flush_interval=5.0):
+        self.path = str(path)
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._local = threading.local()
+        self._pid = None
+
+    def inc(self, name, labels, value=1):
+        self._add(((name, labels, ''), value))
+
+    def observe(self, name, labels, value):
+        buckets = METRICS[name][1]
+        index = bisect.bisect_left(buckets, value)
+        bound = str(float(buckets[index])) if index < len(buckets) else '+Inf'
+        self._add(((name, labels, bound), 1), ((name, labels, 'sum'), value), ((name, labels, 'count'), 1))
+
+    def _add(self, *deltas):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._start_process()
+            for key, delta in deltas:
+                self._pending[key] = self._pending.get(key, 0) + delta
+
+    def _start_process(self):
+        # Tras un fork (workers de gunicorn) lo pendiente es del proceso padre, que lo
+        # volcará él, y el hilo de volcado no sobrevive: uno nuevo por proceso
+        self._pid = os.getpid()
+        self._pending = {}
+        threading.Thread(target=self._flush_loop, name='metricas-flush', daemon=True).start()
+        atexit.register(self.flush)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        try:
+            db = self._connection()
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                db.executemany(
+                    'INSERT INTO samples (name, labels, bucket, value) VALUES (?, ?, ?, ?) '
+                    'ON CONFLICT (name, labels, bucket) DO UPDATE SET value = value + excluded.value',
+                    [(name, labels, bucket, value) for (name, labels, bucket), value in pending.items()],
+                )
+            except BaseException:
+                db.execute('ROLLBACK')
+                raise
+            db.execute('COMMIT')
+        except sqlite3.Error as e:
+            # Se reintenta en el siguiente volcado
+            logger.warning(f'No se pudieron guardar las métricas en {self.path}: {e}')
+            with self._lock:
+                for key, value in pending.items():
+                    self._pending[key] = self._pending.get(key, 0) + value
+
+    def samples(self):
+        """{nombre: {etiquetas: {bucket: valor}}} de todos los workers"""
+        self.flush()
+        result = {}
+        for name, labels, bucket, value in self._connection().execute(
+            'SELECT name, labels, bucket, value FROM samples'
+        ):
+            result.setdefault(name, {}).setdefault(labels, {})[bucket] = value
+        return result
+
+    def prometheus(self):
+        """Formato de texto de Prometheus (version 0.0.4)"""
+        samples = self.samples()
+        lines = []
+        for name, (kind, buckets, description) in METRICS.items():
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, values in sorted(samples.get(name, {}).items()):
+                if kind == 'counter':
+                    lines.append(f'{name}{{{labels}}} {_number(values.get("", 0))}')
+                    continue
+                prefix = f'{labels},' if labels else ''
+                cumulative = 0
+                for bound in [str(float(b)) for b in buckets] + ['+Inf']:
+                    cumulative += values.get(bound, 0)
+                    lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {_number(cumulative)}')
+                lines.append(f'{name}_sum{{{labels}}} {_number(values.get("sum", 0))}')
+                lines.append(f'{name}_count{{{labels}}} {_number(values.get("count", 0))}')
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self._pending.clear()
+        self._connection().execute('DELETE FROM samples')
+
+    def _connection(self):
+        # Una conexión por hilo y proceso, como en core.circuit_breaker
+        db = getattr(self._local, 'db', None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            db.execute('PRAGMA journal_mode = WAL')
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS samples ('
+                'name TEXT NOT NULL, labels TEXT NOT NULL, bucket TEXT NOT NULL, value REAL NOT NULL, '
+                'PRIMARY KEY (name, labels, bucket))'
+            )
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
+
+
+def _number(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+shared = SharedMetrics(
+    getattr(settings, 'METRICS_STATE_FILE', os.path.join(tempfile.gettempdir(), 'protectora_metricas.sqlite3')),
+    flush_interval=getattr(settings, 'METRICS_FLUSH_INTERVAL', 5.0),
+)
@@ -0,0 +1,468 @@
+"""
+Middleware propios del sitio
+"""
+import logging
+import threading
+import time
+from collections import deque
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.http import HttpResponse
+from django.templatetags.static import static
+from django.utils.cache import add_never_cache_headers, patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from . import compression, metrics, profiling
+
+logger = logging.getLogger(__name__)
+
+
+class StaticFilesMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoise compatible con vistas asíncronas.
+
+    WhiteNoiseMiddleware solo es síncrono, y en ASGI Django adapta entonces toda la
+    cadena interior a síncrona: las vistas async (donar, webpay_resultado) volverían
+    a ocupar un hilo mientras esperan a Transbank.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
+
+
+class MetricsMiddleware:
+    """
+    Registra por vista (nombre de la URL) la latencia, el número y el tiempo de las
+    consultas SQL, el tiempo de renderizado de plantillas y el tamaño de la respuesta
+    en metrics.shared, que se publica en /metrics/ en formato Prometheus.
+
+    Va justo después de StaticFilesMiddleware (los estáticos no cuentan) y antes de
+    CompressionMiddleware, así que el tamaño es el comprimido. En respuestas streaming
+    se registra al enviar el último bloque, contando las consultas hechas mientras tanto.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        start = time.perf_counter()
+        request_metrics = metrics.RequestMetrics(request)
+        token = metrics.current_request.set(request_metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.current_request.reset(token)
+        return self._process(request, response, request_metrics, start)
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        request_metrics = metrics.RequestMetrics(request)
+        token = metrics.current_request.set(request_metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.current_request.reset(token)
+        return self._process(request, response, request_metrics, start)
+
+    def _process(self, request, response, request_metrics, start):
+        if not response.streaming:
+            self._record(request, response, request_metrics, start, len(response.content))
+        elif response.is_async:
+            response.streaming_content = self._async_stream(
+                response.streaming_content, request, response, request_metrics, start
+            )
+        else:
+            response.streaming_content = self._sync_stream(
+                response.streaming_content, request, response, request_metrics, start
+            )
+        return response
+
+    def _sync_stream(self, chunks, request, response, request_metrics, start):
+        size = 0
+        chunks = iter(chunks)
+        try:
+            while True:
+                # El generador de la vista consulta la base de datos al avanzar: fuera
+                # del middleware, así que se vuelve a fijar la petición en cada bloque
+                token = metrics.current_request.set(request_metrics)
+                try:
+                    chunk = next(chunks)
+                except StopIteration:
+                    return
+                finally:
+                    metrics.current_request.reset(token)
+                size += len(chunk)
+                yield chunk
+        finally:
+            self._record(request, response, request_metrics, start, size)
+
+    async def _async_stream(self, chunks, request, response, request_metrics, start):
+        size = 0
+        chunks = aiter(chunks)
+        try:
+            while True:
+                token = metrics.current_request.set(request_metrics)
+                try:
+                    chunk = await anext(chunks)
+                except StopAsyncIteration:
+                    return
+                finally:
+                    metrics.current_request.reset(token)
+                size += len(chunk)
+                yield chunk
+        finally:
+            self._record(request, response, request_metrics, start, size)
+
+    def _record(self, request, response, request_metrics, start, size):
+        match = request.resolver_match
+        labels = metrics.format_labels(
+            vista=match.view_name if match else 'sin_vista',
+            metodo=request.method if request.method in self.METHODS else 'otro',
+        )
+        shared = metrics.shared
+        shared.inc(
+            'protectora_http_requests_total',
+            f'{labels},{metrics.format_labels(estado=response.status_code)}',
+        )
+        shared.observe('protectora_http_request_duration_seconds', labels, time.perf_counter() - start)
+        shared.observe('protectora_http_response_size_bytes', labels, size)
+        shared.observe('protectora_db_queries_per_request', labels, request_metrics.queries)
+        shared.observe('protectora_db_duration_seconds', labels, request_metrics.db_time)
+        shared.observe('protectora_template_render_seconds', labels, request_metrics.template_time)
+        for (template_name, node), (renders, seconds) in request_metrics.template_nodes.items():
+            node_labels = metrics.format_labels(plantilla=template_name, nodo=node)
+            shared.inc('protectora_template_node_renders_total', node_labels, renders)
+            shared.inc('protectora_template_node_seconds_total', node_labels, seconds)
+
+
+class ProfilerMiddleware:
+    """
+    Perfil de una petición bajo demanda (core.profiling): en vez de la respuesta
+    devuelve sus pilas muestreadas en formato "collapsed stacks" para flamegraph.pl
+    o speedscope. Se pide con `?_perfilar=1` siendo superusuario, o con la cabecera
+    `X-Perfilar: <token>` (`manage.py profile_token <usuario>`), p. ej. desde curl.
+
+    Va después de AuthenticationMiddleware: el perfil cubre la vista, el renderizado
+    de la plantilla y el contenido streaming, que se consume entero. Sin el parámetro
+    ni la cabecera solo cuesta buscarlos en request.META y request.GET.
+
+    Mientras dura el perfil el intervalo de cambio de hilo del intérprete se acorta
+    para todo el proceso (profiling.Sampler) y se restaura al terminar.
+
+    En peticiones síncronas se muestrea solo el hilo de la petición; en las async,
+    todos los hilos ocupados (la parte síncrona corre en hilos de asgiref), así que
+    pueden colarse otras peticiones atendidas a la vez.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    QUERY_FLAG = '_perfilar'
+    HEADER = 'HTTP_X_PERFILAR'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.interval = getattr(settings, 'PROFILER_INTERVAL_MS', 2) / 1000
+        self.token_max_age = getattr(settings, 'PROFILER_TOKEN_MAX_AGE', 3600)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self._requested(request) or not self._allowed(request):
+            return self.get_response(request)
+        if not profiling.lock.acquire(blocking=False):
+            logger.warning(f'Perfil de {request.path} descartado: ya hay otro en curso')
+            return self.get_response(request)
+        self._strip_flag(request)
+        try:
+            start = time.perf_counter()
+            with profiling.Sampler({threading.get_ident()}, self.interval) as sampler:
+                response = self.get_response(request)
+                if response.streaming and not response.is_async:
+                    for _ in response.streaming_content:
+                        pass
+            duration = time.perf_counter() - start
+        finally:
+            profiling.lock.release()
+        return self._profile_response(request, response, sampler, duration)
+
+    async def __acall__(self, request):
+        if not self._requested(request) or not await sync_to_async(self._allowed)(request):
+            return await self.get_response(request)
+        if not profiling.lock.acquire(blocking=False):
+            logger.warning(f'Perfil de {request.path} descartado: ya hay otro en curso')
+            return await self.get_response(request)
+        self._strip_flag(request)
+        try:
+            start = time.perf_counter()
+            with profiling.Sampler(None, self.interval) as sampler:
+                response = await self.get_response(request)
+                if response.streaming:
+                    if response.is_async:
+                        async for _ in response.streaming_content:
+                            pass
+                    else:
+                        await sync_to_async(deque)(response.streaming_content, 0)
+            duration = time.perf_counter() - start
+        finally:
+            profiling.lock.release()
+        return self._profile_response(request, response, sampler, duration)
+
+    def _requested(self, request):
+        return self.HEADER in request.META or request.GET.get(self.QUERY_FLAG) == '1'
+
+    def _strip_flag(self, request):
+        # El admin trata los parámetros desconocidos como filtros y redirige con ?e=1
+        if self.QUERY_FLAG in request.GET:
+            query = request.GET.copy()
+            del query[self.QUERY_FLAG]
+            query._mutable = False
+            request.GET = query
+
+    def _allowed(self, request):
+        token = request.META.get(self.HEADER)
+        if token is None:
+            return request.user.is_superuser
+        username = profiling.token_user(token, self.token_max_age)
+        if username is None:
+            logger.warning(f'Token de perfil no válido o caducado en {request.path}')
+            return False
+        return get_user_model().objects.filter(
+            username=username, is_active=True, is_superuser=True
+        ).exists()
+
+    def _profile_response(self, request, response, sampler, duration):
+        response.close()
+        match = request.resolver_match
+        view_name = match.view_name if match else 'sin_vista'
+        logger.info(
+            f'Perfil de {view_name}: {duration * 1000:.0f} ms, {sampler.samples} muestras, '
+            f'{len(sampler.stacks)} pilas distintas'
+        )
+        profile = HttpResponse(sampler.collapsed(), content_type='text/plain; charset=utf-8')
+        filename = f'perfil-{view_name.replace(":", "-")}-{time.strftime("%Y%m%d-%H%M%S")}.txt'
+        profile['Content-Disposition'] = f'attachment; filename="{filename}"'
+        profile['X-Perfil-Estado'] = str(response.status_code)
+        profile['X-Perfil-Duracion-Ms'] = f'{duration * 1000:.0f}'
+        profile['X-Perfil-Muestras'] = str(sampler.samples)
+        add_never_cache_headers(profile)
+        return profile
+
+
+class PreloadHeadersMiddleware(MiddlewareMixin):
+    """
+    Añade cabeceras `Link: rel=preload` a las respuestas HTML para que el navegador
+    empiece a descargar la hoja de estilos, main.js y la imagen principal antes de
+    analizar el documento.
+    """
+
+    # Recursos comunes a todas las páginas: (ruta estática, tipo)
+    ASSETS = [
+        ('css/style.css', 'style'),
+        ('js/main.js', 'script'),
+    ]
+
+    # Recursos adicionales por vista (view_name de la URL)
+    VIEW_ASSETS = {
+        'core:home': [('img/hero-dog.jpg', 'image')],
+    }
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self._headers = {}
+
+    def process_response(self, request, response):
+        if response.status_code != 200 or not response.get('Content-Type', '').startswith('text/html'):
+            return response
+
+        match = request.resolver_match
+        view_name = match.view_name if match else None
+        link = self._link_header(view_name)
+        if link:
+            existing = response.get('Link')
+            response['Link'] = f'{existing}, {link}' if existing else link
+        return response
+
+    def _link_header(self, view_name):
+        """Construir (y memorizar) la cabecera con las URLs con hash del manifiesto"""
+        if view_name not in self._headers:
+            links = []
+            for path, kind in self.ASSETS + self.VIEW_ASSETS.get(view_name, []):
+                try:
+                    url = static(path)
+                except ValueError:
+                    # Recurso ausente del manifiesto (collectstatic sin ejecutar)
+                    continue
+                links.append(f'<{url}>; rel=preload; as={kind}')
+            self._headers[view_name] = ', '.join(links)
+        return self._headers[view_name]
+
+
+class MessagesNoStoreMiddleware(MiddlewareMixin):
+    """
+    Las respuestas que muestran mensajes flash llevan `Cache-Control: no-store`: el
+    service worker (templates/core/sw.js) y el navegador no las guardan, así una
+    página del catálogo servida desde la caché no repite un "¡Gracias por tu solicitud!"
+    """
+
+    def process_response(self, request, response):
+        storage = getattr(request, '_messages', None)
+        # `used` se activa al recorrer los mensajes (el {% for message in messages %} de base.html)
+        if storage is not None and storage.used:
+            add_never_cache_headers(response)
+        return response
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Comprime las respuestas dinámicas negociando br/zstd/gzip según Accept-Encoding.
+
+    - Omite respuestas pequeñas, ya codificadas o de tipos no comprimibles.
+    - Comprime StreamingHttpResponse bloque a bloque, sin acumular el cuerpo.
+    - Si la respuesta incluye un token CSRF se usa gzip con relleno aleatorio
+      (como GZipMiddleware de Django) para mitigar ataques tipo BREACH. Va después
+      de CsrfViewMiddleware en MIDDLEWARE: get_token() marca CSRF_COOKIE_NEEDS_UPDATE
+      y CsrfViewMiddleware lo vuelve a poner a False al enviar la cookie.
+    - Registra el ratio y el tiempo de CPU por vista en compression.stats.
+    """
+
+    COMPRESSIBLE_TYPES = (
+        'text/', 'application/json', 'application/javascript', 'application/xml', 'image/svg+xml',
+    )
+    MAX_RANDOM_BYTES = 100
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.min_size = getattr(settings, 'COMPRESSION_MIN_SIZE', 512)
+        self.levels = {'br': 5, 'zstd': 3, 'gzip': 6}
+        self.levels.update(getattr(settings, 'COMPRESSION_LEVELS', {}))
+
+    def process_response(self, request, response):
+        if not self._should_compress(response):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        accept = request.META.get('HTTP_ACCEPT_ENCODING', '')
+        csrf_used = request.META.get('CSRF_COOKIE_NEEDS_UPDATE', False)
+        available = ['gzip'] if csrf_used else None
+        encoding = compression.negotiate_encoding(accept, available)
+        if encoding is None:
+            return response
+
+        match = request.resolver_match
+        view_name = match.view_name if match else None
+
+        if response.streaming:
+            response.streaming_content = self._compress_stream(
+                response, encoding, view_name, padded=csrf_used
+            )
+            del response.headers['Content-Length']
+        else:
+            start = time.thread_time()
+            compressed = self._compress_content(response.content, encoding, padded=csrf_used)
+            cpu = time.thread_time() - start
+            compression.stats.record(view_name, encoding, len(response.content), len(compressed), cpu)
+            logger.debug(
+                f"{view_name}: {encoding} {len(response.content)} → {len(compressed)} bytes en {cpu * 1000:.2f} ms"
+            )
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+    def _should_compress(self, response):
+        if response.has_header('Content-Encoding'):
+            return False
+        content_type = response.get('Content-Type', '').split(';')[0].strip().lower()
+        if not content_type.startswith(self.COMPRESSIBLE_TYPES):
+            return False
+        if not response.streaming and len(response.content) < self.min_size:
+            return False
+        return True
+
+    def _encoder(self, encoding, padded):
+        if padded:
+            return compression.GzipEncoder(self.levels['gzip'], max_random_bytes=self.MAX_RANDOM_BYTES)
+        return compression.ENCODERS[encoding](self.levels[encoding])
+
+    def _compress_content(self, content, encoding, padded):
+        encoder = self._encoder(encoding, padded)
+        return encoder.compress(content) + encoder.finish()
+
+    def _compress_stream(self, response, encoding, view_name, padded):
+        encoder = self._encoder(encoding, padded)
+        if response.is_async:
+            return self._compress_async_stream(response.streaming_content, encoder, encoding, view_name)
+        return self._compress_sync_stream(response.streaming_content, encoder, encoding, view_name)
+
+    def _compress_sync_stream(self, chunks, encoder, encoding, view_name):
+        original = compressed = 0
+        cpu = 0.0
+        for chunk in chunks:
+            start = time.thread_time()
+            data = encoder.compress(chunk) + encoder.flush()
+            cpu += time.thread_time() - start
+            original += len(chunk)
+            compressed += len(data)
+            if data:
+                yield data
+        data = encoder.finish()
+        compressed += len(data)
+        compression.stats.record(view_name, encoding, original, compressed, cpu)
+        yield data
+
+    async def _compress_async_stream(self, chunks, encoder, encoding, view_name):
+        original = compressed = 0
+        cpu = 0.0
+        async for chunk in chunks:
+            start = time.thread_time()
+            data = encoder.compress(chunk) + encoder.flush()
+            cpu += time.thread_time() - start
+            original += len(chunk)
+            compressed += len(data)
+            if data:
+                yield data
+        data = encoder.finish()
+        compressed += len(data)
+        compression.stats.record(view_name, encoding, original, compressed, cpu)
+        yield data
@@ -0,0 +1,115 @@
+"""
+Perfilado por muestreo de una petición (core.middleware.ProfilerMiddleware).
+
+Un hilo muestreador lee cada `interval` segundos la pila de los hilos que atienden
+la petición con `sys._current_frames()` y cuenta cuántas veces aparece cada
+pila. El resultado se devuelve en formato "collapsed stacks" (una línea
+`marco;marco;...;marco N` por pila), el que leen flamegraph.pl, speedscope o
+https://www.speedscope.app directamente.
+
+Se usa un hilo y no SIGPROF porque las señales solo llegan al hilo principal y
+las vistas se ejecutan en hilos de trabajo (gunicorn con hilos, ASGI).
+"""
+import os
+import sys
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.core import signing
+
+TOKEN_SALT = 'core.profiling'
+# Hilos en reposo (esperando trabajo o E/S; thread.py es el de concurrent.futures): se
+# descartan al muestrear todos los hilos
+_IDLE_FILES = ('threading.py', 'selectors.py', 'queue.py', 'thread.py')
+
+# Un perfil a la vez por proceso: el intervalo de cambio de hilo es global (ver Sampler)
+lock = threading.Lock()
+
+
+def make_token(username):
+    """Token para la cabecera X-Perfilar (ver `manage.py profile_token`)"""
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign(username)
+
+
+def token_user(token, max_age):
+    """Usuario del token si la firma es válida y no ha caducado; None si no"""
+    try:
+        return signing.TimestampSigner(salt=TOKEN_SALT).unsign(token, max_age=max_age)
+    except signing.BadSignature:
+        return None
+
+
+class Sampler:
+    """
+    Muestrea las pilas de `thread_ids` (None: todos los hilos salvo los que están
+    en reposo) mientras está activo el bloque `with`.
+    """
+
+    def __init__(self, thread_ids=None, interval=0.002):
+        self.thread_ids = thread_ids
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._labels = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self._switch_interval = None
+
+    def __enter__(self):
+        # Con el GIL, el muestreador solo entra cuando la vista lo suelta: cada 5 ms por
+        # defecto. Durante el perfil se acorta para muestrear al intervalo pedido.
+        # sys.setswitchinterval es global: mientras dura el perfil todos los hilos del
+        # proceso (las demás peticiones también) cambian de hilo más a menudo, con algo
+        # más de sobrecarga. Por eso hay un solo perfil a la vez y se restaura siempre.
+        self._switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(self._switch_interval, self.interval / 2))
+        try:
+            self._thread = threading.Thread(target=self._run, name='perfilador', daemon=True)
+            self._thread.start()
+        except BaseException:
+            sys.setswitchinterval(self._switch_interval)
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self._stop.set()
+            self._thread.join()
+        finally:
+            sys.setswitchinterval(self._switch_interval)
+        return False
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self.samples += 1
+            for ident, frame in sys._current_frames().items():
+                if ident == own or (self.thread_ids is not None and ident not in self.thread_ids):
+                    continue
+                if self.thread_ids is None and os.path.basename(frame.f_code.co_filename) in _IDLE_FILES:
+                    continue
+                self.stacks[self._collapse(frame)] += 1
+
+    def _collapse(self, frame):
+        labels = []
+        while frame is not None:
+            code = frame.f_code
+            label = self._labels.get(code)
+            if label is None:
+                label = self._labels[code] = f'{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})'
+            labels.append(label)
+            frame = frame.f_back
+        return ';'.join(reversed(labels))
+
+    def collapsed(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+def _short_path(filename):
+    base = str(settings.BASE_DIR) + os.sep
+    if 'site-packages' + os.sep in filename:
+        return filename.split('site-packages' + os.sep, 1)[1]
+    if filename.startswith(base):
+        return filename[len(base):]
+    return os.path.basename(filename)
@@ -0,0 +1,321 @@
+"""
+Registro de consultas lentas.
+
+Un wrapper de `connection.execute_wrappers` (instalado en cada conexión desde
+CoreConfig.ready) cronometra cada consulta; las que superan SLOW_QUERY_MS se
+guardan con su huella (el SQL normalizado), los tipos de los parámetros (nunca
+sus valores), la vista y la línea del proyecto que la lanzó. La primera vez que
+aparece una huella se guarda además su `EXPLAIN QUERY PLAN`, marcando los
+recorridos completos de las tablas grandes (SLOW_QUERY_FULL_SCAN_TABLES).
+
+Todo va al fichero de métricas (METRICS_STATE_FILE), compartido por los workers
+y fuera de las transacciones del sitio; se conservan las últimas
+SLOW_QUERY_LOG_SIZE consultas y se ven en /admin/consultas-lentas/. Como en
+SharedMetrics, la petición solo deja la consulta en memoria y un hilo en segundo
+plano la escribe en el fichero cada METRICS_FLUSH_INTERVAL segundos. Las
+consultas que fallan (bloqueos, errores de integridad) no se registran: su
+duración no dice nada del plan.
+"""
+import atexit
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+_IN_LIST = re.compile(r'\(\s*%s(?:\s*,\s*%s)+\s*\)')
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_SPACES = re.compile(r'\s+')
+# Tablas con alias de Django ("adopciones_perro" U0): SQLite reciente muestra solo el alias
+_ALIAS = re.compile(r'"(\w+)"\s+(?:AS\s+)?"?([A-Z]\d+)"?')
+_SQLITE_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)')
+_POSTGRES_SCAN = re.compile(r'Seq Scan on (\w+)')
+
+# Ficheros de la instrumentación: su marco nunca es el origen de una consulta
+_CORE_DIR = os.path.dirname(os.path.abspath(__file__))
+_OWN_FILES = {
+    os.path.join(_CORE_DIR, name)
+    for name in ('slow_queries.py', 'contention.py', 'metrics.py', 'middleware.py', 'template_backend.py')
+}
+_DJANGO_DB = os.path.join('django', 'db', '')
+
+
+def fingerprint(sql):
+    """SQL sin literales ni longitud de las listas IN: el mismo para todas las ejecuciones"""
+    normalized = _IN_LIST.sub('(%s, ...)', sql)
+    normalized = _STRING.sub('?', normalized)
+    normalized = _NUMBER.sub('?', normalized)
+    normalized = _SPACES.sub(' ', normalized).strip()
+    return hashlib.sha1(normalized.encode()).hexdigest()[:12], normalized
+
+
+def params_shape(params, many):
+    """Tipos de los parámetros, agrupando repeticiones: 'int×3, str'"""
+    if many:
+        return 'executemany'
+    if not params:
+        return ''
+    if isinstance(params, dict):
+        return ', '.join(f'{name}: {type(value).__name__}' for name, value in params.items())
+    groups = []
+    for value in params:
+        name = type(value).__name__
+        if groups and groups[-1][0] == name:
+            groups[-1][1] += 1
+        else:
+            groups.append([name, 1])
+    return ', '.join(name if count == 1 else f'{name}×{count}' for name, count in groups)
+
+
+def _origin():
+    """
+    Primer marco del proyecto en la pila; si no hay ninguno (vistas del admin) el
+    primero fuera del ORM, p. ej. django/contrib/admin/views/main.py
+    """
+    base = str(settings.BASE_DIR)
+    # Puntos de entrada (manage.py, wsgi/asgi): están en la pila de todas las consultas
+    entry_points = (os.path.join(base, 'manage.py'), os.path.join(base, 'protectora_adan', ''))
+    fallback = ''
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if not filename.startswith('<'):  # <frozen ...>, <string>
+            filename = os.path.abspath(filename)
+        if filename not in _OWN_FILES and _DJANGO_DB not in filename:
+            if (filename.startswith(base) and 'site-packages' not in filename
+                    and not filename.startswith(entry_points)):
+                return f'{os.path.relpath(filename, base)}:{frame.f_lineno} en {frame.f_code.co_name}'
+            if not fallback:
+                short = filename.split('site-packages' + os.sep, 1)[-1]
+                fallback = f'{short}:{frame.f_lineno} en {frame.f_code.co_name}'
+        frame = frame.f_back
+    return fallback
+
+
+def _explain(connection, sql, params):
+    """Plan de la consulta como lista de líneas (None si el motor no se soporta)"""
+    if connection.vendor == 'sqlite':
+        prefix = 'EXPLAIN QUERY PLAN '
+    elif connection.vendor == 'postgresql':
+        prefix = 'EXPLAIN '
+    else:
+        return None
+    # Cursor del driver sin execute_wrappers: no se cuenta ni vuelve a pasar por aquí
+    cursor = connection.create_cursor()
+    try:
+        cursor.execute(prefix + sql, params)
+        return [str(row[-1]) for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+def full_scans(plan, sql, tables):
+    """Tablas de `tables` que el plan recorre enteras"""
+    aliases = {alias: table for table, alias in _ALIAS.findall(sql)}
+    found = []
+    for line in plan:
+        match = _SQLITE_SCAN.match(line.strip()) or _POSTGRES_SCAN.search(line)
+        if match:
+            table = aliases.get(match.group(1), match.group(1))
+            if table in tables and table not in found:
+                found.append(table)
+    return found
+
+
+class SlowQueryLog:
+    def __init__(self, path, threshold_ms=100, size=500, tables=(), flush_interval=5.0):
+        self.path = str(path)
+        self.threshold = threshold_ms / 1000
+        self.size = size
+        self.tables = set(tables)
+        self.flush_interval = flush_interval
+        self._local = threading.local()
+        self._explained = set()
+        self._lock = threading.Lock()
+        # Filas de slow_queries y de query_plans aún sin volcar: de más de `size`
+        # consultas pendientes solo se conservarían las últimas de todos modos
+        self._pending = deque(maxlen=size)
+        self._pending_plans = []
+        self._pid = None
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        result = execute(sql, params, many, context)
+        duration = time.perf_counter() - start
+        if duration >= self.threshold:
+            try:
+                self._record(context['connection'], sql, params, many, duration)
+            except Exception:
+                # El registro nunca debe romper la consulta ni la petición
+                logger.exception('No se pudo registrar una consulta lenta')
+        return result
+
+    def install(self, sender, connection, **kwargs):
+        """Receptor de connection_created"""
+        if self.threshold > 0 and self.execute_wrapper not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self.execute_wrapper)
+
+    def _record(self, connection, sql, params, many, duration):
+        key, normalized = fingerprint(sql)
+        view, origin = metrics.current_view(), _origin()
+        logger.warning(f'Consulta lenta ({duration * 1000:.0f} ms) en {view or "-"} [{origin}]: {normalized[:300]}')
+        row = (time.time(), duration * 1000, key, normalized, params_shape(params, many), view, origin, connection.alias)
+        plan_row = None
+        explainable = not many and normalized.upper().startswith(('SELECT', 'WITH', 'UPDATE', 'DELETE'))
+        with self._lock:
+            # El plan se pide una vez por huella y proceso, y en la conexión de la
+            # consulta; si otro worker ya lo guardó, INSERT OR IGNORE lo descarta
+            first = explainable and key not in self._explained
+            self._explained.add(key)
+        if first:
+            try:
+                plan = _explain(connection, sql, params)
+            except Exception as e:
+                plan = [f'Error al obtener el plan: {e}']
+            if plan is not None:
+                scans = full_scans(plan, sql, self.tables)
+                if scans:
+                    logger.warning(f'La consulta {key} recorre entera(s) {", ".join(scans)}: {normalized[:300]}')
+                plan_row = (key, normalized, '\n'.join(plan), ','.join(scans), time.time())
+        with self._lock:
+            if self._pid != os.getpid():
+                self._start_process()
+            self._pending.append(row)
+            if plan_row:
+                self._pending_plans.append(plan_row)
+
+    def _start_process(self):
+        # Como en SharedMetrics: tras un fork lo pendiente es del padre y el hilo no sobrevive
+        self._pid = os.getpid()
+        self._pending = deque(maxlen=self.size)
+        self._pending_plans = []
+        threading.Thread(target=self._flush_loop, name='consultas-lentas-flush', daemon=True).start()
+        atexit.register(self.flush)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+            rows, self._pending = list(self._pending), deque(maxlen=self.size)
+            plans, self._pending_plans = self._pending_plans, []
+        if not rows and not plans:
+            return
+        try:
+            db = self._connection()
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                db.executemany(
+                    'INSERT INTO slow_queries (created, duration_ms, fingerprint, sql, params, view, origin, db_alias) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    rows,
+                )
+                db.execute(
+                    'DELETE FROM slow_queries WHERE id <= (SELECT MAX(id) FROM slow_queries) - ?', (self.size,)
+                )
+                db.executemany(
+                    'INSERT OR IGNORE INTO query_plans (fingerprint, sql, plan, full_scans, created) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    plans,
+                )
+            except BaseException:
+                db.execute('ROLLBACK')
+                raise
+            db.execute('COMMIT')
+        except sqlite3.Error as e:
+            # Se reintenta en el siguiente volcado, delante de lo que haya llegado mientras
+            logger.warning(f'No se pudieron guardar las consultas lentas en {self.path}: {e}')
+            with self._lock:
+                self._pending = deque(rows + list(self._pending), maxlen=self.size)
+                self._pending_plans[:0] = plans
+
+    def entries(self, fingerprint=None, full_scans_only=False):
+        """Consultas registradas, de la más reciente a la más antigua"""
+        self.flush()
+        query = (
+            'SELECT q.id, q.created, q.duration_ms, q.fingerprint, q.sql, q.params, q.view, q.origin, '
+            'q.db_alias, p.plan, p.full_scans '
+            'FROM slow_queries q LEFT JOIN query_plans p ON p.fingerprint = q.fingerprint'
+        )
+        conditions, args = [], []
+        if fingerprint:
+            conditions.append('q.fingerprint = ?')
+            args.append(fingerprint)
+        if full_scans_only:
+            conditions.append("p.full_scans != ''")
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        columns = ('id', 'created', 'duration_ms', 'fingerprint', 'sql', 'params', 'view', 'origin',
+                   'db_alias', 'plan', 'full_scans')
+        return [
+            dict(zip(columns, row))
+            for row in self._connection().execute(query + ' ORDER BY q.id DESC', args)
+        ]
+
+    def summary(self, full_scans_only=False):
+        """Por huella: número de apariciones, media y máximo en ms, plan y recorridos completos"""
+        self.flush()
+        query = (
+            'SELECT q.fingerprint, MAX(q.sql), COUNT(*), AVG(q.duration_ms), MAX(q.duration_ms), '
+            'MAX(q.created), p.plan, p.full_scans '
+            'FROM slow_queries q LEFT JOIN query_plans p ON p.fingerprint = q.fingerprint '
+        )
+        if full_scans_only:
+            query += "WHERE p.full_scans != '' "
+        query += 'GROUP BY q.fingerprint ORDER BY SUM(q.duration_ms) DESC'
+        columns = ('fingerprint', 'sql', 'count', 'avg_ms', 'max_ms', 'last', 'plan', 'full_scans')
+        return [dict(zip(columns, row)) for row in self._connection().execute(query)]
+
+    def clear(self):
+        with self._lock:
+            self._pending.clear()
+            self._pending_plans.clear()
+            self._explained.clear()
+        db = self._connection()
+        db.execute('DELETE FROM slow_queries')
+        db.execute('DELETE FROM query_plans')
+
+    def _connection(self):
+        # Una conexión por hilo y proceso, como en core.circuit_breaker
+        db = getattr(self._local, 'db', None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=1, isolation_level=None)
+            db.execute('PRAGMA journal_mode = WAL')
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS slow_queries ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, created REAL NOT NULL, duration_ms REAL NOT NULL, '
+                'fingerprint TEXT NOT NULL, sql TEXT NOT NULL, params TEXT NOT NULL, view TEXT NOT NULL, '
+                'origin TEXT NOT NULL, db_alias TEXT NOT NULL)'
+            )
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS query_plans ('
+                'fingerprint TEXT PRIMARY KEY, sql TEXT NOT NULL, plan TEXT NOT NULL, '
+                'full_scans TEXT NOT NULL, created REAL NOT NULL)'
+            )
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
+
+
+slow_query_log = SlowQueryLog(
+    metrics.shared.path,
+    threshold_ms=getattr(settings, 'SLOW_QUERY_MS', 100),
+    size=getattr(settings, 'SLOW_QUERY_LOG_SIZE', 500),
+    tables=getattr(settings, 'SLOW_QUERY_FULL_SCAN_TABLES', ()),
+    flush_interval=getattr(settings, 'METRICS_FLUSH_INTERVAL', 5.0),
+)
@@ -0,0 +1,123 @@
+"""
+Backend de plantillas de Django que mide el tiempo de renderizado para
+core.middleware.MetricsMiddleware.
+
+Solo pasan por aquí las plantillas que se cargan a través del backend (render,
+TemplateResponse, render_to_string); los include y extends se renderizan dentro
+de ellas y cuentan en su tiempo.
+
+Con TEMPLATE_NODE_METRICS se mide además cada {% block %}, {% include %} y tag de
+librería ({% crispy %}, {% static %}, los de core.templatetags...) por plantilla:
+la primera vez que el motor carga una plantilla (también las de extends e
+include) se envuelve el render de esos nodos. El tiempo de un nodo incluye el de
+los nodos que contiene: el block `content` contiene sus include y tags.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.template.backends.django import DjangoTemplates, Template
+from django.template.base import Node
+from django.template.library import InclusionNode, SimpleNode
+from django.template.loader_tags import BLOCK_CONTEXT_KEY, BlockNode, IncludeNode
+
+from . import metrics
+
+_instrument_lock = threading.Lock()
+
+
+class InstrumentedTemplate(Template):
+    def render(self, context=None, request=None):
+        request_metrics = metrics.current_request.get()
+        if request_metrics is None:
+            return super().render(context, request)
+        # Una plantilla renderizada desde otra (render_to_string en un tag) ya cuenta en la exterior
+        request_metrics.template_depth += 1
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            request_metrics.template_depth -= 1
+            if not request_metrics.template_depth:
+                request_metrics.template_time += time.perf_counter() - start
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    def __init__(self, params):
+        super().__init__(params)
+        if getattr(settings, 'TEMPLATE_NODE_METRICS', False):
+            # find_template es el punto por el que pasan get_template, extends e include
+            find_template = self.engine.find_template
+
+            def instrumented_find_template(*args, **kwargs):
+                template, origin = find_template(*args, **kwargs)
+                instrument_nodes(template)
+                return template, origin
+
+            self.engine.find_template = instrumented_find_template
+
+    def from_string(self, template_code):
+        template = self.engine.from_string(template_code)
+        if getattr(settings, 'TEMPLATE_NODE_METRICS', False):
+            instrument_nodes(template)
+        return InstrumentedTemplate(template, self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return InstrumentedTemplate(template.template, self)
+
+
+def node_label(node):
+    """'block content', 'include includes/tarjeta.html', 'tag crispy'; None si no se mide"""
+    if isinstance(node, BlockNode):
+        return f'block {node.name}'
+    if isinstance(node, IncludeNode):
+        return 'include ' + node.template.token.strip('"\'')
+    module = type(node).__module__
+    # Los tags propios del lenguaje (if, for, url, csrf_token...) y las variables no se miden
+    if module.startswith('django.template.') and not isinstance(node, (SimpleNode, InclusionNode)):
+        return None
+    token = getattr(node, 'token', None)
+    return f'tag {token.split_contents()[0] if token else type(node).__name__}'
+
+
+def instrument_nodes(template):
+    """Envolver una vez los nodos medibles de una plantilla compilada (la caché del loader la conserva)"""
+    if getattr(template, '_node_metrics', False) or not hasattr(template, 'nodelist'):
+        return
+    with _instrument_lock:
+        if getattr(template, '_node_metrics', False):
+            return
+        template_name = template.origin.template_name or template.name or 'desde_texto'
+        for node in template.nodelist.get_nodes_by_type(Node):
+            label = node_label(node)
+            if label is not None:
+                node.render = _timed(node.render, (template_name, label), node)
+        template._node_metrics = True
+
+
+def _timed(render, key, node):
+    block = isinstance(node, BlockNode)
+
+    def timed_render(context):
+        request_metrics = metrics.current_request.get()
+        if request_metrics is None:
+            return render(context)
+        node_key = key
+        if block:
+            # Con extends, el block de base.html renderiza el de la plantilla hija que lo
+            # redefine: el tiempo es de esa plantilla
+            block_context = context.render_context.get(BLOCK_CONTEXT_KEY)
+            override = block_context.get_block(node.name) if block_context else None
+            if override is not None and override is not node:
+                node_key = (override.origin.template_name, key[1])
+        start = time.perf_counter()
+        try:
+            return render(context)
+        finally:
+            totals = request_metrics.template_nodes.get(node_key)
+            if totals is None:
+                totals = request_metrics.template_nodes[node_key] = [0, 0.0]
+            totals[0] += 1
+            totals[1] += time.perf_counter() - start
+    return timed_render
@@ -0,0 +1,38 @@
+from functools import lru_cache
+
+from django import template
+from django.contrib.staticfiles import finders
+from django.templatetags.static import static
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+
+register = template.Library()
+
+
+@lru_cache(maxsize=None)
+def _critical_css(page):
+    """Leer (una vez por proceso) el CSS crítico generado con build_critical_css"""
+    path = finders.find(f'css/critical/{page}.css')
+    if not path:
+        return ''
+    with open(path, encoding='utf-8') as f:
+        return f.read()
+
+
+@register.simple_tag
+def critical_stylesheet(page, path):
+    """
+    Incrustar el CSS crítico de la página y cargar la hoja completa de forma asíncrona.
+    Si no existe CSS crítico generado, se usa un <link> normal.
+    """
+    url = static(path)
+    critical = _critical_css(page)
+    if not critical:
+        return format_html('<link rel="stylesheet" href="{}">', url)
+
+    return format_html(
+        '<style>{}</style>'
+        '<link rel="preload" href="{}" as="style" onload="this.onload=null;this.rel=\'stylesheet\'">'
+        '<noscript><link rel="stylesheet" href="{}"></noscript>',
+        mark_safe(critical), url, url
+    )
@@ -0,0 +1,139 @@
+"""
+Utilidades para los tests: presupuesto de consultas por vista.
+
+Un N+1 (una plantilla que lee `solicitud.perro`, una columna del admin que agrega
+por fila) no se nota con los datos de desarrollo. QueryBudgetMixin pide cada URL
+con pocos datos, multiplica los datos con `seed_synthetic` y la vuelve a pedir:
+el número de consultas no debe pasar del presupuesto ni crecer con las filas.
+Como los listados paginan y con la primera página llena el número ya no crece,
+tampoco puede repetirse la misma consulta (misma huella) más de `max_repetidas`
+veces.
+
+StateFilesTestRunner (TEST_RUNNER) lleva los ficheros SQLite de métricas,
+consultas lentas y circuitos, y la caché, a un directorio temporal: los tests no
+leen ni escriben los de /tmp que usa el sitio en marcha.
+"""
+import os
+import tempfile
+import threading
+from collections import Counter
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import CaptureQueriesContext
+
+from .slow_queries import fingerprint
+
+
+class StateFilesTestRunner(DiscoverRunner):
+    """DiscoverRunner con los ficheros de estado compartidos en un directorio temporal"""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        from donaciones.webpay_estado import circuito
+
+        from . import metrics, slow_queries
+
+        self._directorio = tempfile.TemporaryDirectory(prefix='protectora-tests-')
+        metricas = os.path.join(self._directorio.name, 'metricas.sqlite3')
+        circuitos = os.path.join(self._directorio.name, 'circuitos.sqlite3')
+        cache = {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.path.join(self._directorio.name, 'cache'),
+        }
+        self._settings = override_settings(
+            METRICS_STATE_FILE=metricas, WEBPAY_CIRCUIT_STATE_FILE=circuitos, CACHES={'default': cache},
+        )
+        self._settings.enable()
+        # Los almacenes se crean al importar con la ruta de settings: se redirigen y
+        # se descartan las conexiones que ya tuvieran abiertas
+        self._almacenes = []
+        for almacen, ruta in (
+            (metrics.shared, metricas), (slow_queries.slow_query_log, metricas), (circuito, circuitos),
+        ):
+            self._almacenes.append((almacen, almacen.path))
+            almacen.path = ruta
+            almacen._local = threading.local()
+
+    def teardown_test_environment(self, **kwargs):
+        from . import metrics, slow_queries
+
+        # Lo pendiente va al fichero temporal, no al del sitio al salir
+        metrics.shared.flush()
+        slow_queries.slow_query_log.flush()
+        for almacen, ruta in self._almacenes:
+            almacen.path = ruta
+            almacen._local = threading.local()
+        self._settings.disable()
+        self._directorio.cleanup()
+        super().teardown_test_environment(**kwargs)
+
+
+class QueryBudgetMixin:
+    """Para TestCase. Siembra datos sintéticos en setUpTestData y crea `cls.admin` (superusuario)"""
+
+    # Con 0.01: 10 perros, 30 solicitudes, 100 donaciones... Al volver a pedir la URL hay 5 veces más
+    escala = 0.01
+    crecimiento = 4
+    max_repetidas = 3
+
+    @classmethod
+    def setUpClass(cls):
+        # Sin collectstatic no hay manifiesto de whitenoise: {% static %} fallaría
+        cls.enterClassContext(override_settings(
+            STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage',
+        ))
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.sembrar(cls.escala)
+        cls.admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'admin')
+
+    @classmethod
+    def sembrar(cls, escala, semilla=42):
+        call_command('seed_synthetic', escala=escala, semilla=semilla, forzar=True, stdout=StringIO())
+
+    def assertQueryBudget(self, url, presupuesto, client=None):
+        """
+        Falla si `url` hace más de `presupuesto` consultas o si hace más con más
+        datos, listando el SQL de la petición
+        """
+        client = client or self.client
+        client.get(url)  # la primera petición puede crear la sesión, cargar ContentType...
+        antes = self._consultas(client, url)
+        # Los datos de más se deshacen al salir: varias llamadas en un test (subTest) parten de lo mismo
+        with transaction.atomic():
+            self.sembrar(self.escala * self.crecimiento, semilla=len(antes))
+            despues = self._consultas(client, url)
+            transaction.set_rollback(True)
+
+        repetidas = max(Counter(fingerprint(sql)[1] for sql in despues).values(), default=0)
+        if len(despues) > presupuesto or len(despues) > len(antes) or repetidas > self.max_repetidas:
+            self.fail(
+                f'{url}: {len(despues)} consultas (presupuesto {presupuesto}; '
+                f'{len(antes)} con {self.crecimiento + 1} veces menos datos; '
+                f'la más repetida, {repetidas} veces)\n' + self._listado(despues)
+            )
+
+    def _consultas(self, client, url):
+        with CaptureQueriesContext(connection) as capturadas:
+            response = client.get(url)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertLess(response.status_code, 400, f'{url} respondió {response.status_code}')
+        return [consulta['sql'] for consulta in capturadas.captured_queries]
+
+    def _listado(self, consultas):
+        # Las repetidas (misma huella) primero: son las candidatas a N+1
+        huellas = Counter(fingerprint(sql)[1] for sql in consultas)
+        lineas = [
+            f'  ×{veces} {sql[:300]}' for sql, veces in huellas.most_common() if veces > 1
+        ]
+        lineas += [f'  {numero}. {sql[:300]}' for numero, sql in enumerate(consultas, 1)]
+        return '\n'.join(lineas)
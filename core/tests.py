@@ -1,3 +1,600 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.db import OperationalError, connection
+from django.http import HttpResponse, StreamingHttpResponse
+from django.middleware.csrf import get_token
+from django.template.backends.django import DjangoTemplates
+from django.template.base import Node
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import resolve, reverse
+
+from donaciones.models import Donacion, TipoDonacion
+
+from . import compression, metrics, profiling, slow_queries
+from .slow_queries import SlowQueryLog, fingerprint
+from .template_backend import InstrumentedDjangoTemplates
+from .circuit_breaker import ABIERTO, CERRADO, SEMIABIERTO, CircuitBreaker
+from .exportar import EXPORTACIONES, generar_csv
+from .middleware import CompressionMiddleware, ProfilerMiddleware
+from .testing import QueryBudgetMixin
+
+
+class VistasPublicasQueryBudgetTests(QueryBudgetMixin, TestCase):
+    def test_home(self):
+        self.assertQueryBudget(reverse('core:home'), 8)
+
+    def test_about(self):
+        self.assertQueryBudget(reverse('core:about'), 2)
+
+    def test_voluntariado(self):
+        self.assertQueryBudget(reverse('core:voluntariado'), 1)
+
+
+class AdminQueryBudgetTests(QueryBudgetMixin, TestCase):
+    # Listado del admin de cada modelo registrado (app_label.model_name): presupuesto
+    PRESUPUESTOS = {
+        'auth.group': 6,
+        'auth.user': 7,
+        'core.informacionalbergue': 6,
+        'core.voluntario': 8,
+        'core.testimonio': 8,
+        'adopciones.perro': 8,
+        'adopciones.solicitudadopcion': 8,
+        'adopciones.filtroadopcion': 6,
+        'donaciones.tipodonacion': 6,
+        'donaciones.donacion': 9,
+        'donaciones.eventooutbox': 8,
+        'donaciones.aviso': 8,
+    }
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_portada(self):
+        self.assertQueryBudget(reverse('admin:index'), 7)
+
+    def test_listados(self):
+        for modelo in admin.site._registry:
+            clave = modelo._meta.label_lower
+            with self.subTest(modelo=clave):
+                self.assertIn(clave, self.PRESUPUESTOS, f'Falta el presupuesto de consultas del listado de {clave}')
+                url = reverse(f'admin:{modelo._meta.app_label}_{modelo._meta.model_name}_changelist')
+                self.assertQueryBudget(url, self.PRESUPUESTOS[clave])
+
+
+@override_settings(
+    USE_LOCAL_CSS=True, DEBUG=False,
+    STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage',
+    STATIC_ROOT='/nonexistent-static-root',
+)
+class CssLocalSinPublicarTests(TestCase):
+    """USE_LOCAL_CSS sin `build_css` + collectstatic: las páginas siguen con los CDN"""
+
+    def test_pagina_usa_cdn(self):
+        response = self.client.get(reverse('core:about'))
+        self.assertContains(response, 'https://cdn.tailwindcss.com')
+        self.assertNotContains(response, 'tailwind.min.css')
+
+    def test_service_worker_no_precarga_css_local(self):
+        response = self.client.get('/sw.js')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, 'tailwind.min.css')
+
+
+class CompressionMiddlewareTests(SimpleTestCase):
+    CUERPO = b'<p>Perro en adopcion</p>' * 200
+
+    def setUp(self):
+        compression.stats.reset()
+
+    def comprimir(self, accept, respuesta=None, csrf=False):
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING=accept)
+        respuesta = respuesta or HttpResponse(self.CUERPO)
+
+        def vista(request):
+            if csrf:
+                get_token(request)  # lo que hace {% csrf_token %} al renderizar un formulario
+            return respuesta
+
+        return CompressionMiddleware(vista)(request)
+
+    def contenido(self, response):
+        if not response.streaming:
+            return response.content
+        if response.is_async:
+            async def leer():
+                return b''.join([chunk async for chunk in response.streaming_content])
+            return async_to_sync(leer)()
+        return b''.join(response.streaming_content)
+
+    def test_gzip(self):
+        response = self.comprimir('gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), self.CUERPO)
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+    @unittest.skipUnless('zstd' in compression.ENCODERS, 'zstandard no instalado')
+    def test_zstd(self):
+        import zstandard
+
+        response = self.comprimir('gzip;q=0.5, zstd')
+        self.assertEqual(response['Content-Encoding'], 'zstd')
+        self.assertEqual(zstandard.ZstdDecompressor().decompressobj().decompress(response.content), self.CUERPO)
+
+    @unittest.skipUnless('br' in compression.ENCODERS, 'brotli no instalado')
+    def test_br_preferido(self):
+        import brotli
+
+        response = self.comprimir('gzip, zstd, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(response.content), self.CUERPO)
+
+    def test_identity(self):
+        for accept in ('', 'identity', 'gzip;q=0, identity', '*;q=0'):
+            with self.subTest(accept=accept):
+                response = self.comprimir(accept)
+                self.assertFalse(response.has_header('Content-Encoding'))
+                self.assertEqual(response.content, self.CUERPO)
+
+    def test_streaming_con_relleno(self):
+        async def bloques_async():
+            for _ in range(10):
+                yield self.CUERPO
+
+        for nombre, bloques in (('sync', lambda: iter([self.CUERPO] * 10)), ('async', bloques_async)):
+            with self.subTest(nombre):
+                compression.stats.reset()
+                response = self.comprimir('gzip', StreamingHttpResponse(bloques()), csrf=True)
+                self.assertEqual(response.is_async, nombre == 'async')
+                comprimido = self.contenido(response)
+                self.assertTrue(comprimido[3] & compression.GZIP_FNAME)
+                self.assertEqual(gzip.decompress(comprimido), self.CUERPO * 10)
+                (entrada,) = compression.stats.snapshot().values()
+                self.assertEqual(entrada['original'], len(self.CUERPO) * 10)
+                self.assertEqual(entrada['compressed'], len(comprimido))
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class CompressionCsrfTests(TestCase):
+    """Con toda la pila de MIDDLEWARE: una página con formulario sale en gzip con relleno (BREACH)"""
+
+    def test_formulario_gzip_con_relleno(self):
+        longitudes = set()
+        for _ in range(20):
+            response = self.client.get(reverse('core:voluntariado'), HTTP_ACCEPT_ENCODING='br, zstd, gzip')
+            self.assertIn('csrftoken', response.cookies)
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertTrue(response.content[3] & compression.GZIP_FNAME)
+            self.assertIn(b'csrfmiddlewaretoken', gzip.decompress(response.content))
+            longitudes.add(len(response.content))
+        self.assertGreater(len(longitudes), 1)
+
+    def test_formulario_sin_gzip_no_comprime(self):
+        response = self.client.get(reverse('core:voluntariado'), HTTP_ACCEPT_ENCODING='br, zstd')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertContains(response, 'csrfmiddlewaretoken')
+
+    @unittest.skipUnless('zstd' in compression.ENCODERS, 'zstandard no instalado')
+    def test_pagina_sin_formulario_negocia(self):
+        # La cookie csrftoken de una visita anterior no basta para forzar gzip
+        self.client.get(reverse('core:voluntariado'))
+        response = self.client.get(reverse('core:about'), HTTP_ACCEPT_ENCODING='gzip, zstd')
+        self.assertEqual(response['Content-Encoding'], 'zstd')
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class MensajesNoStoreTests(TestCase):
+    """Una página con mensajes flash no debe guardarse en el service worker ni en el navegador"""
+
+    def test_pagina_con_mensaje(self):
+        response = self.client.post(reverse('core:voluntariado'), {})
+        self.assertContains(response, 'Por favor corrige los errores')
+        self.assertIn('no-store', response['Cache-Control'])
+
+    def test_pagina_sin_mensajes(self):
+        response = self.client.get(reverse('adopciones:lista_perros'))
+        self.assertNotIn('no-store', response.get('Cache-Control', ''))
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.circuito = CircuitBreaker(
+            'prueba', os.path.join(directorio.name, 'circuitos.sqlite3'), failure_threshold=3, recovery_timeout=30,
+        )
+        self.ahora = 1_000_000.0
+        reloj = mock.patch('core.circuit_breaker.time.time', side_effect=lambda: self.ahora)
+        reloj.start()
+        self.addCleanup(reloj.stop)
+
+    def abrir(self):
+        for _ in range(3):
+            self.circuito.record_failure()
+
+    def estado(self):
+        return self.circuito.snapshot()['state']
+
+    def test_cerrado_a_abierto_tras_n_fallos(self):
+        self.circuito.record_failure()
+        self.circuito.record_failure()
+        self.assertEqual(self.estado(), CERRADO)
+        self.assertTrue(self.circuito.allow_request())
+        self.circuito.record_failure()
+        self.assertEqual(self.estado(), ABIERTO)
+        self.assertFalse(self.circuito.allow_request())
+        self.assertFalse(self.circuito.is_available())
+        self.assertEqual(self.circuito.retry_after(), 31)
+
+    def test_un_exito_reinicia_los_fallos_seguidos(self):
+        self.circuito.record_failure()
+        self.circuito.record_failure()
+        self.circuito.record_success()
+        self.circuito.record_failure()
+        self.circuito.record_failure()
+        self.assertEqual(self.estado(), CERRADO)
+
+    def test_abierto_a_semiabierto_tras_la_espera(self):
+        self.abrir()
+        self.ahora += 29
+        self.assertFalse(self.circuito.allow_request())
+        self.ahora += 2
+        self.assertTrue(self.circuito.is_available())
+        self.assertTrue(self.circuito.allow_request())
+        self.assertEqual(self.estado(), SEMIABIERTO)
+
+    def test_semiabierto_deja_pasar_un_solo_sondeo(self):
+        self.abrir()
+        self.ahora += 31
+        self.assertTrue(self.circuito.allow_request())
+        self.assertFalse(self.circuito.allow_request())
+        self.assertFalse(self.circuito.is_available())
+        # Un sondeo que no terminó (el worker murió) no bloquea para siempre
+        self.ahora += 31
+        self.assertTrue(self.circuito.allow_request())
+        self.assertFalse(self.circuito.allow_request())
+
+    def test_sondeo_con_exito_cierra(self):
+        self.abrir()
+        self.ahora += 31
+        self.circuito.allow_request()
+        self.circuito.record_success()
+        self.assertEqual(self.estado(), CERRADO)
+        self.assertTrue(self.circuito.allow_request())
+        self.assertTrue(self.circuito.allow_request())
+        self.assertEqual(
+            self.circuito.snapshot()['transitions'], {ABIERTO: 1, SEMIABIERTO: 1, CERRADO: 1},
+        )
+
+    def test_sondeo_fallido_vuelve_a_abrir(self):
+        self.abrir()
+        self.ahora += 31
+        self.circuito.allow_request()
+        self.circuito.record_failure()
+        self.assertEqual(self.estado(), ABIERTO)
+        self.assertFalse(self.circuito.allow_request())
+        self.assertEqual(self.circuito.retry_after(), 31)
+
+    def test_estado_compartido_entre_instancias(self):
+        otro = CircuitBreaker('prueba', self.circuito.path, failure_threshold=3, recovery_timeout=30)
+        self.abrir()
+        self.assertFalse(otro.allow_request())
+
+    def test_metodos_asincronos(self):
+        async def recorrido():
+            for _ in range(3):
+                await self.circuito.arecord_failure()
+            abierto = await self.circuito.aallow_request()
+            self.ahora += 31
+            disponible = await self.circuito.ais_available()
+            sondeo = await self.circuito.aallow_request()
+            await self.circuito.arecord_success()
+            return abierto, disponible, sondeo, await self.circuito.aretry_after()
+
+        self.assertEqual(async_to_sync(recorrido)(), (False, True, True, 0))
+        self.assertEqual(self.estado(), CERRADO)
+
+
+class ExportarCsvTests(TestCase):
+    def exportar(self, **campos):
+        tipo = TipoDonacion.objects.create(nombre='-General', descripcion='Donación general')
+        campos = {'nombre_donante': 'Ana', 'email_donante': 'ana@example.com', 'cantidad': 5000, **campos}
+        donacion = Donacion.objects.create(tipo_donacion=tipo, **campos)
+        contenido = b''.join(generar_csv(EXPORTACIONES['donaciones'], Donacion.objects.filter(pk=donacion.pk)))
+        cabecera, fila = csv.reader(io.StringIO(contenido.decode('utf-8-sig')))
+        return dict(zip(cabecera, fila))
+
+    def test_neutraliza_formulas(self):
+        fila = self.exportar(
+            nombre_donante='=HYPERLINK("http://example.com","Ver")', mensaje='@SUM(A1:A9)',
+            telefono_donante='+56 9 1234 5678', buy_order='\tDON-1',
+        )
+        self.assertEqual(fila['Nombre'], '\'=HYPERLINK("http://example.com","Ver")')
+        self.assertEqual(fila['Mensaje'], "'@SUM(A1:A9)")
+        self.assertEqual(fila['Teléfono'], "'+56 9 1234 5678")
+        self.assertEqual(fila['Orden de compra'], "'\tDON-1")
+        self.assertEqual(fila['Tipo de donación'], "'-General")
+
+    def test_no_toca_numeros_ni_texto_normal(self):
+        fila = self.exportar(mensaje='Para el refugio - gracias')
+        self.assertEqual(fila['Mensaje'], 'Para el refugio - gracias')
+        self.assertEqual(fila['Cantidad (CLP)'], '5000.00')
+        self.assertEqual(fila['Estado'], 'Pendiente')
+
+
+class VistaActualTests(SimpleTestCase):
+    def vista(self, path, resolver_match=None):
+        request = RequestFactory().get(path)
+        request.resolver_match = resolver_match
+        token = metrics.current_request.set(metrics.RequestMetrics(request))
+        try:
+            return metrics.current_view()
+        finally:
+            metrics.current_request.reset(token)
+
+    def test_sin_peticion(self):
+        self.assertEqual(metrics.current_view(), '')
+
+    def test_ruta_sin_resolver_no_crea_etiquetas_nuevas(self):
+        self.assertEqual(self.vista('/no-existe-1/'), 'sin_vista')
+        self.assertEqual(self.vista('/no-existe-2/?q=1'), 'sin_vista')
+
+    def test_ruta_resuelta(self):
+        self.assertEqual(self.vista('/', resolve('/')), 'core:home')
+
+
+class ProfilerTests(SimpleTestCase):
+    def test_solo_con_el_parametro_exacto(self):
+        middleware = ProfilerMiddleware(lambda request: HttpResponse())
+        for query, pedido in (
+            ('_perfilar=1', True), ('q=a&_perfilar=1', True), ('_perfilar=0', False),
+            ('q=_perfilar', False), ('no_perfilar=1', False), ('_perfilar_x=1', False),
+        ):
+            with self.subTest(query=query):
+                self.assertEqual(middleware._requested(RequestFactory().get(f'/?{query}')), pedido)
+
+    def test_restaura_el_intervalo_de_cambio_de_hilo(self):
+        intervalo = sys.getswitchinterval()
+        with self.assertRaises(ZeroDivisionError):
+            with profiling.Sampler(interval=0.001):
+                self.assertLess(sys.getswitchinterval(), intervalo)
+                1 / 0
+        self.assertEqual(sys.getswitchinterval(), intervalo)
+
+
+@override_settings(METRICS_TOKEN='token-de-prueba')
+class MetricasPrometheusTests(TestCase):
+    def pedir(self, **cabeceras):
+        return self.client.get(reverse('core:metrics'), **cabeceras)
+
+    def test_anonimo(self):
+        self.assertEqual(self.pedir().status_code, 403)
+
+    def test_token_incorrecto(self):
+        for autorizacion in ('Bearer otro-token', 'token-de-prueba', 'Bearer token-de-prueba-x', 'Basic dG9rZW4='):
+            with self.subTest(autorizacion=autorizacion):
+                self.assertEqual(self.pedir(HTTP_AUTHORIZATION=autorizacion).status_code, 403)
+
+    @override_settings(METRICS_TOKEN='')
+    def test_sin_token_configurado_no_vale_ninguno(self):
+        self.assertEqual(self.pedir(HTTP_AUTHORIZATION='Bearer ').status_code, 403)
+
+    def test_usuario_sin_staff(self):
+        self.client.force_login(get_user_model().objects.create_user('ana', 'ana@example.com', 'x'))
+        self.assertEqual(self.pedir().status_code, 403)
+
+    def test_staff(self):
+        self.client.force_login(get_user_model().objects.create_user('equipo', 'equipo@example.com', 'x', is_staff=True))
+        response = self.pedir()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+
+    def test_token_valido(self):
+        metrics.shared.inc('protectora_db_lock_retries_total', metrics.format_labels(vista='prueba', nivel='sentencia'))
+        metrics.shared.flush()
+        response = self.pedir(HTTP_AUTHORIZATION='Bearer token-de-prueba')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'protectora_db_lock_retries_total{')
+
+
+class ConsultasLentasTests(TestCase):
+    sql = 'SELECT "donaciones_donacion"."id" FROM "donaciones_donacion" WHERE "donaciones_donacion"."cantidad" > %s'
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.registro = SlowQueryLog(
+            os.path.join(directorio.name, 'metricas.sqlite3'), threshold_ms=100,
+            tables=('donaciones_donacion',), flush_interval=3600,
+        )
+        silencio = mock.patch.object(slow_queries.logger, 'disabled', True)
+        silencio.start()
+        self.addCleanup(silencio.stop)
+
+    def ejecutar(self, segundos, sql=None, params=(1000,), ejecutar=None):
+        """Pasa una consulta real por el wrapper haciendo que dure `segundos`"""
+        def ejecutar_real(sql, params, many, context):
+            # Cursor del driver: los demás wrappers también usan time.perf_counter
+            connection.ensure_connection()
+            cursor = connection.create_cursor()
+            try:
+                return cursor.execute(sql, params).fetchall()
+            finally:
+                cursor.close()
+
+        with mock.patch('core.slow_queries.time.perf_counter', side_effect=[0.0, segundos]):
+            return self.registro.execute_wrapper(
+                ejecutar or ejecutar_real, sql or self.sql, params, False, {'connection': connection},
+            )
+
+    def filas_en_fichero(self):
+        return self.registro._connection().execute('SELECT COUNT(*) FROM slow_queries').fetchone()[0]
+
+    def test_huella_ignora_literales_y_longitud_de_in(self):
+        uno = fingerprint("SELECT * FROM t WHERE id IN (%s, %s) AND nombre = 'Luna' AND edad > 3")
+        otro = fingerprint("SELECT  *  FROM t WHERE id IN (%s, %s, %s, %s) AND nombre = 'O''Higgins' AND edad > 12")
+        self.assertEqual(uno, otro)
+        self.assertEqual(uno[1], 'SELECT * FROM t WHERE id IN (%s, ...) AND nombre = ? AND edad > ?')
+        self.assertNotEqual(uno[0], fingerprint('SELECT * FROM t WHERE id = %s')[0])
+
+    def test_umbral(self):
+        self.ejecutar(0.099)
+        self.assertEqual(self.registro.entries(), [])
+        self.ejecutar(0.1)
+        [entrada] = self.registro.entries()
+        self.assertEqual(entrada['duration_ms'], 100)
+        self.assertEqual(entrada['params'], 'int')
+        self.assertEqual(entrada['fingerprint'], fingerprint(self.sql)[0])
+        self.assertTrue(entrada['origin'].startswith('core/tests.py:'))
+
+    def test_no_registra_consultas_que_fallan(self):
+        def bloqueada(sql, params, many, context):
+            raise OperationalError('database is locked')
+
+        with self.assertRaises(OperationalError):
+            self.ejecutar(2.0, ejecutar=bloqueada)
+        self.assertEqual(self.registro.entries(), [])
+
+    def test_el_plan_se_guarda_una_vez_por_huella(self):
+        with mock.patch('core.slow_queries._explain', wraps=slow_queries._explain) as explain:
+            self.ejecutar(0.5)
+            self.ejecutar(0.5, params=(5,))
+        self.assertEqual(explain.call_count, 1)
+        entradas = self.registro.entries()
+        self.assertEqual(len(entradas), 2)
+        self.assertIn('SCAN', entradas[0]['plan'])
+        self.assertEqual(entradas[0]['full_scans'], 'donaciones_donacion')
+        self.assertEqual(self.registro.entries(full_scans_only=True), entradas)
+        [resumen] = self.registro.summary()
+        self.assertEqual(resumen['count'], 2)
+
+    def test_sin_plan_para_escrituras_de_insercion(self):
+        self.ejecutar(0.5, sql='INSERT INTO t (a) VALUES (%s)', ejecutar=lambda *args: None)
+        [entrada] = self.registro.entries()
+        self.assertIsNone(entrada['plan'])
+
+    def test_la_peticion_no_escribe_en_el_fichero(self):
+        self.ejecutar(0.5)
+        self.assertEqual(self.filas_en_fichero(), 0)
+        self.registro.flush()
+        self.assertEqual(self.filas_en_fichero(), 1)
+
+    def test_si_el_volcado_falla_se_reintenta(self):
+        self.ejecutar(0.5)
+        with mock.patch.object(self.registro, '_connection', side_effect=sqlite3.OperationalError('database is locked')):
+            self.registro.flush()
+        self.assertEqual(self.filas_en_fichero(), 0)
+        self.assertEqual(len(self.registro.entries()), 1)
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class MetricasNodosPlantillaTests(SimpleTestCase):
+    plantillas = {
+        'base.html': '<main>{% block content %}base{% endblock %}</main>',
+        'hija.html': (
+            '{% extends "base.html" %}{% load static %}'
+            '{% block content %}{% include "parcial.html" %} {% static "css/style.css" %}{% endblock %}'
+        ),
+        'parcial.html': 'hola {{ nombre }}',
+    }
+
+    def motor(self, backend=InstrumentedDjangoTemplates):
+        return backend({
+            'NAME': 'prueba', 'DIRS': [], 'APP_DIRS': False,
+            'OPTIONS': {'loaders': [('django.template.loaders.locmem.Loader', self.plantillas)]},
+        })
+
+    def renderizar(self, motor, request_metrics=None):
+        token = metrics.current_request.set(request_metrics)
+        try:
+            return motor.get_template('hija.html').render({'nombre': 'Ana'})
+        finally:
+            metrics.current_request.reset(token)
+
+    @override_settings(TEMPLATE_NODE_METRICS=True)
+    def test_mide_cada_nodo(self):
+        request_metrics = metrics.RequestMetrics()
+        html = self.renderizar(self.motor(), request_metrics)
+        self.assertEqual(html, '<main>hola Ana /static/css/style.css</main>')
+        self.assertEqual(
+            set(request_metrics.template_nodes),
+            {('hija.html', 'block content'), ('hija.html', 'include parcial.html'), ('hija.html', 'tag static')},
+        )
+        for renders, segundos in request_metrics.template_nodes.values():
+            self.assertEqual(renders, 1)
+            self.assertGreaterEqual(segundos, 0)
+        self.assertGreater(request_metrics.template_time, 0)
+
+    @override_settings(TEMPLATE_NODE_METRICS=True)
+    def test_fuera_de_una_peticion_no_mide(self):
+        self.assertEqual(self.renderizar(self.motor()), '<main>hola Ana /static/css/style.css</main>')
+
+    @override_settings(TEMPLATE_NODE_METRICS=False)
+    def test_desactivado_deja_los_nodos_intactos(self):
+        motor = self.motor()
+        request_metrics = metrics.RequestMetrics()
+        html = self.renderizar(motor, request_metrics)
+        self.assertEqual(html, self.motor(DjangoTemplates).get_template('hija.html').render({'nombre': 'Ana'}))
+        self.assertEqual(request_metrics.template_nodes, {})
+        for nombre in self.plantillas:
+            plantilla = motor.engine.get_template(nombre)
+            self.assertFalse(getattr(plantilla, '_node_metrics', False))
+            for nodo in plantilla.nodelist.get_nodes_by_type(Node):
+                self.assertNotIn('render', vars(nodo), f'{nombre}: {nodo!r}')
+
+
+class ServiceWorkerPrecacheTests(TestCase):
+    """La lista de precarga sale del manifiesto de collectstatic, no de una lista fija"""
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.static_root = directorio.name
+        manifiesto = {
+            'version': '1.1',
+            'paths': {
+                'css/style.css': 'css/style.1a2b3c.css',
+                'js/main.js': 'js/main.4d5e6f.js',
+                'img/logo-nuevo.svg': 'img/logo-nuevo.7a8b9c.svg',
+                'img/placeholder.txt': 'img/placeholder.0d1e2f.txt',
+                'vendor/fontawesome/css/all.css': 'vendor/fontawesome/css/all.3f4a5b.css',
+                'admin/css/base.css': 'admin/css/base.6c7d8e.css',
+            },
+        }
+        with open(os.path.join(self.static_root, 'staticfiles.json'), 'w') as f:
+            json.dump(manifiesto, f)
+
+    def service_worker(self):
+        with override_settings(
+            DEBUG=False, STATIC_ROOT=self.static_root,
+            STATICFILES_STORAGE='django.contrib.staticfiles.storage.ManifestStaticFilesStorage',
+        ):
+            response = self.client.get(reverse('core:service_worker'))
+        self.assertEqual(response.status_code, 200)
+        linea = next(l for l in response.content.decode().splitlines() if l.startswith('const PRECACHE_URLS'))
+        return json.loads(linea.split('=', 1)[1].strip().rstrip(';'))
+
+    def test_precarga_lo_publicado(self):
+        self.assertEqual(self.service_worker(), [
+            '/static/css/style.1a2b3c.css', '/static/img/logo-nuevo.7a8b9c.svg', '/static/js/main.4d5e6f.js',
+        ])
+
+    def test_entrada_que_falta_no_rompe_el_service_worker(self):
+        # USE_LOCAL_CSS con el CSS local fuera del manifiesto: se salta en lugar de dar un 500
+        with mock.patch('core.views.use_local_css', return_value=True), \
+                self.assertLogs('core.views', 'WARNING') as logs:
+            urls = self.service_worker()
+        self.assertEqual(len(urls), 3)
+        self.assertIn('css/build/tailwind.min.css', logs.output[0])
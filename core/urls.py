@@ -7,4 +7,6 @@ urlpatterns = [
     path('', views.home, name='home'),
     path('about/', views.about, name='about'),
     path('voluntariado/', views.voluntariado, name='voluntariado'),
+    path('sw.js', views.service_worker, name='service_worker'),
+    path('metrics/', views.metrics_prometheus, name='metrics'),
 ]
@@ -1,11 +1,29 @@
 from django.shortcuts import render, redirect
-from django.contrib import messages
+from django.contrib import admin, messages
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.template.loader import render_to_string
 from django.db.models import Count, Q, Sum
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.templatetags.static import static
+from django.views.decorators.cache import cache_control, never_cache
+from datetime import datetime, timezone as dt_timezone
+from fnmatch import fnmatch
+import hashlib
+import hmac
+import json
+import logging
+from . import metrics
+from .context_processors import LOCAL_CSS, use_local_css
+from .slow_queries import slow_query_log
 from .models import InformacionAlbergue, Voluntario, Testimonio
 from adopciones.models import Perro
 from donaciones.models import Aviso, Donacion
 from .forms import VoluntarioForm
 
+logger = logging.getLogger(__name__)
+
 def home(request):
     """Vista principal del sitio"""
     # Obtener perros destacados (disponibles)
@@ -71,3 +89,88 @@ def voluntariado(request):
     }
     
     return render(request, 'core/voluntariado.html', context)
+
+# Recursos estáticos que el service worker guarda al instalarse: los del sitio
+# que coinciden con estos patrones (ni el admin ni vendor/, que son mucho más)
+SW_PRECACHE_PATTERNS = ('css/*.css', 'js/*.js', 'img/*.png', 'img/*.jpg', 'img/*.svg', 'img/*.webp')
+
+
+def _sw_precache_paths():
+    """
+    Rutas a precargar sacadas del manifiesto de WhiteNoise (lo publicado con
+    collectstatic); sin manifiesto (DEBUG, tests) de los ficheros de STATICFILES_DIRS
+    """
+    paths = getattr(staticfiles_storage, 'hashed_files', None)
+    if not paths:
+        paths = [path for finder in finders.get_finders() for path, _ in finder.list(None)]
+    return sorted({
+        path for path in paths
+        if path not in LOCAL_CSS and any(fnmatch(path, pattern) for pattern in SW_PRECACHE_PATTERNS)
+    })
+
+@cache_control(no_cache=True, max_age=0)
+def service_worker(request):
+    """Service worker servido desde la raíz para controlar todo el sitio"""
+    paths = _sw_precache_paths()
+    if use_local_css():
+        paths += list(LOCAL_CSS)
+
+    # static() devuelve las URLs con hash del manifiesto de WhiteNoise; una entrada
+    # que falte (collectstatic a medias) se salta: cache.addAll fallaría entero con ella
+    precache_urls = []
+    for path in paths:
+        try:
+            precache_urls.append(static(path))
+        except ValueError:
+            logger.warning(f'{path} no está en el manifiesto de estáticos: el service worker no lo precarga')
+    version = hashlib.md5('\n'.join(precache_urls).encode()).hexdigest()[:12]
+
+    context = {
+        'version': version,
+        'precache_urls': json.dumps(precache_urls),
+        'static_url': settings.STATIC_URL,
+        'media_url': settings.MEDIA_URL,
+    }
+
+    # Sin request: no hace falta ejecutar los context processors (evita consultas)
+    content = render_to_string('core/sw.js', context)
+    response = HttpResponse(content, content_type='application/javascript')
+    response['Service-Worker-Allowed'] = '/'
+    return response
+
+
+@never_cache
+def metrics_prometheus(request):
+    """Métricas por vista de todos los workers en formato Prometheus (staff o token)"""
+    token = settings.METRICS_TOKEN
+    autorizacion = request.headers.get('Authorization', '')
+    con_token = bool(token) and hmac.compare_digest(autorizacion, f'Bearer {token}')
+    if not con_token and not request.user.is_staff:
+        return HttpResponseForbidden('Solo para el equipo\n', content_type='text/plain')
+    return HttpResponse(metrics.shared.prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def consultas_lentas(request):
+    """Últimas consultas lentas y su plan (se publica dentro del admin con admin_view)"""
+    if request.method == 'POST' and 'vaciar' in request.POST:
+        slow_query_log.clear()
+        messages.success(request, 'Registro de consultas lentas vaciado.')
+        return redirect('consultas_lentas')
+
+    huella = request.GET.get('huella', '')
+    solo_recorridos = bool(request.GET.get('recorridos'))
+    consultas = slow_query_log.entries(fingerprint=huella or None, full_scans_only=solo_recorridos)
+    resumen = [] if huella else slow_query_log.summary(full_scans_only=solo_recorridos)
+    for fila in consultas + resumen:
+        fila['fecha'] = datetime.fromtimestamp(fila.get('created') or fila['last'], tz=dt_timezone.utc)
+    context = {
+        **admin.site.each_context(request),
+        'title': 'Consultas lentas',
+        'umbral_ms': settings.SLOW_QUERY_MS,
+        'capacidad': settings.SLOW_QUERY_LOG_SIZE,
+        'huella': huella,
+        'solo_recorridos': solo_recorridos,
+        'resumen': resumen,
+        'consultas': consultas,
+    }
+    return render(request, 'admin/consultas_lentas.html', context)
@@ -0,0 +1,67 @@
+"""
+Calentamiento del worker: compilar las URL y las plantillas del proyecto al arrancar
+en vez de en las primeras peticiones que atiende.
+
+Lo llaman protectora_adan/wsgi.py y asgi.py, no AppConfig.ready: ready() se ejecuta
+también en cada `manage.py` y en los tests, que no necesitan importar todas las vistas
+ni compilar las plantillas. Con `gunicorn --preload` se hace una sola vez en el
+proceso maestro y los workers lo heredan al hacer fork.
+"""
+import logging
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.template import TemplateDoesNotExist, TemplateSyntaxError, engines
+from django.urls import URLResolver, get_resolver
+
+logger = logging.getLogger(__name__)
+
+
+def warm_up():
+    """Compilar URL y plantillas si WARMUP está activo; devuelve (urls, plantillas, segundos) o None"""
+    if not getattr(settings, 'WARMUP', True):
+        return None
+    inicio = time.perf_counter()
+    urls = compile_urls(get_resolver())
+    plantillas = load_templates()
+    segundos = time.perf_counter() - inicio
+    logger.info('Calentamiento: %d URL y %d plantillas en %.0f ms', urls, plantillas, segundos * 1000)
+    return urls, plantillas, segundos
+
+
+def compile_urls(resolver):
+    """
+    Importar los urls.py y las vistas, compilar la expresión de cada patrón y el índice
+    de reverse() de cada resolver (también los de un namespace, que Django deja para el
+    primer reverse que los usa)
+    """
+    resolver.reverse_dict
+    total = 0
+    for patron in resolver.url_patterns:
+        if isinstance(patron, URLResolver):
+            total += compile_urls(patron)
+        else:
+            patron.pattern.regex
+            total += 1
+    return total
+
+
+def load_templates():
+    """Cargar en la caché del loader las plantillas de los DIRS de cada motor (y sus {% load %})"""
+    total = 0
+    for engine in engines.all():
+        for directorio in getattr(engine, 'dirs', []):
+            directorio = Path(directorio)
+            for fichero in sorted(directorio.rglob('*')):
+                if fichero.suffix not in ('.html', '.txt'):
+                    continue
+                nombre = fichero.relative_to(directorio).as_posix()
+                try:
+                    engine.get_template(nombre)
+                except (TemplateDoesNotExist, TemplateSyntaxError) as e:
+                    # Que no impida arrancar: la vista que la use fallará igual que sin calentar
+                    logger.warning('Calentamiento: no se pudo compilar %s: %s', nombre, e)
+                    continue
+                total += 1
+    return total
@@ -1,10 +1,15 @@
 from django.contrib import admin
 from django.utils.html import format_html
 from django.utils.safestring import mark_safe
-from django.db.models import Sum, Count
+from django.db.models import Sum, Count, Q
 from django.urls import reverse
+from django.utils import timezone
 from datetime import datetime, timedelta
-from .models import TipoDonacion, Donacion, Aviso
+import json
+from core.contention import retry_transaction
+from core.exportar import ExportarMixin
+from .models import TipoDonacion, Donacion, EventoOutbox, Aviso
+from .outbox import registrar_donacion_completada
 
 @admin.register(TipoDonacion)
 class TipoDonacionAdmin(admin.ModelAdmin):
@@ -13,6 +18,14 @@ class TipoDonacionAdmin(admin.ModelAdmin):
     search_fields = ['nombre', 'descripcion']
     actions = ['activar_tipos', 'desactivar_tipos']
     
+    def get_queryset(self, request):
+        # Totales desde el resumen diario, en la misma consulta que los tipos
+        completadas = Q(resumenes_diarios__estado='completada')
+        return super().get_queryset(request).annotate(
+            num_completadas=Sum('resumenes_diarios__numero', filter=completadas),
+            total_completadas=Sum('resumenes_diarios__total', filter=completadas),
+        )
+    
     def precio_formateado(self, obj):
         return format_html(
             '<span style="font-weight: 500; color: #059669;">${} CLP</span>',
@@ -32,20 +45,22 @@ class TipoDonacionAdmin(admin.ModelAdmin):
     estado_badge.admin_order_field = 'activo'
     
     def donaciones_count(self, obj):
-        count = obj.donaciones.filter(estado='completada').count()
+        count = obj.num_completadas or 0
         return format_html(
             '<span style="font-weight: 500;">{} donacion{}</span>',
             count, 'es' if count != 1 else ''
         )
     donaciones_count.short_description = "Donaciones"
+    donaciones_count.admin_order_field = 'num_completadas'
     
     def total_recaudado(self, obj):
-        total = obj.donaciones.filter(estado='completada').aggregate(Sum('cantidad'))['cantidad__sum'] or 0
+        total = obj.total_completadas or 0
         return format_html(
             '<span style="font-weight: 500; color: #059669;">${}</span>',
             f"{total:,.0f}"
         )
     total_recaudado.short_description = "Total recaudado"
+    total_recaudado.admin_order_field = 'total_completadas'
     
     def activar_tipos(self, request, queryset):
         updated = queryset.update(activo=True)
@@ -58,12 +73,13 @@ class TipoDonacionAdmin(admin.ModelAdmin):
     desactivar_tipos.short_description = "❌ Desactivar tipos seleccionados"
 
 @admin.register(Donacion)
-class DonacionAdmin(admin.ModelAdmin):
+class DonacionAdmin(ExportarMixin, admin.ModelAdmin):
     list_display = ['donante_info', 'tipo_donacion', 'cantidad_formateada', 'estado_badge', 'pago_info', 'fecha_donacion']
     list_filter = ['estado', 'anonimo', 'fecha_donacion', 'tipo_donacion']
     search_fields = ['nombre_donante', 'email_donante', 'buy_order']
-    readonly_fields = ['fecha_donacion', 'buy_order', 'authorization_code']
-    actions = ['marcar_completada', 'marcar_cancelada', 'marcar_fallida']
+    readonly_fields = ['fecha_donacion', 'buy_order', 'authorization_code', 'respuesta_webpay_formateada']
+    actions = ['marcar_completada', 'marcar_cancelada', 'marcar_fallida', 'exportar_csv', 'exportar_xlsx']
+    exportacion = 'donaciones'
     list_per_page = 25
     date_hierarchy = 'fecha_donacion'
     
@@ -75,7 +91,7 @@ class DonacionAdmin(admin.ModelAdmin):
             'fields': ('tipo_donacion', 'cantidad', 'mensaje')
         }),
         ('💳 Información de Pago', {
-            'fields': ('buy_order', 'authorization_code'),
+            'fields': ('buy_order', 'authorization_code', 'respuesta_webpay_formateada'),
             'classes': ('collapse',)
         }),
         ('📋 Estado', {
@@ -83,6 +99,31 @@ class DonacionAdmin(admin.ModelAdmin):
         }),
     )
     
+    def get_queryset(self, request):
+        # La respuesta de WebPay solo se lee en el detalle (respuesta_webpay_formateada)
+        return super().get_queryset(request).defer('webpay_response')
+    
+    # El admin envuelve el alta, la edición y el borrado en transaction.atomic: dentro, un
+    # "database is locked" no se repite por sentencia (core.contention), así que se repite
+    # la vista entera como transacción más externa
+    def changeform_view(self, request, object_id=None, form_url='', extra_context=None):
+        return retry_transaction(
+            lambda: super(DonacionAdmin, self).changeform_view(request, object_id, form_url, extra_context)
+        )
+    
+    def delete_view(self, request, object_id, extra_context=None):
+        return retry_transaction(lambda: super(DonacionAdmin, self).delete_view(request, object_id, extra_context))
+    
+    def respuesta_webpay_formateada(self, obj):
+        respuesta = obj.respuesta_webpay()
+        if respuesta is None:
+            return "Sin respuesta de WebPay"
+        return format_html(
+            '<pre style="font-size: 12px; white-space: pre-wrap;">{}</pre>',
+            json.dumps(respuesta, indent=2, ensure_ascii=False)
+        )
+    respuesta_webpay_formateada.short_description = "Respuesta WebPay"
+    
     def donante_info(self, obj):
         nombre = obj.nombre_donante if not obj.anonimo else "Anónimo"
         icono = "🕶️" if obj.anonimo else "👤"
@@ -132,20 +173,62 @@ class DonacionAdmin(admin.ModelAdmin):
     pago_info.short_description = "Info. Pago"
     
     def marcar_completada(self, request, queryset):
-        updated = queryset.update(estado='completada')
+        # Solo las que cambian de estado generan recibo y aviso
+        def completar():
+            ids = list(queryset.exclude(estado='completada').values_list('pk', flat=True))
+            updated = Donacion.objects.filter(pk__in=ids).cambiar_estado('completada')
+            registrar_donacion_completada(ids)
+            return updated
+        updated = retry_transaction(completar)
         self.message_user(request, f'✅ {updated} donación(es) marcada(s) como completada(s).')
     marcar_completada.short_description = "✅ Marcar como completada"
     
     def marcar_cancelada(self, request, queryset):
-        updated = queryset.update(estado='cancelada')
+        updated = queryset.cambiar_estado('cancelada')
         self.message_user(request, f'❌ {updated} donación(es) cancelada(s).')
     marcar_cancelada.short_description = "❌ Marcar como cancelada"
     
     def marcar_fallida(self, request, queryset):
-        updated = queryset.update(estado='fallida')
+        updated = queryset.cambiar_estado('fallida')
         self.message_user(request, f'⚠️ {updated} donación(es) marcada(s) como fallida(s).')
     marcar_fallida.short_description = "⚠️ Marcar como fallida"
 
+@admin.register(EventoOutbox)
+class EventoOutboxAdmin(admin.ModelAdmin):
+    list_display = ['id', 'tipo', 'donacion', 'estado_badge', 'intentos', 'disponible_en', 'fecha_procesado']
+    list_filter = ['estado', 'tipo', 'fecha_creacion']
+    search_fields = ['donacion__email_donante', 'donacion__buy_order', 'ultimo_error']
+    list_select_related = ['donacion']
+    readonly_fields = [
+        'tipo', 'donacion', 'estado', 'intentos', 'disponible_en', 'reservado_por',
+        'ultimo_error', 'fecha_creacion', 'fecha_procesado',
+    ]
+    actions = ['reintentar_eventos']
+    date_hierarchy = 'fecha_creacion'
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def estado_badge(self, obj):
+        colors = {
+            'pendiente': '#f59e0b',
+            'procesado': '#10b981',
+            'fallido': '#ef4444'
+        }
+        return format_html(
+            '<span style="background: {}; color: white; padding: 4px 8px; border-radius: 12px; font-size: 12px; font-weight: 500;">{}</span>',
+            colors.get(obj.estado, '#6b7280'), obj.get_estado_display()
+        )
+    estado_badge.short_description = "Estado"
+    estado_badge.admin_order_field = 'estado'
+    
+    def reintentar_eventos(self, request, queryset):
+        updated = queryset.filter(estado='fallido').update(
+            estado='pendiente', intentos=0, disponible_en=timezone.now()
+        )
+        self.message_user(request, f'🔁 {updated} evento(s) fallido(s) vuelven a la cola.')
+    reintentar_eventos.short_description = "🔁 Reintentar eventos fallidos"
+
 @admin.register(Aviso)
 class AvisoAdmin(admin.ModelAdmin):
     list_display = ['titulo', 'tipo_badge', 'estado_badge', 'destacado_badge', 'fecha_info', 'imagen_preview']
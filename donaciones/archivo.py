@@ -0,0 +1,59 @@
+"""
+Compresión de las respuestas de WebPay archivadas (ver RespuestaWebpayArchivada).
+
+Se usa zstd si `zstandard` está instalado y zlib en caso contrario; cada blob
+guarda con qué códec se comprimió, así que se pueden mezclar ambos.
+
+Cada respuesta ocupa unos 300 bytes y casi todo son las mismas claves, así que
+ambos códecs parten de un diccionario prefijado con una respuesta típica (de
+~1.4x a ~3.4x). El diccionario forma parte del formato: no se modifica; si hace
+falta otro se añade como DICCIONARIO_2 con códecs nuevos ('zstd-d2', 'zlib-d2').
+"""
+import json
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - dependencia opcional
+    zstandard = None
+
+DICCIONARIO_1 = json.dumps({
+    'vci': 'TSY', 'amount': 10000, 'status': 'AUTHORIZED', 'buy_order': 'DON-', 'session_id': '',
+    'card_detail': {'card_number': ''}, 'accounting_date': '', 'transaction_date': '2026-01-01T00:00:00.000Z',
+    'authorization_code': '', 'payment_type_code': 'VN', 'response_code': 0,
+    'installments_amount': 0, 'installments_number': 0, 'balance': 0,
+}, separators=(',', ':')).encode()
+
+# Se comprime una sola vez y se lee muy poco: nivel alto
+NIVEL_ZSTD = 19
+NIVEL_ZLIB = 9
+
+
+def _diccionario_zstd():
+    return zstandard.ZstdCompressionDict(DICCIONARIO_1, dict_type=zstandard.DICT_TYPE_RAWCONTENT)
+
+
+def comprimir(respuesta):
+    """Devolver (códec, blob, tamaño original) de una respuesta JSON"""
+    datos = json.dumps(respuesta, separators=(',', ':'), ensure_ascii=False).encode()
+    if zstandard is not None:
+        compresor = zstandard.ZstdCompressor(
+            level=NIVEL_ZSTD, dict_data=_diccionario_zstd(), write_checksum=False, write_dict_id=False
+        )
+        return 'zstd-d1', compresor.compress(datos), len(datos)
+    compresor = zlib.compressobj(NIVEL_ZLIB, zdict=DICCIONARIO_1)
+    return 'zlib-d1', compresor.compress(datos) + compresor.flush(), len(datos)
+
+
+def descomprimir(codec, blob):
+    blob = bytes(blob)
+    if codec == 'zstd-d1':
+        if zstandard is None:
+            raise RuntimeError('La respuesta archivada está comprimida con zstd: instala zstandard para leerla')
+        datos = zstandard.ZstdDecompressor(dict_data=_diccionario_zstd()).decompress(blob)
+    elif codec == 'zlib-d1':
+        descompresor = zlib.decompressobj(zdict=DICCIONARIO_1)
+        datos = descompresor.decompress(blob) + descompresor.flush()
+    else:
+        raise ValueError(f'Códec de archivo desconocido: {codec}')
+    return json.loads(datos)
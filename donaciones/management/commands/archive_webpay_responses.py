@@ -0,0 +1,74 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from datetime import timedelta
+import time
+
+from donaciones.archivo import comprimir
+from donaciones.models import Donacion, RespuestaWebpayArchivada
+from donaciones.webpay_service import ESTADOS_FINALES
+
+
+class Command(BaseCommand):
+    help = (
+        'Mueve la respuesta de WebPay de las donaciones antiguas a una tabla aparte, '
+        'comprimida, para aligerar la tabla de donaciones'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=90, help='Días desde la donación para archivarla')
+        parser.add_argument('--batch-size', type=int, default=500, help='Donaciones archivadas por transacción')
+        parser.add_argument('--dry-run', action='store_true', help='Calcular el ahorro sin modificar la base de datos')
+
+    def handle(self, *args, **options):
+        limite = timezone.now() - timedelta(days=options['older_than'])
+        candidatas = Donacion.objects.filter(
+            estado__in=ESTADOS_FINALES,
+            fecha_donacion__lt=limite,
+            webpay_response__isnull=False,
+        ).order_by('pk')
+
+        archivadas = original = comprimido = 0
+        ultimo_pk = 0
+        inicio = time.monotonic()
+        while True:
+            # Paginación por clave: cada lote empieza donde terminó el anterior
+            lote = list(
+                candidatas.filter(pk__gt=ultimo_pk).values_list('pk', 'webpay_response')[:options['batch_size']]
+            )
+            if not lote:
+                break
+            ultimo_pk = lote[-1][0]
+
+            archivos = []
+            for pk, respuesta in lote:
+                codec, datos, tamano = comprimir(respuesta)
+                archivos.append(RespuestaWebpayArchivada(
+                    donacion_id=pk, codec=codec, datos=datos, tamano_original=tamano
+                ))
+                original += tamano
+                comprimido += len(datos)
+            archivadas += len(archivos)
+
+            if not options['dry_run']:
+                with transaction.atomic():
+                    RespuestaWebpayArchivada.objects.bulk_create(archivos)
+                    Donacion.objects.filter(pk__in=[pk for pk, _ in lote]).update(webpay_response=None)
+
+        if not archivadas:
+            self.stdout.write(self.style.SUCCESS('✅ No hay respuestas de WebPay que archivar'))
+            return
+
+        codec = archivos[0].codec
+        self.stdout.write(
+            f'{"Se archivarían" if options["dry_run"] else "Archivadas"} {archivadas} respuestas '
+            f'anteriores a {timezone.localtime(limite):%Y-%m-%d} en {time.monotonic() - inicio:.1f} s'
+        )
+        self.stdout.write(
+            f'  {original / 1024:.1f} KiB de JSON → {comprimido / 1024:.1f} KiB con {codec} '
+            f'({original / max(comprimido, 1):.1f}x)'
+        )
+        if not options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(
+                '✅ Listo. Ejecuta VACUUM (p. ej. `sqlite3 db.sqlite3 VACUUM`) para devolver el espacio al disco'
+            ))
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, Max, Min, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from datetime import date, datetime, time, timedelta
+
+from donaciones.models import Donacion, ResumenDiarioDonacion
+
+
+def fecha(valor):
+    return date.fromisoformat(valor)
+
+
+class Command(BaseCommand):
+    help = (
+        'Reconstruye ResumenDiarioDonacion a partir de las donaciones (carga inicial o '
+        'reparación); el resumen se mantiene solo al cambiar las donaciones'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', type=fecha, help='Primer día a reconstruir (AAAA-MM-DD); por defecto, todo')
+        parser.add_argument('--hasta', type=fecha, help='Último día a reconstruir (AAAA-MM-DD); por defecto, hoy')
+        parser.add_argument('--batch-size', type=int, default=500, help='Filas de resumen por INSERT')
+
+    def handle(self, *args, **options):
+        desde, hasta = options['desde'], options['hasta']
+        if desde and hasta and desde > hasta:
+            raise CommandError('--desde no puede ser posterior a --hasta')
+
+        donaciones = Donacion.objects.all()
+        resumenes = ResumenDiarioDonacion.objects.all()
+        # Los días son locales (TIME_ZONE): se filtra por el instante en que empiezan
+        if desde:
+            donaciones = donaciones.filter(fecha_donacion__gte=timezone.make_aware(datetime.combine(desde, time.min)))
+            resumenes = resumenes.filter(fecha__gte=desde)
+        if hasta:
+            siguiente = timezone.make_aware(datetime.combine(hasta + timedelta(days=1), time.min))
+            donaciones = donaciones.filter(fecha_donacion__lt=siguiente)
+            resumenes = resumenes.filter(fecha__lte=hasta)
+
+        grupos = (
+            donaciones.annotate(fecha=TruncDate('fecha_donacion'))
+            .values('fecha', 'tipo_donacion_id', 'estado')
+            .annotate(numero=Count('id'), total=Sum('cantidad'), minimo=Min('cantidad'), maximo=Max('cantidad'))
+            .order_by()
+        )
+
+        with transaction.atomic():
+            borradas, _ = resumenes.delete()
+            creadas = len(ResumenDiarioDonacion.objects.bulk_create(
+                (ResumenDiarioDonacion(**grupo) for grupo in grupos.iterator()),
+                batch_size=options['batch_size'],
+            ))
+
+        rango = f'desde {desde or "el inicio"} hasta {hasta or "hoy"}'
+        self.stdout.write(f'Días {rango}: {borradas} filas de resumen sustituidas por {creadas}')
+        self.stdout.write(self.style.SUCCESS('✅ Resumen diario reconstruido'))
@@ -0,0 +1,89 @@
+from django.core.management.base import BaseCommand
+import json
+import statistics
+import time
+import uuid
+
+import requests
+from transbank.common.headers_builder import HeadersBuilder
+from transbank.common.integration_type import IntegrationType
+from transbank.common.options import WebpayOptions
+
+from donaciones.webpay_client import TRANSACTIONS_ENDPOINT, WebPayClient
+from donaciones.webpay_config import WEBPAY_PLUS_COMMERCE_CODE, WEBPAY_PLUS_API_KEY
+from donaciones.webpay_standin import WebPayStandInServer, generate_self_signed_cert
+
+
+class Command(BaseCommand):
+    help = 'Compara la latencia de WebPay con conexión nueva por llamada vs. el cliente con pool (servidor HTTPS local)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--calls', type=int, default=200, help='Transacciones (create + commit) por variante')
+        parser.add_argument('--latency', type=float, default=0.0, help='Latencia simulada del servidor en segundos')
+
+    def handle(self, *args, **options):
+        certfile, keyfile = generate_self_signed_cert()
+        server = WebPayStandInServer(('127.0.0.1', 0), latency=options['latency'], certfile=certfile, keyfile=keyfile)
+        server.start_in_thread()
+
+        webpay_options = WebpayOptions(
+            commerce_code=WEBPAY_PLUS_COMMERCE_CODE,
+            api_key=WEBPAY_PLUS_API_KEY,
+            integration_type=IntegrationType.TEST
+        )
+        self.stdout.write(f'Servidor local: {server.base_url} ({options["calls"]} transacciones por variante)')
+
+        try:
+            sin_pool = self._run(self._sdk_style(server.base_url, webpay_options, certfile), options['calls'])
+            client = WebPayClient(webpay_options, host=server.base_url, verify=certfile)
+            con_pool = self._run(client, options['calls'])
+            client.close()
+        finally:
+            server.shutdown()
+
+        self._report('Conexión nueva (SDK)', sin_pool)
+        self._report('Cliente con pool', con_pool)
+
+        ahorro = statistics.median(sin_pool) - statistics.median(con_pool)
+        self.stdout.write(self.style.SUCCESS(f'✅ Ahorro por llamada (mediana): {ahorro * 1000:.2f} ms'))
+
+    def _run(self, client, calls):
+        samples = []
+        for _ in range(calls):
+            start = time.perf_counter()
+            response = client.create(f'BENCH-{uuid.uuid4().hex[:8]}', str(uuid.uuid4()), 10000, 'http://localhost/')
+            samples.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            client.commit(response['token'])
+            samples.append(time.perf_counter() - start)
+        return samples
+
+    def _sdk_style(self, host, webpay_options, certfile):
+        """Mismo patrón que RequestService del SDK: requests.post/put sin sesión"""
+        headers = HeadersBuilder.build(webpay_options)
+
+        class SdkStyleClient:
+            def create(self, buy_order, session_id, amount, return_url):
+                payload = json.dumps({
+                    'buy_order': buy_order, 'session_id': session_id,
+                    'amount': amount, 'return_url': return_url,
+                })
+                return requests.post(
+                    f'{host}{TRANSACTIONS_ENDPOINT}/', data=payload, headers=headers, verify=certfile
+                ).json()
+
+            def commit(self, token):
+                return requests.put(
+                    f'{host}{TRANSACTIONS_ENDPOINT}/{token}', data='{}', headers=headers, verify=certfile
+                ).json()
+
+        return SdkStyleClient()
+
+    def _report(self, label, samples):
+        ordered = sorted(samples)
+        p95 = ordered[int(len(ordered) * 0.95) - 1]
+        self.stdout.write(
+            f'  {label:<22} mediana {statistics.median(ordered) * 1000:7.2f} ms | '
+            f'p95 {p95 * 1000:7.2f} ms | media {statistics.mean(ordered) * 1000:7.2f} ms'
+        )
@@ -0,0 +1,265 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models.functions import ExtractMonth, ExtractYear, Lower, Trim
+from datetime import date
+from itertools import islice
+from pathlib import Path
+import csv
+import json
+import math
+import time
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - dependencia opcional
+    np = None
+
+from donaciones.models import Donacion, TipoDonacion
+
+PERCENTILES = (10, 25, 50, 75, 90, 99)
+# Histograma logarítmico de montos: cubos de ~0,5% de ancho entre 1 y 10^10 CLP,
+# percentiles con error relativo < 0,5% en memoria fija
+PASO_LOG = math.log(1.005)
+CUBOS = int(math.log(1e10) / PASO_LOG) + 1
+MAX_DONACIONES_POR_DONANTE = 20  # el último cubo del histograma es "20 o más"
+
+
+class Histograma:
+    """Número, suma, mínimo, máximo y percentiles aproximados de montos por grupo"""
+
+    def __init__(self, grupos):
+        self.grupos = list(grupos)
+        n = len(self.grupos)
+        self.cubos = np.zeros((n, CUBOS), dtype=np.int64)
+        self.suma_cubos = np.zeros((n, CUBOS))
+        self.numero = np.zeros(n, dtype=np.int64)
+        self.suma = np.zeros(n)
+        self.minimo = np.full(n, np.inf)
+        self.maximo = np.full(n, -np.inf)
+
+    def agregar(self, grupo, montos):
+        cubo = np.clip((np.log(np.maximum(montos, 1)) / PASO_LOG).astype(np.int64), 0, CUBOS - 1)
+        np.add.at(self.cubos, (grupo, cubo), 1)
+        np.add.at(self.suma_cubos, (grupo, cubo), montos)
+        self.numero += np.bincount(grupo, minlength=len(self.grupos))
+        self.suma += np.bincount(grupo, weights=montos, minlength=len(self.grupos))
+        np.minimum.at(self.minimo, grupo, montos)
+        np.maximum.at(self.maximo, grupo, montos)
+
+    def filas(self):
+        acumulado = np.cumsum(self.cubos, axis=1)
+        for i, nombre in enumerate(self.grupos):
+            n = int(self.numero[i])
+            if not n:
+                continue
+            fila = {
+                'grupo': nombre,
+                'donaciones': n,
+                'total': round(float(self.suma[i])),
+                'media': round(float(self.suma[i]) / n),
+                'minimo': round(float(self.minimo[i])),
+                'maximo': round(float(self.maximo[i])),
+            }
+            for p in PERCENTILES:
+                # Media de los montos del cubo: exacta si todos son iguales (montos sugeridos)
+                cubo = int(np.searchsorted(acumulado[i], math.ceil(p / 100 * n)))
+                fila[f'p{p}'] = round(self.suma_cubos[i, cubo] / self.cubos[i, cubo])
+            yield fila
+
+
+class Command(BaseCommand):
+    help = (
+        'Informe de donantes: recurrencia por email, cohortes mensuales, percentiles de '
+        'montos por tipo y donaciones anónimas frente a nominativas (requiere numpy)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output-dir', default='informes/donantes', help='Directorio de los informes')
+        parser.add_argument('--format', choices=['csv', 'json', 'ambos'], default='ambos')
+        parser.add_argument('--chunk-size', type=int, default=20000, help='Filas leídas y procesadas por lote')
+        parser.add_argument('--meses', type=int, default=24, help='Meses de seguimiento de cada cohorte')
+        parser.add_argument('--estado', default='completada', help='Estado de las donaciones analizadas')
+
+    def handle(self, *args, **options):
+        if np is None:
+            raise CommandError('Este comando necesita numpy: pip install numpy')
+
+        self.meses = options['meses']
+        tipos = dict(TipoDonacion.objects.values_list('id', 'nombre'))
+        self.indice_tipo = {tipo_id: i for i, tipo_id in enumerate(tipos)}
+        self.por_tipo = Histograma(tipos.values())
+        self.por_anonimato = Histograma(['nominativas', 'anónimas'])
+        self.cohortes = {}
+        self.donaciones_por_donante = np.zeros(MAX_DONACIONES_POR_DONANTE + 1, dtype=np.int64)
+        self.recurrentes = {'donaciones': 0, 'total': 0.0}
+        self.donantes_por_anonimato = np.zeros(3, dtype=np.int64)  # siempre nominativo, mixto, siempre anónimo
+
+        # Ordenadas por donante: las donaciones de cada email llegan juntas y basta con
+        # arrastrar entre lotes las del último donante, sin guardar estado por donante
+        filas = (
+            Donacion.objects.filter(estado=options['estado'])
+            .annotate(
+                email=Lower(Trim('email_donante')),
+                mes=ExtractYear('fecha_donacion') * 12 + ExtractMonth('fecha_donacion') - 1,
+            )
+            .order_by('email', 'fecha_donacion')
+            .values_list('email', 'mes', 'tipo_donacion_id', 'cantidad', 'anonimo')
+            .iterator(chunk_size=options['chunk_size'])
+        )
+
+        inicio = time.monotonic()
+        total = 0
+        arrastre = []
+        while True:
+            lote = list(islice(filas, options['chunk_size']))
+            final = not lote
+            lote = arrastre + lote
+            if not lote:
+                break
+            arrastre = self._procesar(lote, final)
+            total += len(lote) - len(arrastre)
+            if final:
+                break
+
+        if not total:
+            self.stdout.write(self.style.WARNING(f'No hay donaciones en estado {options["estado"]}'))
+            return
+
+        informe = self._informe(total, options['estado'])
+        salida = Path(options['output_dir'])
+        salida.mkdir(parents=True, exist_ok=True)
+        escritos = []
+        if options['format'] in ('json', 'ambos'):
+            ruta = salida / 'donantes.json'
+            ruta.write_text(json.dumps(informe, ensure_ascii=False, indent=2), encoding='utf-8')
+            escritos.append(ruta)
+        if options['format'] in ('csv', 'ambos'):
+            escritos += self._escribir_csv(salida, informe)
+
+        resumen = informe['recurrencia']
+        self.stdout.write(
+            f'{total} donaciones de {resumen["donantes"]} donantes analizadas en {time.monotonic() - inicio:.1f} s'
+        )
+        self.stdout.write(
+            f'  donantes recurrentes: {resumen["donantes_recurrentes"]} '
+            f'({resumen["tasa_recurrencia"]:.1%}), {resumen["porcentaje_total_recurrentes"]:.1%} de lo recaudado'
+        )
+        for ruta in escritos:
+            self.stdout.write(f'  {ruta}')
+        self.stdout.write(self.style.SUCCESS('✅ Informe generado'))
+
+    def _procesar(self, lote, final):
+        """Procesar el lote salvo el último donante (salvo en el último lote), que se devuelve"""
+        emails, meses, tipos, montos, anonimos = zip(*lote)
+        emails = np.array(emails, dtype=object)
+        nuevo_donante = np.empty(len(emails), dtype=bool)
+        nuevo_donante[0] = True
+        nuevo_donante[1:] = emails[1:] != emails[:-1]
+        corte = len(lote) if final else int(np.flatnonzero(nuevo_donante)[-1])
+        if not corte:
+            return lote  # un único donante ocupa todo el lote: esperar al siguiente
+        meses = np.array(meses[:corte], dtype=np.int64)
+        tipos = np.array([self.indice_tipo[tipo] for tipo in tipos[:corte]], dtype=np.int64)
+        montos = np.array(montos[:corte], dtype=float)
+        anonimos = np.array(anonimos[:corte], dtype=bool)
+        donante = np.cumsum(nuevo_donante[:corte]) - 1
+
+        self.por_tipo.agregar(tipos, montos)
+        self.por_anonimato.agregar(anonimos.astype(np.int64), montos)
+
+        # Recurrencia
+        por_donante = np.bincount(donante)
+        total_donante = np.bincount(donante, weights=montos)
+        self.donaciones_por_donante += np.bincount(
+            np.minimum(por_donante, MAX_DONACIONES_POR_DONANTE), minlength=MAX_DONACIONES_POR_DONANTE + 1
+        )
+        recurrente = por_donante > 1
+        self.recurrentes['donaciones'] += int(por_donante[recurrente].sum())
+        self.recurrentes['total'] += float(total_donante[recurrente].sum())
+        anonimas = np.bincount(donante, weights=anonimos)
+        self.donantes_por_anonimato += np.bincount(
+            np.where(anonimas == 0, 0, np.where(anonimas == por_donante, 2, 1)), minlength=3
+        )
+
+        # Cohortes: mes de la primera donación y meses activos desde entonces
+        primera = meses[np.flatnonzero(nuevo_donante[:corte])]
+        desfase = meses - primera[donante]
+        dentro = desfase <= self.meses
+        ancho = self.meses + 1
+        activos = np.unique(donante[dentro] * ancho + desfase[dentro])
+        cohorte = primera[activos // ancho]
+        valores, fila = np.unique(cohorte, return_inverse=True)
+        matriz = np.zeros((len(valores), ancho), dtype=np.int64)
+        np.add.at(matriz, (fila, activos % ancho), 1)
+        for valor, conteos in zip(valores.tolist(), matriz):
+            if valor in self.cohortes:
+                self.cohortes[valor] += conteos
+            else:
+                self.cohortes[valor] = conteos
+        return lote[corte:]
+
+    def _informe(self, total, estado):
+        donantes = int(self.donaciones_por_donante.sum())
+        recurrentes = int(self.donaciones_por_donante[2:].sum())
+        recaudado = float(self.por_tipo.suma.sum())
+        cohortes = []
+        for mes in sorted(self.cohortes):
+            conteos = self.cohortes[mes]
+            cohortes.append({
+                'cohorte': f'{date(mes // 12, mes % 12 + 1, 1):%Y-%m}',
+                'donantes': int(conteos[0]),
+                'retencion': [round(int(c) / int(conteos[0]), 4) for c in conteos[1:]],
+            })
+        return {
+            'estado': estado,
+            'donaciones': total,
+            'recurrencia': {
+                'donantes': donantes,
+                'donantes_recurrentes': recurrentes,
+                'tasa_recurrencia': recurrentes / donantes,
+                'porcentaje_total_recurrentes': self.recurrentes['total'] / recaudado if recaudado else 0,
+                'donaciones_por_donante': {
+                    (f'{n}+' if n == MAX_DONACIONES_POR_DONANTE else str(n)): int(c)
+                    for n, c in enumerate(self.donaciones_por_donante) if n and c
+                },
+            },
+            'cohortes': cohortes,
+            'percentiles_por_tipo': list(self.por_tipo.filas()),
+            'anonimato': {
+                'donaciones': list(self.por_anonimato.filas()),
+                'donantes': dict(zip(
+                    ['siempre nominativos', 'mixtos', 'siempre anónimos'],
+                    self.donantes_por_anonimato.tolist(),
+                )),
+            },
+        }
+
+    def _escribir_csv(self, salida, informe):
+        rutas = []
+
+        def escribir(nombre, cabecera, filas):
+            ruta = salida / nombre
+            with open(ruta, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(cabecera)
+                writer.writerows(filas)
+            rutas.append(ruta)
+
+        escribir(
+            'cohortes.csv',
+            ['cohorte', 'donantes'] + [f'mes_{i}' for i in range(1, self.meses + 1)],
+            ([c['cohorte'], c['donantes'], *c['retencion']] for c in informe['cohortes']),
+        )
+        columnas = ['grupo', 'donaciones', 'total', 'media', 'minimo', 'maximo'] + [f'p{p}' for p in PERCENTILES]
+        escribir(
+            'percentiles_por_tipo.csv', columnas,
+            ([fila[c] for c in columnas] for fila in informe['percentiles_por_tipo']),
+        )
+        escribir(
+            'anonimato.csv', columnas,
+            ([fila[c] for c in columnas] for fila in informe['anonimato']['donaciones']),
+        )
+        escribir(
+            'donaciones_por_donante.csv', ['donaciones', 'donantes'],
+            informe['recurrencia']['donaciones_por_donante'].items(),
+        )
+        return rutas
@@ -0,0 +1,168 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.urls import reverse
+import asyncio
+import os
+import re
+import socket
+import statistics
+import tempfile
+import threading
+import time
+
+import httpx
+import uvicorn
+from transbank.common.integration_type import IntegrationType
+from transbank.common.options import WebpayOptions
+
+from donaciones import webpay_client
+from donaciones.models import TipoDonacion
+from donaciones.webpay_config import WEBPAY_PLUS_COMMERCE_CODE, WEBPAY_PLUS_API_KEY
+from donaciones.webpay_standin import WebPayStandInServer
+from protectora_adan.asgi import application
+
+CSRF_INPUT_RE = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+
+
+class Command(BaseCommand):
+    help = (
+        'Prueba de carga del sitio servido por ASGI (uvicorn) con una pasarela WebPay local: '
+        'compara el rendimiento de una página con la pasarela inmediata y con la pasarela lenta'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--latency', type=float, default=3.0, help='Latencia simulada de la pasarela lenta en segundos')
+        parser.add_argument('--duration', type=float, default=5.0, help='Duración de cada fase en segundos')
+        parser.add_argument('--page-clients', type=int, default=8, help='Clientes concurrentes pidiendo la página')
+        parser.add_argument('--payment-rate', type=float, default=10.0, help='Donaciones iniciadas por segundo')
+        parser.add_argument('--page', default='/adopciones/', help='Ruta de la página a medir')
+
+    def handle(self, *args, **options):
+        # Base de datos de prueba en un fichero temporal (no se toca la base real)
+        test_db = os.path.join(tempfile.mkdtemp(prefix='loadtest-'), 'loadtest.sqlite3')
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = test_db
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        tipo = TipoDonacion.objects.create(nombre='Carga', descripcion='Prueba de carga', activo=True)
+
+        gateway = WebPayStandInServer(('127.0.0.1', 0))
+        gateway.start_in_thread()
+        server, base_url = self._start_asgi_server(gateway.base_url)
+
+        # Misma carga en ambas fases; solo cambia lo que tarda la pasarela en responder
+        try:
+            fast = asyncio.run(self._phase(base_url, options, tipo.id))
+            gateway.latency = options['latency']
+            slow = asyncio.run(self._phase(base_url, options, tipo.id))
+        finally:
+            server.should_exit = True
+            gateway.shutdown()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        self.stdout.write(
+            f'{options["page_clients"]} clientes en {options["page"]} y {options["payment_rate"]:.0f} donaciones/s, '
+            f'{options["duration"]:.0f} s por fase'
+        )
+        self._report('Pasarela inmediata', fast)
+        self._report(f'Pasarela a {options["latency"]:.1f} s', slow)
+
+        ratio = slow['page_rps'] / fast['page_rps'] if fast['page_rps'] else 0
+        style = self.style.SUCCESS if ratio >= 0.8 else self.style.WARNING
+        self.stdout.write(style(f'Rendimiento de la página con la pasarela lenta: {ratio:.0%} del original'))
+
+    def _start_asgi_server(self, gateway_url):
+        """Levantar uvicorn en un hilo, con el cliente WebPay asíncrono apuntando a la pasarela local"""
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        host, port = sock.getsockname()
+
+        loop = asyncio.new_event_loop()
+        options = WebpayOptions(
+            commerce_code=WEBPAY_PLUS_COMMERCE_CODE,
+            api_key=WEBPAY_PLUS_API_KEY,
+            integration_type=IntegrationType.TEST
+        )
+        webpay_client._async_clients[loop] = webpay_client.AsyncWebPayClient(
+            options, host=gateway_url, pool_size=1000
+        )
+
+        server = uvicorn.Server(uvicorn.Config(application, lifespan='off', log_level='warning'))
+
+        def run():
+            asyncio.set_event_loop(loop)
+            loop.run_until_complete(server.serve(sockets=[sock]))
+
+        threading.Thread(target=run, daemon=True).start()
+        while not server.started:
+            time.sleep(0.05)
+        return server, f'http://{host}:{port}'
+
+    async def _phase(self, base_url, options, tipo_id):
+        donar = reverse('donaciones:donar')
+        page_samples, payment_samples, errors = [], [], []
+        clients = [httpx.AsyncClient(base_url=base_url, timeout=30) for _ in range(options['page_clients'])]
+        payer = httpx.AsyncClient(
+            base_url=base_url, timeout=30, limits=httpx.Limits(max_connections=None, max_keepalive_connections=None)
+        )
+        form = await payer.get(donar)
+        token = CSRF_INPUT_RE.search(form.text).group(1)
+        deadline = time.perf_counter() + options['duration']
+
+        async def page_client(client):
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                response = await client.get(options['page'])
+                if response.status_code == 200:
+                    page_samples.append(time.perf_counter() - start)
+                else:
+                    errors.append(response.status_code)
+
+        async def payment():
+            start = time.perf_counter()
+            response = await payer.post(donar, data={
+                'csrfmiddlewaretoken': token,
+                'tipo_donacion': tipo_id,
+                'nombre_donante': 'Carga',
+                'email_donante': 'carga@example.com',
+                'cantidad': '5000',
+            })
+            if response.status_code == 302 and 'token_ws=' in response.headers['Location']:
+                payment_samples.append(time.perf_counter() - start)
+            else:
+                errors.append(response.status_code)
+
+        async def payment_arrivals():
+            # Lazo abierto: las donaciones llegan a ritmo fijo, sin esperar a que terminen las anteriores
+            pending = []
+            interval = 1 / options['payment_rate']
+            while time.perf_counter() < deadline:
+                pending.append(asyncio.create_task(payment()))
+                await asyncio.sleep(interval)
+            await asyncio.gather(*pending)
+
+        await asyncio.gather(payment_arrivals(), *(page_client(client) for client in clients))
+        for client in clients + [payer]:
+            await client.aclose()
+
+        return {
+            'page_rps': len(page_samples) / options['duration'],
+            'page': sorted(page_samples),
+            'payments': sorted(payment_samples),
+            'errors': errors,
+        }
+
+    def _report(self, label, result):
+        page = result['page']
+        line = f'  {label:<18} página {result["page_rps"]:7.1f} req/s'
+        if page:
+            line += (
+                f' | mediana {statistics.median(page) * 1000:6.1f} ms'
+                f' | p95 {page[int(len(page) * 0.95) - 1] * 1000:6.1f} ms'
+            )
+        if result['payments']:
+            line += (
+                f' | donaciones {len(result["payments"])}'
+                f' (mediana {statistics.median(result["payments"]):.2f} s)'
+            )
+        if result['errors']:
+            line += f' | errores {len(result["errors"])}'
+        self.stdout.write(line)
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+from collections import Counter
+import time
+
+from donaciones.outbox import procesar_lote, reservar_lote
+
+
+class Command(BaseCommand):
+    help = 'Procesa los eventos pendientes del outbox de donaciones (recibos y avisos por correo)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50, help='Eventos reservados por lote')
+        parser.add_argument(
+            '--max-attempts', type=int, default=8,
+            help='Intentos antes de marcar un evento como fallido',
+        )
+        parser.add_argument('--loop', action='store_true', help='Seguir esperando eventos nuevos (modo worker)')
+        parser.add_argument(
+            '--interval', type=float, default=5.0,
+            help='Segundos de espera cuando no hay eventos (con --loop)',
+        )
+
+    def handle(self, *args, **options):
+        resumen = Counter()
+        inicio = time.monotonic()
+        try:
+            while True:
+                eventos = reservar_lote(options['batch_size'])
+                if eventos:
+                    resumen.update(procesar_lote(eventos, options['max_attempts']))
+                    continue
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+
+        duracion = time.monotonic() - inicio
+        total = sum(resumen.values())
+        if not total:
+            self.stdout.write(self.style.SUCCESS('✅ No hay eventos pendientes'))
+            return
+        self.stdout.write('Resumen:')
+        for clave in ('procesados', 'reintentos', 'fallidos'):
+            if resumen[clave]:
+                self.stdout.write(f'  {clave:<12} {resumen[clave]:>6}')
+        self.stdout.write(f'  {"total":<12} {total:>6} en {duracion:.1f} s')
+        if resumen['fallidos']:
+            self.stdout.write(self.style.WARNING(
+                f'⚠️ {resumen["fallidos"]} eventos agotaron sus intentos; revísalos en el admin'
+            ))
@@ -0,0 +1,156 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
+import threading
+import time
+
+from transbank.error.transaction_status_error import TransactionStatusError
+
+from core.contention import retry_transaction
+from donaciones.models import Donacion
+from donaciones.outbox import registrar_donacion_completada
+from donaciones.webpay_client import get_webpay_client
+from donaciones.webpay_config import WEBPAY_SESSION_TIMEOUT
+from donaciones.webpay_service import estado_segun_status
+
+ESTADOS_PENDIENTES = ('pendiente', 'procesando')
+
+
+class RateLimiter:
+    """Reparte las llamadas a intervalos regulares entre todos los hilos"""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            slot = max(self._next, time.monotonic())
+            self._next = slot + self.interval
+        delay = slot - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+class Command(BaseCommand):
+    help = (
+        'Consulta en Transbank el estado de las donaciones pendientes abandonadas y las cierra '
+        '(completada, fallida o cancelada)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than', type=int, default=WEBPAY_SESSION_TIMEOUT * 3 // 60,
+            help='Minutos desde la creación para considerar una donación abandonada',
+        )
+        parser.add_argument('--workers', type=int, default=8, help='Consultas simultáneas a Transbank')
+        parser.add_argument('--rate', type=float, default=20.0, help='Máximo de consultas por segundo (0 = sin límite)')
+        parser.add_argument('--batch-size', type=int, default=200, help='Donaciones actualizadas por transacción')
+        parser.add_argument('--limit', type=int, default=None, help='Procesar como máximo N donaciones')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Consultar Transbank y mostrar el informe sin modificar la base de datos',
+        )
+
+    def handle(self, *args, **options):
+        limite = timezone.now() - timedelta(minutes=options['older_than'])
+        pendientes = Donacion.objects.filter(
+            estado__in=ESTADOS_PENDIENTES,
+            token_ws__isnull=False,
+            fecha_donacion__lt=limite,
+        ).exclude(token_ws='').order_by('fecha_donacion').values_list('pk', 'token_ws')
+        if options['limit']:
+            pendientes = pendientes[:options['limit']]
+        pendientes = list(pendientes)
+
+        if not pendientes:
+            self.stdout.write(self.style.SUCCESS('✅ No hay donaciones pendientes que conciliar'))
+            return
+
+        self.stdout.write(
+            f'Conciliando {len(pendientes)} donaciones anteriores a {timezone.localtime(limite):%Y-%m-%d %H:%M} '
+            f'({options["workers"]} hilos, {options["rate"] or "sin límite de"} consultas/s)'
+            + (' [simulación]' if options['dry_run'] else '')
+        )
+
+        client = get_webpay_client()
+        limiter = RateLimiter(options['rate'])
+        resumen = Counter()
+        lote = []
+        inicio = time.monotonic()
+
+        def consultar(token):
+            limiter.wait()
+            return client.status(token)
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            futures = {executor.submit(consultar, token): pk for pk, token in pendientes}
+            for future in as_completed(futures):
+                pk = futures[future]
+                try:
+                    response = future.result()
+                    estado = estado_segun_status(response)
+                except TransactionStatusError as e:
+                    if e.code != 422:
+                        resumen['errores'] += 1
+                        self.stderr.write(f'  Donación {pk}: {e.message}')
+                        continue
+                    # Token desconocido o caducado (Transbank solo lo consulta 7 días)
+                    response, estado = None, 'cancelada'
+                    resumen['token caducado'] += 1
+
+                lote.append((pk, estado, response))
+                if len(lote) >= options['batch_size']:
+                    self._guardar(lote, resumen, options['dry_run'])
+                    lote = []
+
+        self._guardar(lote, resumen, options['dry_run'])
+        self._report(resumen, len(pendientes), time.monotonic() - inicio, options['dry_run'])
+
+    def _guardar(self, lote, resumen, dry_run):
+        """Aplicar un lote en una sola transacción sin pisar donaciones confirmadas mientras tanto"""
+        if dry_run:
+            resumen.update(estado for _, estado, _ in lote)
+            return
+        ahora = timezone.now()
+
+        def guardar():
+            # Se repite entera tras "database is locked": el recuento solo cuenta si se confirma
+            cuenta = Counter()
+            completadas = []
+            for pk, estado, response in lote:
+                cambios = {}
+                if response is not None:
+                    cambios['webpay_response'] = response
+                if estado == 'completada':
+                    cambios['authorization_code'] = response.get('authorization_code', '')
+                    cambios['transaction_date'] = ahora
+                actualizadas = Donacion.objects.filter(pk=pk, estado__in=ESTADOS_PENDIENTES).cambiar_estado(
+                    estado, **cambios
+                )
+                cuenta[estado if actualizadas else 'sin cambios'] += 1
+                if actualizadas and estado == 'completada':
+                    completadas.append(pk)
+            registrar_donacion_completada(completadas)
+            return cuenta
+        resumen.update(retry_transaction(guardar))
+
+    def _report(self, resumen, total, duracion, dry_run):
+        self.stdout.write('')
+        self.stdout.write('Resumen' + (' (simulación, no se guardó nada)' if dry_run else '') + ':')
+        for clave in ('completada', 'fallida', 'cancelada', 'token caducado', 'sin cambios', 'errores'):
+            if resumen[clave]:
+                self.stdout.write(f'  {clave:<15} {resumen[clave]:>6}')
+        self.stdout.write(f'  {"total":<15} {total:>6} en {duracion:.1f} s ({total / duracion:.1f} por segundo)')
+
+        if resumen['errores']:
+            self.stdout.write(self.style.WARNING(
+                f'⚠️ {resumen["errores"]} consultas fallaron; se reintentarán en la próxima ejecución'
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS('✅ Conciliación terminada'))
@@ -0,0 +1,68 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from donaciones.webpay_config import WEBPAY_API_HOST
+from donaciones.webpay_standin import WebPayStandInServer
+
+
+def fraction(value):
+    value = float(value)
+    if not 0 <= value <= 1:
+        raise ValueError(value)
+    return value
+
+
+class Command(BaseCommand):
+    help = 'Servidor WebPay Plus local (create/commit/status y formulario de pago) para pruebas sin red'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8001)
+        parser.add_argument('--latency', type=float, default=0.0, help='Latencia media de la API en segundos')
+        parser.add_argument('--jitter', type=float, default=0.0, help='Desviación típica de la latencia en segundos')
+        parser.add_argument('--error-rate', type=fraction, default=0.0, help='Fracción de llamadas que fallan (0-1)')
+        parser.add_argument('--error-status', type=int, default=500, help='Código HTTP de las llamadas fallidas')
+        parser.add_argument('--reject-rate', type=fraction, default=0.0, help='Fracción de pagos rechazados (0-1)')
+        parser.add_argument(
+            '--abandon-rate', type=fraction, default=0.0,
+            help='Fracción de usuarios que anulan el pago en el formulario (0-1)',
+        )
+        parser.add_argument('--verbose', action='store_true', help='Registrar cada petición')
+
+    def handle(self, *args, **options):
+        try:
+            server = WebPayStandInServer(
+                (options['host'], options['port']),
+                latency=options['latency'],
+                jitter=options['jitter'],
+                error_rate=options['error_rate'],
+                error_status=options['error_status'],
+                reject_rate=options['reject_rate'],
+                abandon_rate=options['abandon_rate'],
+                verbose=options['verbose'],
+            )
+        except OSError as e:
+            raise CommandError(f'No se pudo abrir {options["host"]}:{options["port"]}: {e}')
+
+        self.stdout.write(self.style.SUCCESS(f'🧪 Servidor WebPay local en {server.base_url}'))
+        self.stdout.write(
+            f'  latencia {options["latency"]:.3f} s ± {options["jitter"]:.3f} | '
+            f'errores {options["error_rate"]:.0%} (HTTP {options["error_status"]}) | '
+            f'rechazos {options["reject_rate"]:.0%} | anulaciones {options["abandon_rate"]:.0%}'
+        )
+        if WEBPAY_API_HOST != server.base_url:
+            self.stdout.write(self.style.WARNING(
+                f'  Para usarlo, arranca el sitio con WEBPAY_API_HOST={server.base_url}'
+            ))
+        self.stdout.write('  Ctrl+C para terminar')
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+
+        self.stdout.write('')
+        self.stdout.write(f'Transacciones creadas: {len(server.transactions)}')
+        for key, count in sorted(server.stats.items()):
+            self.stdout.write(f'  {key:<24} {count:>7}')
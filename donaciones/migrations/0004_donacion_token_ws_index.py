@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-19 16:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('donaciones', '0003_alter_donacion_estado'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='donacion',
+            name='token_ws',
+            field=models.CharField(blank=True, db_index=True, help_text='Token de WebPay', max_length=200, null=True),
+        ),
+    ]
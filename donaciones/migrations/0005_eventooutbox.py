@@ -0,0 +1,35 @@
+# Generated by Django 4.2.7 on 2026-10-19 16:28
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('donaciones', '0004_donacion_token_ws_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventoOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('recibo_donante', 'Recibo al donante'), ('aviso_administradores', 'Aviso a administradores')], max_length=30)),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('procesado', 'Procesado'), ('fallido', 'Fallido')], default='pendiente', max_length=15)),
+                ('intentos', models.PositiveIntegerField(default=0)),
+                ('disponible_en', models.DateTimeField(help_text='No se procesa antes de esta fecha (reintentos y reservas)')),
+                ('reservado_por', models.CharField(blank=True, help_text='Worker que tiene reservado el evento', max_length=40)),
+                ('ultimo_error', models.TextField(blank=True)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_procesado', models.DateTimeField(blank=True, null=True)),
+                ('donacion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='eventos_outbox', to='donaciones.donacion')),
+            ],
+            options={
+                'verbose_name': 'Evento pendiente',
+                'verbose_name_plural': 'Eventos pendientes (outbox)',
+                'ordering': ['disponible_en', 'id'],
+                'indexes': [models.Index(fields=['estado', 'disponible_en'], name='outbox_pendientes_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-19 16:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('donaciones', '0005_eventooutbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RespuestaWebpayArchivada',
+            fields=[
+                ('donacion', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='respuesta_archivada', serialize=False, to='donaciones.donacion')),
+                ('codec', models.CharField(choices=[('zstd-d1', 'zstd + diccionario 1'), ('zlib-d1', 'zlib + diccionario 1')], max_length=10)),
+                ('datos', models.BinaryField()),
+                ('tamano_original', models.PositiveIntegerField(help_text='Bytes del JSON sin comprimir')),
+                ('fecha_archivado', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Respuesta WebPay archivada',
+                'verbose_name_plural': 'Respuestas WebPay archivadas',
+            },
+        ),
+    ]
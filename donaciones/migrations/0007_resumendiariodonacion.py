@@ -0,0 +1,62 @@
+# Generated by Django 4.2.7 on 2026-10-19 16:37
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, Sum
+from django.db.models.functions import TruncDate
+import django.db.models.deletion
+
+
+def crear_resumenes(apps, schema_editor):
+    """Resumir las donaciones existentes (lo mismo que backfill_donation_rollups)"""
+    Donacion = apps.get_model('donaciones', 'Donacion')
+    ResumenDiarioDonacion = apps.get_model('donaciones', 'ResumenDiarioDonacion')
+    grupos = (
+        Donacion.objects.annotate(fecha=TruncDate('fecha_donacion'))
+        .values('fecha', 'tipo_donacion_id', 'estado')
+        .annotate(numero=Count('id'), total=Sum('cantidad'), minimo=Min('cantidad'), maximo=Max('cantidad'))
+        .order_by()
+    )
+    ResumenDiarioDonacion.objects.bulk_create(
+        (ResumenDiarioDonacion(**grupo) for grupo in grupos.iterator()), batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('donaciones', '0006_respuestawebpayarchivada'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenDiarioDonacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('procesando', 'Procesando'), ('completada', 'Completada'), ('cancelada', 'Cancelada'), ('rechazada', 'Rechazada'), ('fallida', 'Fallida')], max_length=15)),
+                ('numero', models.IntegerField(default=0)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('minimo', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('maximo', models.DecimalField(decimal_places=2, max_digits=10)),
+            ],
+            options={
+                'verbose_name': 'Resumen diario de donaciones',
+                'verbose_name_plural': 'Resúmenes diarios de donaciones',
+                'ordering': ['-fecha'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='donacion',
+            index=models.Index(fields=['estado', 'fecha_donacion'], name='donacion_estado_fecha_idx'),
+        ),
+        migrations.AddField(
+            model_name='resumendiariodonacion',
+            name='tipo_donacion',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes_diarios', to='donaciones.tipodonacion'),
+        ),
+        migrations.AddConstraint(
+            model_name='resumendiariodonacion',
+            constraint=models.UniqueConstraint(fields=('fecha', 'tipo_donacion', 'estado'), name='resumen_diario_unico'),
+        ),
+        migrations.RunPython(crear_resumenes, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,18 @@
-from django.db import models
+from asgiref.sync import sync_to_async
+from datetime import datetime, time, timedelta
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Max, Min
+from django.db.models.functions import Greatest, Least
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from core.contention import retry_transaction
+
+from .archivo import descomprimir
+
+# Campos de una donación que determinan su fila en ResumenDiarioDonacion
+CAMPOS_RESUMEN = ('fecha_donacion', 'tipo_donacion_id', 'estado', 'cantidad')
 
 class TipoDonacion(models.Model):
     nombre = models.CharField(max_length=100)
@@ -14,6 +28,24 @@ class TipoDonacion(models.Model):
         verbose_name = "Tipo de donación"
         verbose_name_plural = "Tipos de donaciones"
 
+class DonacionQuerySet(models.QuerySet):
+    def cambiar_estado(self, estado, **cambios):
+        """
+        update(estado=...) que mantiene ResumenDiarioDonacion: lee antes el estado
+        que tenía cada fila (bloqueándolas donde haya SELECT ... FOR UPDATE).
+        Lee y después escribe: si otro escritor se adelanta, SQLite obliga a repetirla.
+        """
+        def cambiar():
+            filas = list(self.select_for_update().values_list('pk', *CAMPOS_RESUMEN))
+            if not filas:
+                return 0
+            actualizadas = self.model.objects.filter(pk__in=[fila[0] for fila in filas]).update(
+                estado=estado, **cambios
+            )
+            ResumenDiarioDonacion.objects.mover([fila[1:] for fila in filas], estado)
+            return actualizadas
+        return retry_transaction(cambiar, using=self.db)
+
 class Donacion(models.Model):
     ESTADO_CHOICES = [
         ('pendiente', 'Pendiente'),
@@ -35,21 +67,253 @@ class Donacion(models.Model):
     anonimo = models.BooleanField(default=False)
     
     # Campos para WebPay
-    token_ws = models.CharField(max_length=200, blank=True, null=True, help_text="Token de WebPay")
+    token_ws = models.CharField(max_length=200, blank=True, null=True, db_index=True, help_text="Token de WebPay")
     buy_order = models.CharField(max_length=100, blank=True, null=True, help_text="Orden de compra")
     session_id = models.CharField(max_length=100, blank=True, null=True, help_text="ID de sesión")
     webpay_response = models.JSONField(blank=True, null=True, help_text="Respuesta completa de WebPay")
     authorization_code = models.CharField(max_length=50, blank=True, null=True, help_text="Código de autorización")
     transaction_date = models.DateTimeField(blank=True, null=True, help_text="Fecha de transacción WebPay")
     
+    objects = DonacionQuerySet.as_manager()
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Fila del resumen diario en la que está la donación, para restarla si cambia
+        if all(campo in instance.__dict__ for campo in CAMPOS_RESUMEN):
+            instance._clave_resumen = instance.clave_resumen()
+        return instance
+    
+    def clave_resumen(self):
+        return tuple(getattr(self, campo) for campo in CAMPOS_RESUMEN)
+    
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and not {'fecha_donacion', 'tipo_donacion', 'estado', 'cantidad'} & set(update_fields):
+            return super().save(*args, **kwargs)
+
+        # La fila y el resumen van en una transacción: no la repite el execute_wrapper de
+        # core.contention, así que se repite entera tras "database is locked". Un intento
+        # fallido puede haber asignado la pk de un INSERT revertido: se vuelve al estado inicial.
+        pk, adding = self.pk, self._state.adding
+
+        def guardar():
+            self.pk, self._state.adding = pk, adding
+            anterior = None
+            if not adding:
+                anterior = getattr(self, '_clave_resumen', None)
+                if anterior is None:
+                    anterior = Donacion.objects.filter(pk=self.pk).values_list(*CAMPOS_RESUMEN).first()
+            super(Donacion, self).save(*args, **kwargs)
+            clave = self.clave_resumen()
+            if clave != anterior:
+                if anterior is not None:
+                    ResumenDiarioDonacion.objects.restar([anterior])
+                ResumenDiarioDonacion.objects.sumar([clave])
+            return clave
+        self._clave_resumen = retry_transaction(guardar)
+    
+    def delete(self, *args, **kwargs):
+        # El borrado y la resta del resumen (post_delete) son una transacción: se repite igual que save
+        return retry_transaction(lambda: super(Donacion, self).delete(*args, **kwargs))
+    
+    def cambiar_estado_si(self, desde, estado):
+        """
+        Pasar la donación de `desde` a `estado` solo si sigue en `desde` (UPDATE
+        condicional, sirve de reserva entre procesos). Devuelve True si cambió.
+        """
+        def cambiar():
+            cambiada = Donacion.objects.filter(pk=self.pk, estado=desde).update(estado=estado)
+            if cambiada:
+                ResumenDiarioDonacion.objects.mover(
+                    [(self.fecha_donacion, self.tipo_donacion_id, desde, self.cantidad)], estado
+                )
+            return cambiada
+        cambiada = retry_transaction(cambiar)
+        if cambiada:
+            self.estado = estado
+            self._clave_resumen = self.clave_resumen()
+        return bool(cambiada)
+    
+    async def acambiar_estado_si(self, desde, estado):
+        return await sync_to_async(self.cambiar_estado_si)(desde, estado)
+    
     def __str__(self):
         donante = "Anónimo" if self.anonimo else self.nombre_donante
         return f"Donación de {donante} - ${self.cantidad:,.0f} CLP"
     
+    def respuesta_webpay(self):
+        """Respuesta de WebPay, esté en la propia fila o ya archivada (puede costar una consulta)"""
+        if self.webpay_response is not None:
+            return self.webpay_response
+        try:
+            return self.respuesta_archivada.respuesta()
+        except RespuestaWebpayArchivada.DoesNotExist:
+            return None
+    
     class Meta:
         verbose_name = "Donación"
         verbose_name_plural = "Donaciones"
         ordering = ['-fecha_donacion']
+        indexes = [
+            # Conciliación de pendientes y recálculo de mínimos/máximos del resumen diario
+            models.Index(fields=['estado', 'fecha_donacion'], name='donacion_estado_fecha_idx'),
+        ]
+
+@receiver(post_delete, sender=Donacion)
+def restar_donacion_borrada(sender, instance, **kwargs):
+    ResumenDiarioDonacion.objects.restar([instance.clave_resumen()])
+
+class ResumenDiarioQuerySet(models.QuerySet):
+    """
+    Mantenimiento incremental del resumen. Las filas de entrada son tuplas
+    (fecha_donacion, tipo_donacion_id, estado, cantidad); llamar dentro de la
+    misma transacción que cambia las donaciones.
+    """
+    
+    def _agrupar(self, filas):
+        grupos = {}
+        for fecha_donacion, tipo_id, estado, cantidad in filas:
+            clave = (timezone.localdate(fecha_donacion), tipo_id, estado)
+            numero, total, minimo, maximo = grupos.get(clave, (0, 0, cantidad, cantidad))
+            grupos[clave] = (numero + 1, total + cantidad, min(minimo, cantidad), max(maximo, cantidad))
+        return grupos
+    
+    def sumar(self, filas):
+        for (fecha, tipo_id, estado), (numero, total, minimo, maximo) in self._agrupar(filas).items():
+            grupo = self.filter(fecha=fecha, tipo_donacion_id=tipo_id, estado=estado)
+            cambios = {
+                'numero': F('numero') + numero,
+                'total': F('total') + total,
+                'minimo': Least('minimo', minimo),
+                'maximo': Greatest('maximo', maximo),
+            }
+            if grupo.update(**cambios):
+                continue
+            try:
+                with transaction.atomic():
+                    self.create(
+                        fecha=fecha, tipo_donacion_id=tipo_id, estado=estado,
+                        numero=numero, total=total, minimo=minimo, maximo=maximo,
+                    )
+            except IntegrityError:
+                # Otra transacción creó la fila entre el UPDATE y el INSERT
+                grupo.update(**cambios)
+    
+    def restar(self, filas):
+        for (fecha, tipo_id, estado), (numero, total, minimo, maximo) in self._agrupar(filas).items():
+            grupo = self.filter(fecha=fecha, tipo_donacion_id=tipo_id, estado=estado)
+            grupo.update(numero=F('numero') - numero, total=F('total') - total)
+            actual = grupo.values_list('numero', 'minimo', 'maximo').first()
+            if actual is None:
+                continue
+            if actual[0] <= 0:
+                grupo.delete()
+            elif minimo <= actual[1] or maximo >= actual[2]:
+                # Se ha ido el mínimo o el máximo: recalcularlo con las donaciones de ese día
+                inicio = timezone.make_aware(datetime.combine(fecha, time.min))
+                grupo.update(**Donacion.objects.filter(
+                    tipo_donacion_id=tipo_id, estado=estado,
+                    fecha_donacion__gte=inicio, fecha_donacion__lt=inicio + timedelta(days=1),
+                ).aggregate(minimo=Min('cantidad'), maximo=Max('cantidad')))
+    
+    def mover(self, filas, estado):
+        """Pasar las filas a `estado` (las que ya estaban en él no cambian)"""
+        filas = [fila for fila in filas if fila[2] != estado]
+        self.restar(filas)
+        self.sumar([(fecha, tipo_id, estado, cantidad) for fecha, tipo_id, _, cantidad in filas])
+
+class ResumenDiarioDonacion(models.Model):
+    """
+    Número, total, mínimo y máximo de las donaciones de un día por tipo y estado.
+    Se mantiene al guardar, borrar o cambiar de estado donaciones; se reconstruye
+    con `manage.py backfill_donation_rollups`.
+    """
+    fecha = models.DateField()
+    tipo_donacion = models.ForeignKey(TipoDonacion, on_delete=models.CASCADE, related_name='resumenes_diarios')
+    estado = models.CharField(max_length=15, choices=Donacion.ESTADO_CHOICES)
+    numero = models.IntegerField(default=0)
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    minimo = models.DecimalField(max_digits=10, decimal_places=2)
+    maximo = models.DecimalField(max_digits=10, decimal_places=2)
+    
+    objects = ResumenDiarioQuerySet.as_manager()
+    
+    def __str__(self):
+        return f"{self.fecha:%d/%m/%Y} - {self.tipo_donacion_id} - {self.estado}: {self.numero}"
+    
+    class Meta:
+        verbose_name = "Resumen diario de donaciones"
+        verbose_name_plural = "Resúmenes diarios de donaciones"
+        ordering = ['-fecha']
+        constraints = [
+            models.UniqueConstraint(fields=['fecha', 'tipo_donacion', 'estado'], name='resumen_diario_unico'),
+        ]
+
+class RespuestaWebpayArchivada(models.Model):
+    """
+    Respuesta de WebPay de una donación antigua, comprimida fuera de la tabla de
+    donaciones (`manage.py archive_webpay_responses`). Solo se lee en auditorías.
+    """
+    CODEC_CHOICES = [
+        ('zstd-d1', 'zstd + diccionario 1'),
+        ('zlib-d1', 'zlib + diccionario 1'),
+    ]
+    
+    donacion = models.OneToOneField(
+        Donacion, on_delete=models.CASCADE, primary_key=True, related_name='respuesta_archivada'
+    )
+    codec = models.CharField(max_length=10, choices=CODEC_CHOICES)
+    datos = models.BinaryField()
+    tamano_original = models.PositiveIntegerField(help_text="Bytes del JSON sin comprimir")
+    fecha_archivado = models.DateTimeField(auto_now_add=True)
+    
+    def respuesta(self):
+        return descomprimir(self.codec, self.datos)
+    
+    def __str__(self):
+        return f"Respuesta WebPay archivada - donación {self.donacion_id}"
+    
+    class Meta:
+        verbose_name = "Respuesta WebPay archivada"
+        verbose_name_plural = "Respuestas WebPay archivadas"
+
+class EventoOutbox(models.Model):
+    """
+    Efecto secundario pendiente de una donación (recibo, aviso a administradores...).
+    Se escribe en la misma transacción que marca la donación como completada y lo
+    procesa después el comando `process_outbox`, fuera de la petición del donante.
+    """
+    TIPO_CHOICES = [
+        ('recibo_donante', 'Recibo al donante'),
+        ('aviso_administradores', 'Aviso a administradores'),
+    ]
+    ESTADO_CHOICES = [
+        ('pendiente', 'Pendiente'),
+        ('procesado', 'Procesado'),
+        ('fallido', 'Fallido'),
+    ]
+    
+    tipo = models.CharField(max_length=30, choices=TIPO_CHOICES)
+    donacion = models.ForeignKey(Donacion, on_delete=models.CASCADE, related_name='eventos_outbox')
+    estado = models.CharField(max_length=15, choices=ESTADO_CHOICES, default='pendiente')
+    intentos = models.PositiveIntegerField(default=0)
+    disponible_en = models.DateTimeField(help_text="No se procesa antes de esta fecha (reintentos y reservas)")
+    reservado_por = models.CharField(max_length=40, blank=True, help_text="Worker que tiene reservado el evento")
+    ultimo_error = models.TextField(blank=True)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_procesado = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"{self.get_tipo_display()} - donación {self.donacion_id}"
+    
+    class Meta:
+        verbose_name = "Evento pendiente"
+        verbose_name_plural = "Eventos pendientes (outbox)"
+        ordering = ['disponible_en', 'id']
+        indexes = [
+            models.Index(fields=['estado', 'disponible_en'], name='outbox_pendientes_idx'),
+        ]
 
 class Aviso(models.Model):
     TIPO_CHOICES = [
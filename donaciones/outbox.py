@@ -0,0 +1,166 @@
+"""
+Outbox transaccional de donaciones.
+
+`registrar_donacion_completada` se llama dentro de la transacción que marca la
+donación como completada: si esa transacción se revierte, los eventos también.
+El comando `process_outbox` reserva los eventos en lotes, ejecuta su manejador y
+reprograma los fallidos con backoff exponencial, de modo que recibos y avisos no
+añaden latencia a la vuelta del donante desde WebPay.
+
+La reserva de un evento dura RESERVA y se renueva justo antes de ejecutar su
+manejador: un lote lento (SMTP) no pierde los eventos que le quedan. Si aun así
+la reserva caducó y otro worker tomó el evento, este no lo ejecuta ni guarda su
+resultado (las escrituras finales filtran por `reservado_por`).
+"""
+import logging
+import random
+import uuid
+from datetime import timedelta
+
+from django.core import mail
+from django.db.models import F
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from core.contention import retry_transaction
+
+from .models import EventoOutbox
+
+logger = logging.getLogger(__name__)
+
+# Un evento por efecto secundario: al reintentar uno no se repiten los demás
+TIPOS_DONACION_COMPLETADA = ('recibo_donante', 'aviso_administradores')
+
+BACKOFF_BASE = 30  # segundos antes del primer reintento
+BACKOFF_MAX = 60 * 60  # tope entre reintentos
+RESERVA = timedelta(minutes=5)  # si el worker muere, el evento vuelve a estar disponible tras este tiempo
+
+
+def registrar_donacion_completada(donacion_ids):
+    """Crear los eventos de una o varias donaciones completadas (llamar dentro de transaction.atomic)"""
+    ahora = timezone.now()
+    EventoOutbox.objects.bulk_create([
+        EventoOutbox(tipo=tipo, donacion_id=donacion_id, disponible_en=ahora)
+        for donacion_id in donacion_ids
+        for tipo in TIPOS_DONACION_COMPLETADA
+    ])
+
+
+def enviar_recibo_donante(evento, connection):
+    donacion = evento.donacion
+    contexto = {'donacion': donacion}
+    mail.send_mail(
+        subject=f'Recibo de tu donación a Protectora Adán (${donacion.cantidad:,.0f} CLP)',
+        message=render_to_string('donaciones/email/recibo_donante.txt', contexto),
+        from_email=None,
+        recipient_list=[donacion.email_donante],
+        connection=connection,
+    )
+
+
+def avisar_administradores(evento, connection):
+    donacion = evento.donacion
+    mail.mail_admins(
+        subject=f'Nueva donación completada: ${donacion.cantidad:,.0f} CLP',
+        message=render_to_string('donaciones/email/aviso_administradores.txt', {'donacion': donacion}),
+        connection=connection,
+    )
+
+
+MANEJADORES = {
+    'recibo_donante': enviar_recibo_donante,
+    'aviso_administradores': avisar_administradores,
+}
+
+
+def backoff(intentos):
+    """Espera antes del siguiente intento: exponencial con ±20% de jitter para no sincronizar reintentos"""
+    espera = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (intentos - 1))
+    return timedelta(seconds=espera * random.uniform(0.8, 1.2))
+
+
+def reservar_lote(tamano):
+    """
+    Reservar hasta `tamano` eventos disponibles para este worker.
+
+    SQLite no tiene SELECT ... FOR UPDATE SKIP LOCKED: la reserva es un UPDATE
+    condicional que adelanta `disponible_en` y marca el worker, así dos workers
+    nunca procesan el mismo evento.
+    """
+    ahora = timezone.now()
+    worker = uuid.uuid4().hex
+    ids = list(
+        EventoOutbox.objects.filter(estado='pendiente', disponible_en__lte=ahora)
+        .order_by('disponible_en', 'id')
+        .values_list('id', flat=True)[:tamano]
+    )
+    if not ids:
+        return []
+    EventoOutbox.objects.filter(id__in=ids, estado='pendiente', disponible_en__lte=ahora).update(
+        disponible_en=ahora + RESERVA, reservado_por=worker
+    )
+    return list(
+        EventoOutbox.objects.filter(reservado_por=worker)
+        .select_related('donacion__tipo_donacion')
+        .defer('donacion__webpay_response')
+    )
+
+
+def renovar_reserva(evento):
+    """Alargar la reserva del evento antes de ejecutarlo; False si ya no es de este worker"""
+    return bool(
+        EventoOutbox.objects.filter(id=evento.id, estado='pendiente', reservado_por=evento.reservado_por)
+        .update(disponible_en=timezone.now() + RESERVA)
+    )
+
+
+def procesar_lote(eventos, max_intentos):
+    """Ejecutar los manejadores de un lote y guardar el resultado en una sola transacción"""
+    resultados = {'procesados': 0, 'reintentos': 0, 'fallidos': 0}
+    hechos, errores = [], []
+    # Una sola conexión SMTP para todo el lote; si no se puede abrir se reintenta el lote entero
+    connection = mail.get_connection()
+    try:
+        connection.open()
+    except Exception as e:
+        logger.warning(f"No se pudo abrir la conexión de correo: {e}")
+        errores = [(evento, e) for evento in eventos]
+    else:
+        try:
+            for evento in eventos:
+                if not renovar_reserva(evento):
+                    logger.warning(f"Evento {evento.id} ({evento.tipo}): la reserva caducó y es de otro worker")
+                    continue
+                try:
+                    MANEJADORES[evento.tipo](evento, connection)
+                    hechos.append(evento)
+                except Exception as e:
+                    logger.warning(f"Evento {evento.id} ({evento.tipo}) falló en el intento {evento.intentos + 1}: {e}")
+                    errores.append((evento, e))
+        finally:
+            connection.close()
+
+    ahora = timezone.now()
+
+    def guardar():
+        # Solo los eventos que siguen reservados por este worker: si otro los tomó, su resultado manda
+        guardados = dict.fromkeys(resultados, 0)
+        if hechos:
+            guardados['procesados'] = EventoOutbox.objects.filter(
+                id__in=[evento.id for evento in hechos], reservado_por=hechos[0].reservado_por
+            ).update(estado='procesado', fecha_procesado=ahora, reservado_por='', intentos=F('intentos') + 1)
+        for evento, error in errores:
+            intentos = evento.intentos + 1
+            agotado = intentos >= max_intentos
+            guardados['fallidos' if agotado else 'reintentos'] += EventoOutbox.objects.filter(
+                id=evento.id, reservado_por=evento.reservado_por
+            ).update(
+                estado='fallido' if agotado else 'pendiente',
+                intentos=intentos,
+                disponible_en=ahora if agotado else ahora + backoff(intentos),
+                reservado_por='',
+                ultimo_error=str(error)[:2000],
+            )
+        return guardados
+    resultados.update(retry_transaction(guardar))
+    return resultados
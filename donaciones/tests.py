@@ -1,3 +1,475 @@
-from django.test import TestCase
+import io
+import os
+import threading
+import time
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
 
-# Create your tests here.
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.management import call_command
+from django.core.cache import cache
+from django.db import OperationalError, connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from core.testing import QueryBudgetMixin
+
+from .archivo import comprimir
+from .management.commands.reconcile_donations import Command as ConciliarDonaciones
+from .models import Donacion, EventoOutbox, ResumenDiarioDonacion, RespuestaWebpayArchivada, TipoDonacion
+from . import outbox, webpay_client
+from .webpay_estado import circuito
+from .webpay_standin import WebPayStandInServer
+from .webpay_service import WebPayService
+
+
+class VistasDonacionQueryBudgetTests(QueryBudgetMixin, TestCase):
+    def test_donar(self):
+        self.assertQueryBudget(reverse('donaciones:donar'), 3)
+
+    def test_gracias(self):
+        donacion = Donacion.objects.filter(estado='completada').first()
+        self.assertQueryBudget(reverse('donaciones:gracias', args=[donacion.id]), 4)
+
+    def test_avisos(self):
+        self.assertQueryBudget(reverse('donaciones:avisos'), 2)
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class PasarelaNoDisponibleTests(TestCase):
+    def setUp(self):
+        circuito.reset()
+        self.addCleanup(circuito.reset)
+
+    def test_circuito_abierto_responde_503_sin_crear_donacion(self):
+        for _ in range(circuito.failure_threshold):
+            circuito.record_failure()
+        antes = Donacion.objects.count()
+        response = self.client.post(reverse('donaciones:donar'), {'nombre_donante': 'Ana'})
+        self.assertEqual(response.status_code, 503)
+        self.assertGreater(int(response['Retry-After']), 0)
+        self.assertEqual(Donacion.objects.count(), antes)
+
+
+class TransbankFalso:
+    """Cliente con la interfaz de webpay_client: cuenta los commit y tarda un poco en responder"""
+
+    def __init__(self, espera=0.3):
+        self.espera = espera
+        self.commits = 0
+        self._lock = threading.Lock()
+
+    def commit(self, token):
+        with self._lock:
+            self.commits += 1
+        time.sleep(self.espera)
+        return {'response_code': 0, 'status': 'AUTHORIZED', 'authorization_code': '1213', 'buy_order': token}
+
+
+def crear_donacion(token, **campos):
+    tipo = TipoDonacion.objects.create(nombre='General', descripcion='Donación general')
+    return Donacion.objects.create(
+        tipo_donacion=tipo, nombre_donante='Ana', email_donante='ana@example.com',
+        cantidad=5000, token_ws=token, **campos,
+    )
+
+
+class ConfirmacionIdempotenteTests(TransactionTestCase):
+    """Varias confirmaciones del mismo token (recargas, doble redirección) en hilos con su propia conexión"""
+
+    def setUp(self):
+        cache.clear()
+        self.transbank = TransbankFalso()
+        cliente = mock.patch('donaciones.webpay_service._cliente', return_value=self.transbank)
+        cliente.start()
+        self.addCleanup(cliente.stop)
+
+    def confirmar(self, token):
+        try:
+            return WebPayService().confirm_transaction(token)
+        finally:
+            connection.close()
+
+    def test_confirmaciones_concurrentes_y_posterior(self):
+        donacion = crear_donacion('tok-concurrente')
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            resultados = list(executor.map(self.confirmar, ['tok-concurrente'] * 4))
+        eventos = EventoOutbox.objects.filter(donacion=donacion).count()
+
+        posterior = WebPayService().confirm_transaction('tok-concurrente')
+
+        self.assertEqual(self.transbank.commits, 1)
+        self.assertTrue(all(resultado['success'] for resultado in resultados + [posterior]))
+        self.assertGreater(eventos, 0)
+        self.assertEqual(EventoOutbox.objects.filter(donacion=donacion).count(), eventos)
+        self.assertEqual(Donacion.objects.get(pk=donacion.pk).estado, 'completada')
+
+    def test_reintento_reutiliza_la_respuesta_de_commit(self):
+        donacion = crear_donacion('tok-reintento')
+        servicio = WebPayService()
+        with mock.patch.object(WebPayService, '_guardar_resultado', side_effect=RuntimeError('disco lleno')):
+            self.assertFalse(servicio.confirm_transaction('tok-reintento')['success'])
+        self.assertEqual(Donacion.objects.get(pk=donacion.pk).estado, 'pendiente')
+
+        self.assertTrue(WebPayService().confirm_transaction('tok-reintento')['success'])
+        self.assertEqual(self.transbank.commits, 1)
+
+    def test_repetir_con_respuesta_archivada(self):
+        respuesta = self.transbank.commit('tok-archivado')
+        donacion = crear_donacion('tok-archivado', estado='completada')
+        codec, datos, tamano = comprimir(respuesta)
+        RespuestaWebpayArchivada.objects.create(donacion=donacion, codec=codec, datos=datos, tamano_original=tamano)
+
+        resultado = WebPayService().confirm_transaction('tok-archivado')
+        self.assertTrue(resultado['success'])
+        self.assertEqual(resultado['response'], respuesta)
+
+
+class ConfirmacionConciliadaTests(TestCase):
+    """reconcile_donations cierra la donación mientras confirm_transaction espera a commit"""
+
+    def setUp(self):
+        cache.clear()
+
+    def confirmar_durante_conciliacion(self, estado_conciliado):
+        donacion = crear_donacion('tok-carrera')
+        transbank = TransbankFalso(espera=0)
+        respuesta = transbank.commit('tok-carrera')
+
+        def commit_lento(token):
+            ConciliarDonaciones()._guardar([(donacion.pk, estado_conciliado, respuesta)], Counter(), dry_run=False)
+            return respuesta
+
+        transbank.commit = commit_lento
+        with mock.patch('donaciones.webpay_service._cliente', return_value=transbank):
+            resultado = WebPayService().confirm_transaction('tok-carrera')
+        return donacion, resultado
+
+    def test_no_duplica_eventos_de_una_donacion_conciliada(self):
+        donacion, resultado = self.confirmar_durante_conciliacion('completada')
+        self.assertTrue(resultado['success'])
+        self.assertEqual(EventoOutbox.objects.filter(donacion=donacion).count(), 2)
+        self.assertEqual(
+            list(ResumenDiarioDonacion.objects.values_list('estado', 'numero')), [('completada', 1)],
+        )
+
+    def test_no_pisa_el_estado_conciliado(self):
+        donacion, resultado = self.confirmar_durante_conciliacion('fallida')
+        self.assertFalse(resultado['success'])
+        self.assertEqual(Donacion.objects.get(pk=donacion.pk).estado, 'fallida')
+        self.assertFalse(EventoOutbox.objects.filter(donacion=donacion).exists())
+        self.assertEqual(
+            list(ResumenDiarioDonacion.objects.values_list('estado', 'numero')), [('fallida', 1)],
+        )
+
+
+class ReintentoBloqueoTests(TransactionTestCase):
+    """Donacion.save()/delete() abren una transacción: tras "database is locked" se repite entera"""
+
+    def bloquear_una_vez(self, metodo):
+        original = getattr(ResumenDiarioDonacion.objects, metodo)
+        llamadas = []
+
+        def bloqueado(filas):
+            llamadas.append(filas)
+            if len(llamadas) == 1:
+                raise OperationalError('database is locked')
+            return original(filas)
+        return mock.patch.object(type(ResumenDiarioDonacion.objects), metodo, side_effect=bloqueado)
+
+    def setUp(self):
+        espera = mock.patch('core.contention.backoff', return_value=0)
+        espera.start()
+        self.addCleanup(espera.stop)
+
+    def test_alta_reintentada(self):
+        with self.bloquear_una_vez('sumar'):
+            donacion = crear_donacion('tok-bloqueo')
+        self.assertEqual(Donacion.objects.filter(pk=donacion.pk).count(), 1)
+        self.assertEqual(Donacion.objects.count(), 1)
+        self.assertEqual(list(ResumenDiarioDonacion.objects.values_list('estado', 'numero')), [('pendiente', 1)])
+
+    def test_borrado_reintentado(self):
+        donacion = crear_donacion('tok-bloqueo')
+        with self.bloquear_una_vez('restar'):
+            donacion.delete()
+        self.assertFalse(Donacion.objects.exists())
+        self.assertFalse(ResumenDiarioDonacion.objects.exists())
+
+    def test_lote_de_conciliacion_reintentado(self):
+        donacion = crear_donacion('tok-bloqueo', estado='procesando')
+        respuesta = TransbankFalso(espera=0).commit('tok-bloqueo')
+        registrar = outbox.registrar_donacion_completada
+        llamadas = []
+
+        def bloqueado(ids):
+            llamadas.append(ids)
+            if len(llamadas) == 1:
+                raise OperationalError('database is locked')
+            return registrar(ids)
+
+        resumen = Counter()
+        ruta = 'donaciones.management.commands.reconcile_donations.registrar_donacion_completada'
+        with mock.patch(ruta, side_effect=bloqueado):
+            ConciliarDonaciones()._guardar([(donacion.pk, 'completada', respuesta)], resumen, dry_run=False)
+        self.assertEqual(len(llamadas), 2)
+        self.assertEqual(resumen, Counter({'completada': 1}))
+        self.assertEqual(Donacion.objects.get(pk=donacion.pk).estado, 'completada')
+        self.assertEqual(EventoOutbox.objects.filter(donacion=donacion).count(), 2)
+
+    def test_edicion_en_el_admin_reintentada(self):
+        donacion = crear_donacion('tok-bloqueo')
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'x'))
+        datos = {
+            'nombre_donante': 'Ana', 'email_donante': 'ana@example.com', 'telefono_donante': '',
+            'tipo_donacion': donacion.tipo_donacion_id, 'cantidad': '5000', 'mensaje': '', 'estado': 'cancelada',
+        }
+        with self.bloquear_una_vez('restar'):
+            response = self.client.post(reverse('admin:donaciones_donacion_change', args=[donacion.pk]), datos)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Donacion.objects.get(pk=donacion.pk).estado, 'cancelada')
+        self.assertEqual(list(ResumenDiarioDonacion.objects.values_list('estado', 'numero')), [('cancelada', 1)])
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class VistasAsincronasWsgiTests(TestCase):
+    """
+    El cliente de tests, como WSGI, ejecuta las vistas async en un event loop por petición:
+    deben usar el cliente síncrono del proceso y no crear un httpx.AsyncClient cada vez
+    """
+
+    def setUp(self):
+        cache.clear()
+        circuito.reset()
+        self.addCleanup(circuito.reset)
+        pasarela = WebPayStandInServer(('127.0.0.1', 0))
+        pasarela.start_in_thread()
+        self.addCleanup(pasarela.server_close)
+        self.addCleanup(pasarela.shutdown)
+        self.pasarela = pasarela
+        cliente = webpay_client.WebPayClient(webpay_client._webpay_options(), host=pasarela.base_url, circuit=circuito)
+        self.addCleanup(cliente.close)
+        for nombre, valor in (('_client', cliente), ('_client_pid', os.getpid())):
+            parche = mock.patch.object(webpay_client, nombre, valor)
+            parche.start()
+            self.addCleanup(parche.stop)
+        sin_async = mock.patch.object(
+            webpay_client, 'AsyncWebPayClient', side_effect=AssertionError('AsyncClient por petición'),
+        )
+        sin_async.start()
+        self.addCleanup(sin_async.stop)
+
+    def test_donar_y_confirmar_con_el_cliente_del_proceso(self):
+        tipo = TipoDonacion.objects.create(nombre='General', descripcion='Donación general')
+        response = self.client.post(reverse('donaciones:donar'), {
+            'tipo_donacion': tipo.pk, 'nombre_donante': 'Ana', 'email_donante': 'ana@example.com',
+            'cantidad': '5000',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response['Location'].startswith(self.pasarela.base_url))
+        donacion = Donacion.objects.get()
+
+        response = self.client.get(reverse('donaciones:webpay_resultado'), {'token_ws': donacion.token_ws})
+        self.assertRedirects(response, reverse('donaciones:gracias', args=[donacion.pk]), fetch_redirect_response=False)
+        self.assertEqual(Donacion.objects.get().estado, 'completada')
+        self.assertEqual(self.pasarela.stats['create'], 1)
+        self.assertEqual(self.pasarela.stats['commit AUTHORIZED'], 1)
+
+
+@override_settings(
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend', ADMINS=[('Admin', 'admin@example.com')],
+)
+class OutboxTests(TestCase):
+    def setUp(self):
+        self.donacion = crear_donacion('tok-outbox', estado='completada')
+        outbox.registrar_donacion_completada([self.donacion.pk])
+
+    def eventos(self):
+        return EventoOutbox.objects.order_by('id')
+
+    def fallar(self, tipo, error=RuntimeError('SMTP 451')):
+        return mock.patch.dict(outbox.MANEJADORES, {tipo: mock.Mock(side_effect=error)})
+
+    def test_reserva_no_se_solapa(self):
+        primero = outbox.reservar_lote(1)
+        segundo = outbox.reservar_lote(10)
+        self.assertEqual(len(primero), 1)
+        self.assertEqual(len(segundo), 1)
+        self.assertNotEqual(primero[0].id, segundo[0].id)
+        self.assertNotEqual(primero[0].reservado_por, segundo[0].reservado_por)
+        self.assertGreater(primero[0].disponible_en, timezone.now())
+        self.assertEqual(outbox.reservar_lote(10), [])
+
+    def test_procesa_y_envia(self):
+        resultados = outbox.procesar_lote(outbox.reservar_lote(10), max_intentos=3)
+        self.assertEqual(resultados, {'procesados': 2, 'reintentos': 0, 'fallidos': 0})
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), ['admin@example.com', 'ana@example.com'])
+        self.assertEqual(set(self.eventos().values_list('estado', 'intentos', 'reservado_por')), {('procesado', 1, '')})
+
+    def test_fallo_reprograma_con_backoff(self):
+        with self.fallar('recibo_donante'):
+            antes = timezone.now()
+            resultados = outbox.procesar_lote(outbox.reservar_lote(10), max_intentos=3)
+        self.assertEqual(resultados, {'procesados': 1, 'reintentos': 1, 'fallidos': 0})
+        evento = self.eventos().get(tipo='recibo_donante')
+        self.assertEqual((evento.estado, evento.intentos, evento.reservado_por), ('pendiente', 1, ''))
+        self.assertEqual(evento.ultimo_error, 'SMTP 451')
+        espera = (evento.disponible_en - antes).total_seconds()
+        self.assertTrue(outbox.BACKOFF_BASE * 0.8 <= espera <= outbox.BACKOFF_BASE * 1.2 + 1, espera)
+        self.assertEqual(outbox.reservar_lote(10), [])
+
+    def test_backoff_exponencial_con_tope(self):
+        with mock.patch('donaciones.outbox.random.uniform', return_value=1):
+            self.assertEqual(outbox.backoff(1).total_seconds(), outbox.BACKOFF_BASE)
+            self.assertEqual(outbox.backoff(3).total_seconds(), outbox.BACKOFF_BASE * 4)
+            self.assertEqual(outbox.backoff(30).total_seconds(), outbox.BACKOFF_MAX)
+
+    def test_agota_los_intentos(self):
+        self.eventos().update(intentos=2)
+        with self.fallar('recibo_donante'), self.fallar('aviso_administradores'):
+            resultados = outbox.procesar_lote(outbox.reservar_lote(10), max_intentos=3)
+        self.assertEqual(resultados, {'procesados': 0, 'reintentos': 0, 'fallidos': 2})
+        self.assertEqual(set(self.eventos().values_list('estado', 'intentos')), {('fallido', 3)})
+        self.assertEqual(outbox.reservar_lote(10), [])
+
+    def test_sin_conexion_smtp_reintenta_el_lote(self):
+        conexion = mock.Mock()
+        conexion.open.side_effect = ConnectionRefusedError('SMTP caído')
+        with mock.patch('donaciones.outbox.mail.get_connection', return_value=conexion):
+            resultados = outbox.procesar_lote(outbox.reservar_lote(10), max_intentos=3)
+        self.assertEqual(resultados, {'procesados': 0, 'reintentos': 2, 'fallidos': 0})
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(set(self.eventos().values_list('estado', 'intentos')), {('pendiente', 1)})
+
+    def test_reserva_caducada_tomada_por_otro_worker(self):
+        lote = outbox.reservar_lote(10)
+        primero, segundo = lote
+        enviar = outbox.MANEJADORES[primero.tipo]
+
+        def lento(evento, connection):
+            # Mientras se envía el primero caducan las reservas y otro worker toma los dos eventos
+            EventoOutbox.objects.filter(id__in=[primero.id, segundo.id]).update(reservado_por='otro')
+            enviar(evento, connection)
+
+        with mock.patch.dict(outbox.MANEJADORES, {primero.tipo: lento}):
+            resultados = outbox.procesar_lote(lote, max_intentos=3)
+        self.assertEqual(resultados, {'procesados': 0, 'reintentos': 0, 'fallidos': 0})
+        self.assertEqual(len(mail.outbox), 1)  # el segundo ya no se envía
+        self.assertEqual(set(self.eventos().values_list('estado', 'reservado_por')), {('pendiente', 'otro')})
+
+    def test_renueva_la_reserva_antes_de_cada_evento(self):
+        lote = outbox.reservar_lote(10)
+        EventoOutbox.objects.update(disponible_en=timezone.now())  # a punto de caducar
+        vistos = []
+
+        def comprobar(evento, connection):
+            vistos.append(EventoOutbox.objects.get(id=evento.id).disponible_en)
+
+        with mock.patch.dict(outbox.MANEJADORES, {tipo: comprobar for tipo in outbox.TIPOS_DONACION_COMPLETADA}):
+            outbox.procesar_lote(lote, max_intentos=3)
+        limite = timezone.now() + outbox.RESERVA - timedelta(seconds=5)
+        self.assertEqual(len(vistos), 2)
+        self.assertTrue(all(disponible > limite for disponible in vistos))
+
+
+class ResumenDiarioTests(TestCase):
+    """El resumen mantenido al cambiar donaciones coincide con agregarlas desde cero"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.general = TipoDonacion.objects.create(nombre='General', descripcion='Donación general')
+        cls.alimento = TipoDonacion.objects.create(nombre='Alimento', descripcion='Alimento para perros')
+        ayer = timezone.now() - timedelta(days=1)
+        cls.donaciones = []
+        for tipo, cantidad, estado, fecha in (
+            (cls.general, 1000, 'completada', None), (cls.general, 5000, 'completada', None),
+            (cls.general, 20000, 'pendiente', None), (cls.alimento, 3000, 'completada', None),
+            (cls.general, 7000, 'completada', ayer),
+        ):
+            donacion = Donacion.objects.create(
+                tipo_donacion=tipo, nombre_donante='Ana', email_donante='ana@example.com',
+                cantidad=cantidad, estado=estado,
+            )
+            if fecha is not None:
+                donacion.fecha_donacion = fecha
+                donacion.save()
+            cls.donaciones.append(donacion)
+
+    def assertResumenCoincide(self):
+        esperado = {}
+        for fecha, tipo_id, estado, cantidad in Donacion.objects.values_list(
+            'fecha_donacion', 'tipo_donacion_id', 'estado', 'cantidad',
+        ):
+            clave = (timezone.localdate(fecha), tipo_id, estado)
+            numero, total, minimo, maximo = esperado.get(clave, (0, 0, cantidad, cantidad))
+            esperado[clave] = (numero + 1, total + cantidad, min(minimo, cantidad), max(maximo, cantidad))
+        resumen = {
+            (fecha, tipo_id, estado): (numero, total, minimo, maximo)
+            for fecha, tipo_id, estado, numero, total, minimo, maximo in ResumenDiarioDonacion.objects.values_list(
+                'fecha', 'tipo_donacion_id', 'estado', 'numero', 'total', 'minimo', 'maximo',
+            )
+        }
+        self.assertEqual(resumen, esperado)
+
+    def test_alta(self):
+        self.assertResumenCoincide()
+        self.assertEqual(ResumenDiarioDonacion.objects.count(), 4)
+
+    def test_cambio_de_estado_con_save(self):
+        donacion = Donacion.objects.get(pk=self.donaciones[2].pk)
+        donacion.estado = 'completada'
+        donacion.save()
+        self.assertResumenCoincide()
+
+    def test_cambio_de_estado_en_lote(self):
+        # Se va el mínimo y el máximo de las completadas de hoy: se recalculan
+        Donacion.objects.filter(pk__in=[self.donaciones[0].pk, self.donaciones[1].pk]).cambiar_estado('cancelada')
+        self.assertResumenCoincide()
+        Donacion.objects.filter(estado='cancelada').cambiar_estado('cancelada')  # sin cambios
+        self.assertResumenCoincide()
+
+    def test_accion_del_admin(self):
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'x'))
+        for accion, pks in (('marcar_fallida', [0, 4]), ('marcar_completada', [0, 2])):
+            response = self.client.post(reverse('admin:donaciones_donacion_changelist'), {
+                'action': accion, '_selected_action': [self.donaciones[i].pk for i in pks],
+            })
+            self.assertEqual(response.status_code, 302)
+            self.assertResumenCoincide()
+
+    def test_cambio_de_cantidad_y_fecha(self):
+        donacion = Donacion.objects.get(pk=self.donaciones[1].pk)
+        donacion.cantidad = 500
+        donacion.save()
+        self.assertResumenCoincide()
+        donacion.fecha_donacion -= timedelta(days=1)
+        donacion.save()
+        self.assertResumenCoincide()
+        # Instancia sin la clave del resumen en memoria (solo algunos campos cargados)
+        donacion = Donacion.objects.only('pk', 'cantidad').get(pk=self.donaciones[3].pk)
+        donacion.cantidad = 9000
+        donacion.save(update_fields=['cantidad'])
+        self.assertResumenCoincide()
+
+    def test_borrado(self):
+        Donacion.objects.get(pk=self.donaciones[0].pk).delete()
+        self.assertResumenCoincide()
+        Donacion.objects.filter(tipo_donacion=self.general).delete()
+        self.assertResumenCoincide()
+        self.assertEqual(ResumenDiarioDonacion.objects.count(), 1)
+
+    def test_backfill(self):
+        ResumenDiarioDonacion.objects.all().delete()
+        Donacion.objects.filter(pk=self.donaciones[0].pk).update(cantidad=123)  # sin pasar por save
+        call_command('backfill_donation_rollups', stdout=io.StringIO())
+        self.assertResumenCoincide()
+        hoy = timezone.localdate()
+        ResumenDiarioDonacion.objects.filter(fecha=hoy).update(numero=99)
+        call_command('backfill_donation_rollups', desde=hoy, stdout=io.StringIO())
+        self.assertResumenCoincide()
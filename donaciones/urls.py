@@ -10,4 +10,5 @@ urlpatterns = [
     path('webpay/resultado/', views.webpay_resultado, name='webpay_resultado'),
     path('webpay/error/', views.webpay_error, name='webpay_error'),
     path('webpay/test/', views.test_webpay_config, name='test_webpay'),
+    path('webpay/metricas/', views.webpay_metricas, name='webpay_metricas'),
 ]
@@ -1,41 +1,53 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
-from django.http import JsonResponse
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse
+from django.template.loader import render_to_string
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 from django.utils.decorators import method_decorator
 from django.views import View
 import json
 import logging
+import os
+from asgiref.sync import sync_to_async
+from core.context_processors import use_local_css
 from .models import TipoDonacion, Donacion, Aviso
 from .forms import DonacionForm
+from .webpay_estado import circuito, latencias
 from .webpay_service import WebPayService
 
 logger = logging.getLogger(__name__)
 
-def donar(request):
-    """Vista para realizar donaciones"""
-    tipos_donacion = TipoDonacion.objects.filter(activo=True)
+async def donar(request):
+    """
+    Vista para realizar donaciones.
     
+    Es asíncrona: servida por ASGI, la espera a Transbank no bloquea un worker.
+    El formulario y el render (que consultan la base de datos) van por sync_to_async.
+    Servida por WSGI usa el cliente WebPay síncrono del proceso (ver webpay_client).
+    """
     if request.method == 'POST':
         logger.info("=== INICIO PROCESO DONACIÓN ===")
         logger.info(f"POST data: {request.POST}")
         
+        # Con la pasarela caída no se valida el formulario ni se crea la donación
+        if not await WebPayService.apasarela_disponible():
+            return await _pasarela_no_disponible()
+        
         form = DonacionForm(request.POST)
-        if form.is_valid():
+        if await sync_to_async(form.is_valid)():
             logger.info("Formulario válido, procesando donación...")
             try:
-                donacion = form.save(commit=False)
-                donacion.estado = 'pendiente'
-                donacion.save()
+                donacion = await sync_to_async(_guardar_donacion_pendiente)(form)
                 
                 logger.info(f"Donación creada: ID {donacion.id}, Monto: ${donacion.cantidad}")
                 
-                # Inicializar servicio WebPay
-                webpay_service = WebPayService()
-                
                 # Crear transacción WebPay
-                result = webpay_service.create_transaction(donacion)
+                result = await WebPayService().acreate_transaction(
+                    donacion, asgi=isinstance(request, ASGIRequest)
+                )
                 logger.info(f"Resultado WebPay: {result}")
                 
                 if result['success']:
@@ -43,6 +55,10 @@ def donar(request):
                     webpay_url = f"{result['url']}?token_ws={result['token']}"
                     logger.info(f"Redirigiendo a WebPay: {webpay_url}")
                     return redirect(webpay_url)
+                elif result.get('circuito_abierto'):
+                    # Otra petición se adelantó con el sondeo de la pasarela
+                    await donacion.adelete()
+                    return await _pasarela_no_disponible()
                 else:
                     # Error al crear transacción
                     logger.error(f"Error al crear transacción WebPay: {result.get('error', 'Error desconocido')}")
@@ -50,7 +66,7 @@ def donar(request):
                         request, 
                         'Error al procesar el pago. Por favor, inténtalo de nuevo.'
                     )
-                    donacion.delete()  # Eliminar donación fallida
+                    await donacion.adelete()  # Eliminar donación fallida
             except Exception as e:
                 logger.error(f"Error en proceso de donación: {str(e)}")
                 import traceback
@@ -65,17 +81,36 @@ def donar(request):
     else:
         form = DonacionForm()
     
+    return await sync_to_async(_render_donar)(request, form)
+
+def _guardar_donacion_pendiente(form):
+    donacion = form.save(commit=False)
+    donacion.estado = 'pendiente'
+    donacion.save()
+    return donacion
+
+async def _pasarela_no_disponible():
+    """Respuesta inmediata con el circuito abierto: se renderiza sin request para no consultar la base de datos"""
+    retry_after = await WebPayService.areintentar_en()
+    html = render_to_string('donaciones/pasarela_no_disponible.html', {
+        'retry_after': retry_after,
+        'use_local_css': use_local_css(),
+    })
+    response = HttpResponse(html, status=503)
+    response['Retry-After'] = str(retry_after or 1)
+    return response
+
+def _render_donar(request, form):
     context = {
         'form': form,
-        'tipos_donacion': tipos_donacion,
+        'tipos_donacion': TipoDonacion.objects.filter(activo=True),
     }
-    
     return render(request, 'donaciones/donar.html', context)
 
 def gracias(request, donacion_id):
     """Vista de agradecimiento después de una donación"""
     try:
-        donacion = Donacion.objects.get(id=donacion_id)
+        donacion = Donacion.objects.defer('webpay_response').get(id=donacion_id)
     except Donacion.DoesNotExist:
         return redirect('donaciones:donar')
     
@@ -97,19 +132,16 @@ def avisos(request):
     
     return render(request, 'donaciones/avisos.html', context)
 
-def webpay_resultado(request):
-    """Vista para procesar el resultado de WebPay"""
+async def webpay_resultado(request):
+    """Vista para procesar el resultado de WebPay (asíncrona, ver donar)"""
     token_ws = request.GET.get('token_ws')
     
     if not token_ws:
         messages.error(request, 'Error en el proceso de pago.')
         return redirect('donaciones:donar')
     
-    # Inicializar servicio WebPay
-    webpay_service = WebPayService()
-    
     # Confirmar transacción
-    result = webpay_service.confirm_transaction(token_ws)
+    result = await WebPayService().aconfirm_transaction(token_ws, asgi=isinstance(request, ASGIRequest))
     
     if result['success']:
         donacion = result['donacion']
@@ -119,7 +151,13 @@ def webpay_resultado(request):
         )
         return redirect('donaciones:gracias', donacion_id=donacion.id)
     else:
-        if 'donacion' in result:
+        if result.get('en_proceso'):
+            messages.info(
+                request, 
+                'Tu pago se está procesando. Revisa el estado de tu donación en unos minutos.'
+            )
+            return redirect('donaciones:gracias', donacion_id=result['donacion'].id)
+        elif 'donacion' in result:
             donacion = result['donacion']
             messages.error(
                 request, 
@@ -172,3 +210,20 @@ def test_webpay_config(request):
         }
     
     return render(request, 'donaciones/test_webpay.html', context)
+
+@staff_member_required
+def webpay_metricas(request):
+    """Estado del circuito de WebPay y latencias de Transbank (percentiles de este worker)"""
+    latencias_ms = {}
+    for operacion, histograma in latencias.items():
+        latencias_ms[operacion] = {
+            'llamadas': histograma.count,
+            'p50': round(histograma.percentile(0.50) * 1000, 1),
+            'p95': round(histograma.percentile(0.95) * 1000, 1),
+            'p99': round(histograma.percentile(0.99) * 1000, 1),
+        }
+    return JsonResponse({
+        'circuito': circuito.snapshot(),
+        'latencias_ms': latencias_ms,
+        'pid': os.getpid(),
+    })
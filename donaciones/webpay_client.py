@@ -0,0 +1,261 @@
+"""
+Cliente HTTP compartido para la API REST de WebPay Plus.
+
+El SDK de Transbank usa `requests.post/put/get` sin sesión, por lo que cada llamada
+abre una conexión TLS nueva. Este cliente implementa las mismas operaciones
+(create/commit/status) sobre una `requests.Session` con pool de conexiones
+keep-alive, timeouts explícitos y registro de latencias.
+
+`AsyncWebPayClient` ofrece las mismas operaciones sobre `httpx.AsyncClient` para
+las vistas asíncronas servidas por ASGI, de modo que la espera a Transbank no
+ocupa un worker. Servidas por WSGI, las vistas async corren en un event loop nuevo
+por petición (async_to_sync): ahí `ThreadedWebPayClient` usa el cliente síncrono
+del proceso en un hilo, sin abrir un AsyncClient y una conexión TLS en cada petición.
+
+Importar este módulo carga el SDK, requests y httpx: las vistas solo lo importan
+al crear o confirmar una transacción (ver webpay_estado).
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+import weakref
+
+import httpx
+import requests
+from asgiref.sync import sync_to_async
+from requests.adapters import HTTPAdapter
+from transbank.common.api_constants import ApiConstants
+from transbank.common.headers_builder import HeadersBuilder
+from transbank.common.integration_type import IntegrationType, webpay_host
+from transbank.common.options import WebpayOptions
+from transbank.error.transaction_commit_error import TransactionCommitError
+from transbank.error.transaction_create_error import TransactionCreateError
+from transbank.error.transaction_status_error import TransactionStatusError
+
+from .webpay_config import (
+    WEBPAY_PLUS_COMMERCE_CODE,
+    WEBPAY_PLUS_API_KEY,
+    WEBPAY_PRODUCTION,
+    WEBPAY_API_HOST,
+    WEBPAY_POOL_SIZE,
+    WEBPAY_CONNECT_TIMEOUT,
+    WEBPAY_READ_TIMEOUT,
+    WEBPAY_CREATE_TIMEOUT,
+)
+from .webpay_estado import circuito, latencias
+
+TRANSACTIONS_ENDPOINT = ApiConstants.WEBPAY_ENDPOINT + '/transactions'
+
+
+def _record_outcome(circuit, status_code):
+    if circuit is None:
+        return
+    if status_code is None or status_code >= 500:
+        circuit.record_failure()
+    else:
+        circuit.record_success()
+
+
+async def _arecord_outcome(circuit, status_code):
+    """Como _record_outcome, sin bloquear el event loop mientras se escribe el circuito"""
+    if circuit is None:
+        return
+    if status_code is None or status_code >= 500:
+        await circuit.arecord_failure()
+    else:
+        await circuit.arecord_success()
+
+
+def _transaction_payload(buy_order, session_id, amount, return_url):
+    return {
+        'buy_order': buy_order,
+        'session_id': session_id,
+        'amount': amount,
+        'return_url': return_url,
+    }
+
+
+def _process_response(response, error_class):
+    """Mismo tratamiento de respuestas que RequestService del SDK (requests y httpx)"""
+    if not response.text:
+        return response.status_code
+    try:
+        body = response.json()
+    except ValueError:
+        raise error_class(response.text, response.status_code)
+    if response.status_code not in (200, 299):
+        message = body.get('error_message') or body.get('description') or response.text
+        raise error_class(message, response.status_code)
+    return body
+
+
+class WebPayClient:
+    """Cliente de WebPay Plus con la misma interfaz que Transaction del SDK"""
+
+    def __init__(self, options, host=None, pool_size=WEBPAY_POOL_SIZE, connect_timeout=WEBPAY_CONNECT_TIMEOUT,
+                 read_timeout=WEBPAY_READ_TIMEOUT, create_timeout=WEBPAY_CREATE_TIMEOUT, verify=True,
+                 circuit=None):
+        self.options = options
+        self.circuit = circuit
+        self.host = (host or webpay_host(options.integration_type)).rstrip('/')
+        self.timeouts = {
+            'create': (connect_timeout, create_timeout),
+            'commit': (connect_timeout, read_timeout),
+            'status': (connect_timeout, read_timeout),
+        }
+
+        # verify se pasa en cada petición: Session.verify lo ignora si existe REQUESTS_CA_BUNDLE
+        self.verify = verify
+        self.session = requests.Session()
+        self.session.headers.update(HeadersBuilder.build(options))
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=False, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def create(self, buy_order, session_id, amount, return_url):
+        payload = _transaction_payload(buy_order, session_id, amount, return_url)
+        return self._request('create', 'POST', f'{TRANSACTIONS_ENDPOINT}/', payload, TransactionCreateError)
+
+    def commit(self, token):
+        return self._request('commit', 'PUT', f'{TRANSACTIONS_ENDPOINT}/{token}', {}, TransactionCommitError)
+
+    def status(self, token):
+        return self._request('status', 'GET', f'{TRANSACTIONS_ENDPOINT}/{token}', None, TransactionStatusError)
+
+    def _request(self, operation, method, path, payload, error_class):
+        data = json.dumps(payload) if payload is not None else None
+        start = time.perf_counter()
+        status_code = None
+        try:
+            response = self.session.request(
+                method, self.host + path, data=data, timeout=self.timeouts[operation], verify=self.verify
+            )
+            status_code = response.status_code
+        except requests.RequestException as e:
+            raise error_class(f'Error de conexión con WebPay: {e}', 0)
+        finally:
+            latencias.observe(operation, time.perf_counter() - start)
+            _record_outcome(self.circuit, status_code)
+        return _process_response(response, error_class)
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncWebPayClient:
+    """Versión asíncrona de WebPayClient (create/commit/status con await)"""
+
+    def __init__(self, options, host=None, pool_size=WEBPAY_POOL_SIZE, connect_timeout=WEBPAY_CONNECT_TIMEOUT,
+                 read_timeout=WEBPAY_READ_TIMEOUT, create_timeout=WEBPAY_CREATE_TIMEOUT, verify=True,
+                 circuit=None):
+        self.options = options
+        self.circuit = circuit
+        self.host = (host or webpay_host(options.integration_type)).rstrip('/')
+        self.timeouts = {
+            'create': httpx.Timeout(create_timeout, connect=connect_timeout),
+            'commit': httpx.Timeout(read_timeout, connect=connect_timeout),
+            'status': httpx.Timeout(read_timeout, connect=connect_timeout),
+        }
+        self.client = httpx.AsyncClient(
+            base_url=self.host,
+            headers=HeadersBuilder.build(options),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            verify=verify,
+        )
+
+    async def create(self, buy_order, session_id, amount, return_url):
+        payload = _transaction_payload(buy_order, session_id, amount, return_url)
+        return await self._request('create', 'POST', f'{TRANSACTIONS_ENDPOINT}/', payload, TransactionCreateError)
+
+    async def commit(self, token):
+        return await self._request('commit', 'PUT', f'{TRANSACTIONS_ENDPOINT}/{token}', {}, TransactionCommitError)
+
+    async def status(self, token):
+        return await self._request('status', 'GET', f'{TRANSACTIONS_ENDPOINT}/{token}', None, TransactionStatusError)
+
+    async def _request(self, operation, method, path, payload, error_class):
+        content = json.dumps(payload) if payload is not None else None
+        start = time.perf_counter()
+        status_code = None
+        try:
+            response = await self.client.request(method, path, content=content, timeout=self.timeouts[operation])
+            status_code = response.status_code
+        except httpx.HTTPError as e:
+            raise error_class(f'Error de conexión con WebPay: {e}', 0)
+        finally:
+            latencias.observe(operation, time.perf_counter() - start)
+            await _arecord_outcome(self.circuit, status_code)
+        return _process_response(response, error_class)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+class ThreadedWebPayClient:
+    """Interfaz de AsyncWebPayClient sobre un WebPayClient (y su pool), llamado en un hilo aparte"""
+
+    def __init__(self, client):
+        self.client = client
+
+    async def create(self, buy_order, session_id, amount, return_url):
+        return await sync_to_async(self.client.create, thread_sensitive=False)(
+            buy_order, session_id, amount, return_url
+        )
+
+    async def commit(self, token):
+        return await sync_to_async(self.client.commit, thread_sensitive=False)(token)
+
+    async def status(self, token):
+        return await sync_to_async(self.client.status, thread_sensitive=False)(token)
+
+
+def _webpay_options():
+    integration_type = IntegrationType.LIVE if WEBPAY_PRODUCTION else IntegrationType.TEST
+    return WebpayOptions(
+        commerce_code=WEBPAY_PLUS_COMMERCE_CODE,
+        api_key=WEBPAY_PLUS_API_KEY,
+        integration_type=integration_type
+    )
+
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+# Un cliente asíncrono por event loop: las conexiones de httpx quedan ligadas al
+# loop que las abrió (runserver crea uno por petición, uvicorn uno por proceso)
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_webpay_client():
+    """
+    Cliente único por proceso. Se vuelve a crear tras un fork (workers de gunicorn)
+    para no compartir sockets entre procesos.
+    """
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                _client = WebPayClient(_webpay_options(), host=WEBPAY_API_HOST or None, circuit=circuito)
+                _client_pid = pid
+    return _client
+
+
+def get_async_webpay_client(asgi=True):
+    """
+    Cliente asíncrono compartido por el event loop en curso. Fuera de ASGI el loop
+    dura una petición: se usa el cliente síncrono del proceso (ThreadedWebPayClient).
+    """
+    if not asgi:
+        return ThreadedWebPayClient(get_webpay_client())
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = AsyncWebPayClient(
+            _webpay_options(), host=WEBPAY_API_HOST or None, circuit=circuito
+        )
+    return client
@@ -1,6 +1,9 @@
 """
 Configuración para WebPay de Transbank
 """
+import os
+import tempfile
+
 from decouple import config
 
 # Configuración de WebPay
@@ -15,5 +18,29 @@ WEBPAY_FINAL_URL = f"{BASE_URL}/donaciones/gracias/"
 # Configuración del entorno (True para producción, False para desarrollo)
 WEBPAY_PRODUCTION = config('WEBPAY_PRODUCTION', default=False, cast=bool)
 
+# Servidor de la API REST. Vacío = Transbank (integración o producción según WEBPAY_PRODUCTION).
+# Para pruebas de carga sin red: WEBPAY_API_HOST=http://127.0.0.1:8001 con `manage.py webpay_standin`
+WEBPAY_API_HOST = config('WEBPAY_API_HOST', default='')
+
 # Configuración de tiempo de sesión (en segundos)
 WEBPAY_SESSION_TIMEOUT = 300  # 5 minutos
+
+# Cliente HTTP compartido (donaciones.webpay_client)
+WEBPAY_POOL_SIZE = config('WEBPAY_POOL_SIZE', default=10, cast=int)  # conexiones keep-alive por proceso
+WEBPAY_CONNECT_TIMEOUT = config('WEBPAY_CONNECT_TIMEOUT', default=3.0, cast=float)  # segundos
+WEBPAY_READ_TIMEOUT = config('WEBPAY_READ_TIMEOUT', default=15.0, cast=float)  # segundos
+# create se hace con el usuario esperando la redirección: presupuesto más corto que commit/status
+WEBPAY_CREATE_TIMEOUT = config('WEBPAY_CREATE_TIMEOUT', default=5.0, cast=float)  # segundos
+
+# Circuit breaker (core.circuit_breaker): tras N fallos seguidos de la pasarela se dejan de
+# crear transacciones durante WEBPAY_CIRCUIT_RECOVERY segundos. El estado se comparte entre
+# workers mediante un fichero SQLite propio.
+WEBPAY_CIRCUIT_FAILURES = config('WEBPAY_CIRCUIT_FAILURES', default=5, cast=int)
+WEBPAY_CIRCUIT_RECOVERY = config('WEBPAY_CIRCUIT_RECOVERY', default=30.0, cast=float)  # segundos
+WEBPAY_CIRCUIT_STATE_FILE = config(
+    'WEBPAY_CIRCUIT_STATE_FILE', default=os.path.join(tempfile.gettempdir(), 'protectora_circuitos.sqlite3')
+)
+
+# Confirmación idempotente (WebPayService.confirm_transaction)
+WEBPAY_COMMIT_CACHE_TIMEOUT = 60 * 60  # segundos que se guarda la respuesta de commit
+WEBPAY_COMMIT_WAIT = 10  # segundos esperando a otra petición que confirma el mismo token
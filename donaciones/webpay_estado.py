@@ -0,0 +1,20 @@
+"""
+Estado de la pasarela WebPay compartido por las vistas y los clientes: el circuito y
+las latencias por operación.
+
+Separado de webpay_client para que las vistas no importen el SDK de Transbank,
+requests ni httpx al arrancar el worker: solo se cargan con la primera donación.
+"""
+from core.circuit_breaker import CircuitBreaker
+from core.metrics import HistogramFamily
+from .webpay_config import WEBPAY_CIRCUIT_FAILURES, WEBPAY_CIRCUIT_RECOVERY, WEBPAY_CIRCUIT_STATE_FILE
+
+# Latencia por operación (create, commit, status), en segundos
+latencias = HistogramFamily()
+
+# Estado de la pasarela compartido por todos los workers. Cuenta como fallo un error de
+# conexión, un timeout o una respuesta 5xx; un 4xx significa que Transbank respondió.
+circuito = CircuitBreaker(
+    'webpay', WEBPAY_CIRCUIT_STATE_FILE,
+    failure_threshold=WEBPAY_CIRCUIT_FAILURES, recovery_timeout=WEBPAY_CIRCUIT_RECOVERY,
+)
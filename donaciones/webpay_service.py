@@ -1,40 +1,79 @@
 """
 Servicio para integración con WebPay de Transbank
 """
-from transbank.webpay.webpay_plus.transaction import Transaction
-from transbank.common.integration_type import IntegrationType
-from transbank.common.options import WebpayOptions
-from django.conf import settings
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
 from django.urls import reverse
 from django.utils import timezone
+from core.contention import atomic_with_retry
+import asyncio
+import time
 import uuid
 import logging
-from .webpay_config import (
-    WEBPAY_PLUS_COMMERCE_CODE, 
-    WEBPAY_PLUS_API_KEY, 
-    WEBPAY_PRODUCTION,
-    BASE_URL
-)
+from .webpay_config import BASE_URL, WEBPAY_COMMIT_CACHE_TIMEOUT, WEBPAY_COMMIT_WAIT
+from .webpay_estado import circuito
 from .models import Donacion
+from .outbox import registrar_donacion_completada
 
 logger = logging.getLogger(__name__)
 
+# Estados en los que la transacción ya no se vuelve a confirmar
+ESTADOS_FINALES = ('completada', 'fallida', 'rechazada', 'cancelada')
+
+# Valores de `status` de Transbank para un pago aprobado
+STATUS_APROBADOS = ('AUTHORIZED', 'CAPTURED')
+
+
+def estado_segun_status(response):
+    """
+    Estado final de una donación a partir de la respuesta de `status` de Transbank.
+    INITIALIZED significa que el usuario nunca completó el formulario de pago.
+    """
+    status = response.get('status')
+    if status in STATUS_APROBADOS and response.get('response_code') == 0:
+        return 'completada'
+    if status == 'INITIALIZED':
+        return 'cancelada'
+    return 'fallida'
+
+# webpay_client carga el SDK de Transbank, requests y httpx: se importa con la primera
+# transacción y no al arrancar el worker
+
+def _cliente():
+    from .webpay_client import get_webpay_client
+    return get_webpay_client()
+
+def _cliente_async(asgi):
+    from .webpay_client import get_async_webpay_client
+    return get_async_webpay_client(asgi)
+
 class WebPayService:
     """Servicio para manejar transacciones WebPay"""
     
     def __init__(self):
         """Inicializar configuración de WebPay"""
-        # Configurar opciones
-        integration_type = IntegrationType.LIVE if WEBPAY_PRODUCTION else IntegrationType.TEST
-        
-        options = WebpayOptions(
-            commerce_code=WEBPAY_PLUS_COMMERCE_CODE,
-            api_key=WEBPAY_PLUS_API_KEY,
-            integration_type=integration_type
-        )
-        
-        # Crear instancia de Transaction con opciones
-        self.transaction = Transaction(options)
+        # Cliente compartido por el proceso (pool de conexiones keep-alive);
+        # expone create/commit/status igual que Transaction del SDK
+        self.transaction = _cliente()
+    
+    @staticmethod
+    def pasarela_disponible():
+        """False si el circuito de WebPay está abierto (comprobación sin tocar la base de datos)"""
+        return circuito.is_available()
+    
+    @staticmethod
+    def reintentar_en():
+        """Segundos hasta que se vuelva a probar la pasarela"""
+        return circuito.retry_after()
+    
+    @staticmethod
+    async def apasarela_disponible():
+        """pasarela_disponible para vistas asíncronas: el fichero del circuito se lee fuera del event loop"""
+        return await circuito.ais_available()
+    
+    @staticmethod
+    async def areintentar_en():
+        return await circuito.aretry_after()
     
     def create_transaction(self, donacion):
         """
@@ -46,28 +85,16 @@ class WebPayService:
         Returns:
             dict: Respuesta con token y URL de WebPay
         """
+        if not circuito.allow_request():
+            return self._circuito_abierto()
         try:
-            # Generar orden de compra única
-            buy_order = f"DON-{donacion.id}-{uuid.uuid4().hex[:8]}"
-            session_id = str(uuid.uuid4())
-            
-            # URLs de retorno
-            return_url = BASE_URL + reverse('donaciones:webpay_resultado')
-            
-            logger.info(f"Creando transacción WebPay - Monto: {donacion.cantidad}, Return URL: {return_url}")
+            orden = self._nueva_orden(donacion)
             
             # Crear transacción usando la instancia
-            response = self.transaction.create(
-                buy_order=buy_order,
-                session_id=session_id,
-                amount=int(donacion.cantidad),  # WebPay requiere entero
-                return_url=return_url
-            )
+            response = self.transaction.create(**orden)
             
             # Actualizar donación con datos de WebPay
-            donacion.buy_order = buy_order
-            donacion.session_id = session_id
-            donacion.token_ws = response['token']
+            self._registrar_transaccion(donacion, orden, response)
             donacion.save()
             
             logger.info(f"Transacción WebPay creada para donación {donacion.id}")
@@ -87,7 +114,12 @@ class WebPayService:
     
     def confirm_transaction(self, token):
         """
-        Confirmar una transacción WebPay
+        Confirmar una transacción WebPay (idempotente)
+        
+        Una recarga del navegador o una doble redirección no vuelven a llamar a
+        commit: si la donación ya está en un estado final se devuelve el resultado
+        guardado. La donación se reserva pasando de 'pendiente' a 'procesando' con
+        un UPDATE condicional, que actúa como bloqueo por token entre procesos.
         
         Args:
             token: Token de la transacción
@@ -96,49 +128,107 @@ class WebPayService:
             dict: Resultado de la confirmación
         """
         try:
-            # Confirmar transacción usando la instancia
-            response = self.transaction.commit(token)
-            
-            # Buscar donación por token
-            try:
-                donacion = Donacion.objects.get(token_ws=token)
-            except Donacion.DoesNotExist:
+            # Buscar donación por token (campo indexado)
+            donacion = Donacion.objects.filter(token_ws=token).first()
+            if donacion is None:
                 logger.error(f"No se encontró donación con token {token}")
                 return {
                     'success': False,
                     'error': 'Donación no encontrada'
                 }
             
-            # Actualizar donación con respuesta de WebPay
-            donacion.webpay_response = response
-            donacion.authorization_code = response.get('authorization_code', '')
-            donacion.transaction_date = timezone.now()
+            if donacion.estado in ESTADOS_FINALES:
+                return self._repetir_confirmacion(donacion)
             
-            # Verificar estado de la transacción
-            if response.get('response_code') == 0:  # Transacción exitosa
-                donacion.estado = 'completada'
-                donacion.save()
-                
-                logger.info(f"Transacción confirmada para donación {donacion.id}")
-                
-                return {
-                    'success': True,
-                    'donacion': donacion,
-                    'response': response
-                }
-            else:
-                donacion.estado = 'fallida'
-                donacion.save()
+            if not donacion.cambiar_estado_si('pendiente', 'procesando'):
+                # Otra petición está confirmando este token: esperar su resultado
+                return self._esperar_confirmacion(donacion.pk)
+            
+            try:
+                # Si un intento anterior confirmó pero no llegó a guardar, se reutiliza su respuesta
+                response = cache.get(self._cache_key(token))
+                if response is None:
+                    response = self.transaction.commit(token)
+                    cache.set(self._cache_key(token), response, WEBPAY_COMMIT_CACHE_TIMEOUT)
                 
-                logger.warning(f"Transacción fallida para donación {donacion.id}")
+                # Actualizar donación con respuesta de WebPay
+                self._registrar_resultado(donacion, response)
+                if not self._guardar_resultado(donacion):
+                    return self._resultado_conciliado(donacion.pk)
+            except Exception:
+                # Liberar la reserva para que la confirmación se pueda reintentar
+                donacion.cambiar_estado_si('procesando', 'pendiente')
+                raise
+            return self._resultado_confirmacion(donacion, response)
                 
+        except Exception as e:
+            logger.error(f"Error al confirmar transacción WebPay: {str(e)}")
+            return {
+                'success': False,
+                'error': str(e)
+            }
+    
+    async def acreate_transaction(self, donacion, asgi=True):
+        """
+        Versión asíncrona de create_transaction para vistas servidas por ASGI:
+        la llamada a Transbank se espera sin bloquear el worker. Con asgi=False
+        (vista async servida por WSGI) se usa el cliente síncrono del proceso.
+        """
+        if not await circuito.aallow_request():
+            return self._circuito_abierto()
+        try:
+            orden = self._nueva_orden(donacion)
+            response = await _cliente_async(asgi).create(**orden)
+            
+            self._registrar_transaccion(donacion, orden, response)
+            await donacion.asave()
+            
+            logger.info(f"Transacción WebPay creada para donación {donacion.id}")
+            
+            return {
+                'success': True,
+                'token': response['token'],
+                'url': response['url']
+            }
+            
+        except Exception as e:
+            logger.error(f"Error al crear transacción WebPay: {str(e)}")
+            return {
+                'success': False,
+                'error': str(e)
+            }
+    
+    async def aconfirm_transaction(self, token, asgi=True):
+        """Versión asíncrona de confirm_transaction (mismas garantías de idempotencia)"""
+        try:
+            donacion = await Donacion.objects.filter(token_ws=token).afirst()
+            if donacion is None:
+                logger.error(f"No se encontró donación con token {token}")
                 return {
                     'success': False,
-                    'donacion': donacion,
-                    'response': response,
-                    'error': 'Transacción rechazada'
+                    'error': 'Donación no encontrada'
                 }
+            
+            if donacion.estado in ESTADOS_FINALES:
+                return await sync_to_async(self._repetir_confirmacion)(donacion)
+            
+            if not await donacion.acambiar_estado_si('pendiente', 'procesando'):
+                return await self._aesperar_confirmacion(donacion.pk)
+            
+            try:
+                response = await cache.aget(self._cache_key(token))
+                if response is None:
+                    response = await _cliente_async(asgi).commit(token)
+                    await cache.aset(self._cache_key(token), response, WEBPAY_COMMIT_CACHE_TIMEOUT)
                 
+                self._registrar_resultado(donacion, response)
+                if not await sync_to_async(self._guardar_resultado)(donacion):
+                    return await sync_to_async(self._resultado_conciliado)(donacion.pk)
+            except Exception:
+                await donacion.acambiar_estado_si('procesando', 'pendiente')
+                raise
+            return self._resultado_confirmacion(donacion, response)
+            
         except Exception as e:
             logger.error(f"Error al confirmar transacción WebPay: {str(e)}")
             return {
@@ -146,6 +236,120 @@ class WebPayService:
                 'error': str(e)
             }
     
+    def _nueva_orden(self, donacion):
+        """Datos de la transacción a crear: orden de compra única, sesión y URL de retorno"""
+        return_url = BASE_URL + reverse('donaciones:webpay_resultado')
+        logger.info(f"Creando transacción WebPay - Monto: {donacion.cantidad}, Return URL: {return_url}")
+        return {
+            'buy_order': f"DON-{donacion.id}-{uuid.uuid4().hex[:8]}",
+            'session_id': str(uuid.uuid4()),
+            'amount': int(donacion.cantidad),  # WebPay requiere entero
+            'return_url': return_url,
+        }
+    
+    def _registrar_transaccion(self, donacion, orden, response):
+        donacion.buy_order = orden['buy_order']
+        donacion.session_id = orden['session_id']
+        donacion.token_ws = response['token']
+    
+    def _registrar_resultado(self, donacion, response):
+        donacion.webpay_response = response
+        donacion.authorization_code = response.get('authorization_code', '')
+        donacion.transaction_date = timezone.now()
+        # Verificar estado de la transacción
+        if response.get('response_code') == 0:  # Transacción exitosa
+            donacion.estado = 'completada'
+        else:
+            donacion.estado = 'fallida'
+    
+    @atomic_with_retry
+    def _guardar_resultado(self, donacion):
+        """
+        Guardar el resultado y, si se completó, sus eventos de outbox en la misma transacción.
+        Solo si la donación sigue reservada en 'procesando' (UPDATE condicional, como
+        cambiar_estado_si): si `reconcile_donations` la cerró mientras se esperaba a commit,
+        no se pisa su estado ni se duplican los eventos. Devuelve True si se guardó.
+        """
+        guardada = Donacion.objects.filter(pk=donacion.pk, estado='procesando').cambiar_estado(
+            donacion.estado,
+            webpay_response=donacion.webpay_response,
+            authorization_code=donacion.authorization_code,
+            transaction_date=donacion.transaction_date,
+        )
+        if not guardada:
+            return False
+        donacion._clave_resumen = donacion.clave_resumen()
+        if donacion.estado == 'completada':
+            registrar_donacion_completada([donacion.pk])
+        return True
+    
+    def _resultado_conciliado(self, donacion_id):
+        """La donación se cerró por otra vía durante la confirmación: vale el resultado ya guardado"""
+        donacion = Donacion.objects.get(pk=donacion_id)
+        logger.warning(f"Donación {donacion.id} cerrada durante la confirmación ({donacion.estado}); no se sobrescribe")
+        return self._repetir_confirmacion(donacion)
+    
+    def _resultado_confirmacion(self, donacion, response):
+        if donacion.estado == 'completada':
+            logger.info(f"Transacción confirmada para donación {donacion.id}")
+            return {
+                'success': True,
+                'donacion': donacion,
+                'response': response
+            }
+        logger.warning(f"Transacción fallida para donación {donacion.id}")
+        return {
+            'success': False,
+            'donacion': donacion,
+            'response': response,
+            'error': 'Transacción rechazada'
+        }
+    
+    def _circuito_abierto(self):
+        logger.warning("Pasarela WebPay no disponible: circuito abierto, no se crea la transacción")
+        return {
+            'success': False,
+            'circuito_abierto': True,
+            'error': 'Pasarela de pago no disponible'
+        }
+    
+    def _cache_key(self, token):
+        return f"webpay:commit:{token}"
+    
+    def _repetir_confirmacion(self, donacion):
+        """Resultado de una donación ya confirmada, sin volver a llamar a Transbank (la respuesta puede estar archivada)"""
+        logger.info(f"Confirmación repetida para donación {donacion.id} ({donacion.estado})")
+        return self._resultado_confirmacion(donacion, donacion.respuesta_webpay() or {})
+    
+    def _en_proceso(self, donacion):
+        logger.warning(f"Donación {donacion.id} sigue en proceso tras esperar su confirmación")
+        return {
+            'success': False,
+            'donacion': donacion,
+            'en_proceso': True,
+            'error': 'Transacción en proceso'
+        }
+    
+    def _esperar_confirmacion(self, donacion_id):
+        limite = time.monotonic() + WEBPAY_COMMIT_WAIT
+        while True:
+            donacion = Donacion.objects.get(pk=donacion_id)
+            if donacion.estado in ESTADOS_FINALES:
+                return self._repetir_confirmacion(donacion)
+            if time.monotonic() >= limite:
+                return self._en_proceso(donacion)
+            time.sleep(0.2)
+    
+    async def _aesperar_confirmacion(self, donacion_id):
+        limite = time.monotonic() + WEBPAY_COMMIT_WAIT
+        while True:
+            donacion = await Donacion.objects.aget(pk=donacion_id)
+            if donacion.estado in ESTADOS_FINALES:
+                return await sync_to_async(self._repetir_confirmacion)(donacion)
+            if time.monotonic() >= limite:
+                return self._en_proceso(donacion)
+            await asyncio.sleep(0.2)
+    
     def get_transaction_status(self, token):
         """
         Obtener estado de una transacción WebPay
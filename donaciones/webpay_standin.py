@@ -0,0 +1,212 @@
+"""
+Servidor local que imita la API REST de WebPay Plus (create/commit/status) y el
+formulario de pago. Permite medir y probar el flujo de donación sin acceso a Transbank.
+
+Comportamiento configurable:
+- latency / jitter: espera antes de cada respuesta de la API
+- error_rate / error_status: fracción de llamadas que fallan con ese código HTTP
+- reject_rate: fracción de pagos rechazados por el "banco" (response_code -1)
+- abandon_rate: fracción de usuarios que anulan el pago en el formulario
+"""
+import json
+import os
+import random
+import re
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+from transbank.common.api_constants import ApiConstants
+
+TRANSACTION_PATH_RE = re.compile(
+    rf"^{re.escape(ApiConstants.WEBPAY_ENDPOINT)}/transactions/?(?P<token>[\w-]*)$"
+)
+FORM_PATH = '/webpayserver/initTransaction'
+
+
+class WebPayStandInHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 para que los clientes puedan reutilizar la conexión
+    protocol_version = 'HTTP/1.1'
+    # Cabeceras y cuerpo van en escrituras separadas: sin TCP_NODELAY el ACK retardado añade ~40 ms
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_POST(self):
+        if urlsplit(self.path).path == FORM_PATH:
+            return self._payment_form()
+        match = TRANSACTION_PATH_RE.match(self.path)
+        if not match or match.group('token'):
+            return self._send(404, {'error_message': 'Not found'})
+        body = self._read_json()
+        if self._simulated_error('create'):
+            return
+        token = uuid.uuid4().hex + uuid.uuid4().hex  # 64 caracteres, como Transbank
+        self.server.transactions[token] = dict(body, status='INITIALIZED')
+        self.server.stats['create'] += 1
+        self._send(200, {'token': token, 'url': f'{self.server.base_url}{FORM_PATH}'})
+
+    def do_PUT(self):
+        self._transaction_response(commit=True)
+
+    def do_GET(self):
+        if urlsplit(self.path).path == FORM_PATH:
+            return self._payment_form()
+        self._transaction_response(commit=False)
+
+    def _transaction_response(self, commit):
+        operation = 'commit' if commit else 'status'
+        match = TRANSACTION_PATH_RE.match(self.path)
+        token = match.group('token') if match else None
+        if commit:
+            self._read_json()
+        transaction = self.server.transactions.get(token)
+        if transaction is None:
+            self.server.stats[f'{operation} 422'] += 1
+            return self._send(422, {'error_message': 'Invalid value for parameter: token'})
+        if self._simulated_error(operation):
+            return
+
+        if commit:
+            if transaction['status'] != 'INITIALIZED':
+                self.server.stats['commit 422'] += 1
+                return self._send(422, {'error_message': 'Transaction already locked by another process'})
+            rejected = random.random() < self.server.reject_rate
+            transaction['status'] = 'FAILED' if rejected else 'AUTHORIZED'
+        self.server.stats[f'{operation} {transaction["status"]}'] += 1
+
+        if transaction['status'] == 'INITIALIZED':
+            # Pago abandonado: el usuario nunca volvió del formulario de WebPay
+            return self._send(200, {
+                'amount': transaction.get('amount'),
+                'status': 'INITIALIZED',
+                'buy_order': transaction.get('buy_order'),
+                'session_id': transaction.get('session_id'),
+            })
+        authorized = transaction['status'] == 'AUTHORIZED'
+        self._send(200, {
+            'vci': 'TSY',
+            'amount': transaction.get('amount'),
+            'status': transaction['status'],
+            'buy_order': transaction.get('buy_order'),
+            'session_id': transaction.get('session_id'),
+            'card_detail': {'card_number': '6623'},
+            'accounting_date': time.strftime('%m%d'),
+            'transaction_date': time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime()),
+            'authorization_code': '1213' if authorized else '000000',
+            'payment_type_code': 'VN',
+            'response_code': 0 if authorized else -1,
+            'installments_number': 0,
+        })
+
+    def _payment_form(self):
+        """El "usuario" paga (o anula) al instante y vuelve a return_url, como el formulario de WebPay"""
+        query = parse_qs(urlsplit(self.path).query)
+        if self.command == 'POST':
+            query.update(parse_qs(self._read_body().decode()))
+        token = (query.get('token_ws') or [''])[0]
+        transaction = self.server.transactions.get(token)
+        if transaction is None:
+            return self._send(404, {'error_message': 'Token no encontrado'})
+
+        if random.random() < self.server.abandon_rate:
+            self.server.stats['formulario anulado'] += 1
+            params = {
+                'TBK_TOKEN': token,
+                'TBK_ORDEN_COMPRA': transaction.get('buy_order', ''),
+                'TBK_ID_SESION': transaction.get('session_id', ''),
+            }
+        else:
+            self.server.stats['formulario pagado'] += 1
+            params = {'token_ws': token}
+        self.send_response(302)
+        self.send_header('Location', f'{transaction["return_url"]}?{urlencode(params)}')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def _simulated_error(self, operation):
+        self._delay()
+        if random.random() < self.server.error_rate:
+            self.server.stats[f'{operation} {self.server.error_status}'] += 1
+            self._send(self.server.error_status, {'error_message': 'Error simulado por el servidor local'})
+            return True
+        return False
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _read_json(self):
+        try:
+            return json.loads(self._read_body() or b'{}')
+        except ValueError:
+            return {}
+
+    def _delay(self):
+        latency = self.server.latency
+        if self.server.jitter:
+            latency = max(0.0, random.gauss(latency, self.server.jitter))
+        if latency:
+            time.sleep(latency)
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class WebPayStandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.0, certfile=None, keyfile=None, verbose=False,
+                 jitter=0.0, error_rate=0.0, error_status=500, reject_rate=0.0, abandon_rate=0.0):
+        super().__init__(address, WebPayStandInHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.reject_rate = reject_rate
+        self.abandon_rate = abandon_rate
+        self.verbose = verbose
+        self.transactions = {}
+        self.stats = Counter()
+        scheme = 'http'
+        if certfile:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(certfile, keyfile)
+            self.socket = context.wrap_socket(self.socket, server_side=True)
+            scheme = 'https'
+        host, port = self.server_address[:2]
+        self.base_url = f'{scheme}://{host}:{port}'
+
+    def start_in_thread(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+def generate_self_signed_cert(directory=None):
+    """Crear un certificado autofirmado para 127.0.0.1 con el binario openssl"""
+    directory = directory or tempfile.mkdtemp(prefix='webpay-standin-')
+    certfile = os.path.join(directory, 'cert.pem')
+    keyfile = os.path.join(directory, 'key.pem')
+    subprocess.run(
+        [
+            'openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+            '-keyout', keyfile, '-out', certfile, '-subj', '/CN=127.0.0.1',
+            '-addext', 'subjectAltName=IP:127.0.0.1',
+        ],
+        check=True, capture_output=True,
+    )
+    return certfile, keyfile
@@ -11,6 +11,11 @@ import os
 
 from django.core.asgi import get_asgi_application
 
+from core.warmup import warm_up
+
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "protectora_adan.settings")
 
 application = get_asgi_application()
+
+# URL y plantillas compiladas antes de la primera petición (WARMUP=False lo desactiva)
+warm_up()
@@ -3,6 +3,7 @@ Django settings for protectora_adan project.
 """
 
 import os
+import tempfile
 from pathlib import Path
 from decouple import config
 import dj_database_url
@@ -36,20 +37,28 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
-    "whitenoise.middleware.WhiteNoiseMiddleware",
+    "core.middleware.StaticFilesMiddleware",  # WhiteNoise, compatible con vistas async
+    "core.middleware.MetricsMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
+    # Dentro de CsrfViewMiddleware: ve CSRF_COOKIE_NEEDS_UPDATE antes de que lo reinicie
+    "core.middleware.CompressionMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "core.middleware.ProfilerMiddleware",  # ?_perfilar=1 (superusuarios)
     "django.contrib.messages.middleware.MessageMiddleware",
+    "core.middleware.MessagesNoStoreMiddleware",  # páginas con mensajes fuera de las cachés
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "core.middleware.PreloadHeadersMiddleware",
 ]
 
 ROOT_URLCONF = "protectora_adan.urls"
 
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        # DjangoTemplates que mide el tiempo de renderizado (core.middleware.MetricsMiddleware)
+        # y, con TEMPLATE_NODE_METRICS, el de cada block, include y tag de librería
+        "BACKEND": "core.template_backend.InstrumentedDjangoTemplates",
         "DIRS": [BASE_DIR / 'templates'],
         "APP_DIRS": True,
         "OPTIONS": {
@@ -59,6 +68,7 @@ TEMPLATES = [
                 "django.contrib.messages.context_processors.messages",
                 "django.template.context_processors.media",
                 "core.context_processors.info_albergue",
+                "core.context_processors.assets",
             ],
         },
     },
@@ -75,10 +85,28 @@ DATABASES = {
 # Optimizaciones para SQLite en producción
 if 'sqlite' in DATABASES['default']['ENGINE']:
     DATABASES['default']['OPTIONS'] = {
-        'timeout': 30,  # Timeout para conexiones
+        # Segundos que una escritura espera al bloqueo antes de "database is locked"; las
+        # transacciones se repiten después con backoff (core.contention)
+        'timeout': config('SQLITE_BUSY_TIMEOUT', default=5, cast=float),
         'check_same_thread': False,
     }
 
+# Reintentos tras "database is locked" (core.contention): como mucho N reintentos y sin pasar
+# de BUDGET segundos en total. Una escritura que tarda más de WAIT_MS cuenta como espera.
+SQLITE_LOCK_RETRIES = 3
+SQLITE_LOCK_RETRY_BUDGET = 10.0
+SQLITE_LOCK_WAIT_MS = 10
+
+# Caché compartida por todos los workers: la respuesta de commit de WebPay que no se llegó a
+# guardar tiene que verla el reintento aunque lo atienda otro proceso (con la LocMemCache por
+# defecto cada proceso tendría la suya). Un fichero por entrada, sin servidor ni createcachetable.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': config('CACHE_DIR', default=os.path.join(tempfile.gettempdir(), 'protectora_cache')),
+    }
+}
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -116,15 +144,68 @@ MEDIA_ROOT = BASE_DIR / "media"
 CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
 CRISPY_TEMPLATE_PACK = "bootstrap5"
 
+# Tests con los ficheros de métricas, consultas lentas y circuitos en un directorio temporal
+TEST_RUNNER = 'core.testing.StateFilesTestRunner'
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 # WhiteNoise settings for serving static files
 STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
 
+# Usar el CSS generado con `manage.py build_css` en lugar de Tailwind/Font Awesome por CDN
+USE_LOCAL_CSS = config('USE_LOCAL_CSS', default=False, cast=bool)
+
+# Compresión de respuestas dinámicas (core.middleware.CompressionMiddleware)
+COMPRESSION_MIN_SIZE = 512
+COMPRESSION_LEVELS = {'br': 5, 'zstd': 3, 'gzip': 6}
+
+# Métricas por vista (core.middleware.MetricsMiddleware), publicadas en /metrics/ para staff o
+# con `Authorization: Bearer <METRICS_TOKEN>`. Los workers las suman en un fichero SQLite propio.
+METRICS_STATE_FILE = config(
+    'METRICS_STATE_FILE', default=os.path.join(tempfile.gettempdir(), 'protectora_metricas.sqlite3')
+)
+METRICS_FLUSH_INTERVAL = config('METRICS_FLUSH_INTERVAL', default=5.0, cast=float)  # segundos
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+# Tiempo por {% block %}, {% include %} y tag de librería (core.template_backend, `manage.py template_profile`).
+# Desactivado por defecto: envuelve cada nodo medido y añade dos series por plantilla y nodo.
+# Se activa mientras se investiga un renderizado lento.
+TEMPLATE_NODE_METRICS = config('TEMPLATE_NODE_METRICS', default=False, cast=bool)
+
+# Registro de consultas lentas (core.slow_queries), en el mismo fichero que las métricas.
+# 0 lo desactiva.
+SLOW_QUERY_MS = config('SLOW_QUERY_MS', default=100, cast=float)
+SLOW_QUERY_LOG_SIZE = 500  # últimas consultas lentas que se conservan
+# Tablas grandes cuyo recorrido completo se marca en el plan
+SLOW_QUERY_FULL_SCAN_TABLES = ('adopciones_perro', 'donaciones_donacion', 'adopciones_solicitudadopcion')
+
+# Perfil bajo demanda de una petición (core.middleware.ProfilerMiddleware): `?_perfilar=1`
+# siendo superusuario o cabecera `X-Perfilar` con un token de `manage.py profile_token`
+PROFILER_INTERVAL_MS = config('PROFILER_INTERVAL_MS', default=2, cast=float)
+PROFILER_TOKEN_MAX_AGE = 3600  # segundos de validez del token
+
+# Compilar URL y plantillas al cargar wsgi.py/asgi.py en vez de en las primeras peticiones
+# (core.warmup); `manage.py startup_profile` mide el arranque
+WARMUP = config('WARMUP', default=True, cast=bool)
+
 # Base URL for WebPay
 BASE_URL = config('BASE_URL', default='http://localhost:8000')
 
+# Correo (recibos a donantes y avisos a administradores, enviados por `manage.py process_outbox`)
+EMAIL_BACKEND = config('EMAIL_BACKEND', default='django.core.mail.backends.console.EmailBackend')
+EMAIL_HOST = config('EMAIL_HOST', default='localhost')
+EMAIL_PORT = config('EMAIL_PORT', default=25, cast=int)
+EMAIL_HOST_USER = config('EMAIL_HOST_USER', default='')
+EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')
+EMAIL_USE_TLS = config('EMAIL_USE_TLS', default=False, cast=bool)
+DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default='Protectora Adán <no-responder@protectoraadan.cl>')
+SERVER_EMAIL = DEFAULT_FROM_EMAIL
+EMAIL_SUBJECT_PREFIX = '[Protectora Adán] '
+ADMINS = [
+    tuple(a.strip() for a in admin.split(':', 1))
+    for admin in config('ADMINS', default='').split(',') if ':' in admin
+]
+
 # Logging configuration
 LOGGING = {
     'version': 1,
@@ -135,6 +216,10 @@ LOGGING = {
         },
     },
     'loggers': {
+        'core': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
         'donaciones': {
             'handlers': ['console'],
             'level': 'INFO',
@@ -7,7 +7,10 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
+from core.views import consultas_lentas
+
 urlpatterns = [
+    path("admin/consultas-lentas/", admin.site.admin_view(consultas_lentas), name='consultas_lentas'),
     path("admin/", admin.site.urls),
     path('', include('core.urls')),
     path('adopciones/', include('adopciones.urls')),
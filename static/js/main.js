@@ -458,3 +458,119 @@ const reinitAnimations = () => {
 
 // Exportar función para uso externo
 window.ProtectoraAdan.reinitAnimations = reinitAnimations;
+
+// Scroll infinito del catálogo (adopciones:perros_siguientes)
+// Se precarga el siguiente lote en cuanto se muestra el anterior, y se inserta
+// cuando el usuario se acerca al final de la lista.
+document.addEventListener('DOMContentLoaded', () => {
+    const container = document.getElementById('perros-container');
+    if (!container) {
+        return;
+    }
+
+    const pagination = document.getElementById('perros-paginacion');
+    if (pagination && document.getElementById('perros-sentinel')) {
+        pagination.style.display = 'none';
+    }
+
+    const PREFETCH_MARGIN = 800;  // px antes del final
+    let prefetched = null;        // {url, promise}: la URL incluye filtros y cursor
+    let loading = false;
+
+    const batchUrl = sentinel => {
+        const params = new URLSearchParams(window.location.search);
+        params.delete('page');
+        params.set('cursor', sentinel.dataset.cursor);
+        return `${sentinel.dataset.url}?${params.toString()}`;
+    };
+
+    const fetchBatch = sentinel => {
+        const url = batchUrl(sentinel);
+        if (!prefetched || prefetched.url !== url) {
+            prefetched = {
+                url,
+                promise: fetch(url, {
+                    headers: {'X-Requested-With': 'XMLHttpRequest'}
+                }).then(response => {
+                    if (!response.ok) {
+                        throw new Error(`HTTP ${response.status}`);
+                    }
+                    return response.text();
+                }),
+            };
+        }
+        return prefetched.promise;
+    };
+
+    const appendBatch = () => {
+        // El filtro AJAX reemplaza el contenedor: buscar siempre el marcador actual
+        const sentinel = document.getElementById('perros-sentinel');
+        if (!sentinel || loading) {
+            return;
+        }
+        if (sentinel.getBoundingClientRect().top > window.innerHeight + PREFETCH_MARGIN) {
+            return;
+        }
+
+        loading = true;
+        fetchBatch(sentinel)
+            .then(html => {
+                loading = false;
+                if (!sentinel.isConnected) {
+                    return;
+                }
+                sentinel.insertAdjacentHTML('beforebegin', html);
+                sentinel.remove();
+
+                const next = document.getElementById('perros-sentinel');
+                if (next) {
+                    fetchBatch(next).catch(() => { prefetched = null; });
+                }
+                const count = document.getElementById('perros-count');
+                if (count) {
+                    count.textContent = container.querySelectorAll(':scope > .group').length;
+                }
+                // Puede que el nuevo marcador ya esté a la vista
+                appendBatch();
+            })
+            .catch(error => {
+                console.error('Error al cargar más perros:', error);
+                prefetched = null;
+                loading = false;
+            });
+    };
+
+    // Filtro AJAX (lista_perros.html): el lote precargado era de los filtros anteriores
+    document.addEventListener('perros:filtrados', () => {
+        prefetched = null;
+        const sentinel = document.getElementById('perros-sentinel');
+        if (sentinel) {
+            fetchBatch(sentinel).catch(() => { prefetched = null; });
+        }
+    });
+
+    let ticking = false;
+    window.addEventListener('scroll', () => {
+        if (!ticking) {
+            ticking = true;
+            window.requestAnimationFrame(() => {
+                ticking = false;
+                appendBatch();
+            });
+        }
+    }, {passive: true});
+
+    const first = document.getElementById('perros-sentinel');
+    if (first) {
+        fetchBatch(first).catch(() => { prefetched = null; });
+    }
+});
+
+// Service worker: caché offline del catálogo (ver core.views.service_worker)
+if ('serviceWorker' in navigator) {
+    window.addEventListener('load', () => {
+        navigator.serviceWorker.register('/sw.js').catch(error => {
+            console.error('No se pudo registrar el service worker:', error);
+        });
+    });
+}
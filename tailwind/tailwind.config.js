@@ -0,0 +1,35 @@
+// Paleta del sitio: la misma que el `tailwind.config` en línea de templates/base.html (CDN).
+// Si se cambia un color hay que cambiarlo en los dos sitios y regenerar
+// static/vendor/tailwind/tailwind.css (ver docs/FRONTEND_ASSETS.md).
+module.exports = {
+    theme: {
+        extend: {
+            colors: {
+                primary: {
+                    50: '#eff6ff',
+                    100: '#dbeafe',
+                    200: '#bfdbfe',
+                    300: '#93c5fd',
+                    400: '#60a5fa',
+                    500: '#3b82f6',
+                    600: '#2563eb',
+                    700: '#1d4ed8',
+                    800: '#1e40af',
+                    900: '#1e3a8a',
+                },
+                secondary: {
+                    50: '#f0f9ff',
+                    100: '#e0f2fe',
+                    200: '#bae6fd',
+                    300: '#7dd3fc',
+                    400: '#38bdf8',
+                    500: '#0ea5e9',
+                    600: '#0284c7',
+                    700: '#0369a1',
+                    800: '#075985',
+                    900: '#0c4a6e',
+                }
+            }
+        }
+    }
+}
@@ -0,0 +1,137 @@
+// Service worker de Protectora Adán (generado por core.views.service_worker)
+const VERSION = '{{ version }}';
+const PRECACHE = `precache-${VERSION}`;
+const PAGES = `paginas-${VERSION}`;
+const MEDIA = 'media-v1';
+// Fotos guardadas como máximo; al pasarse se borran las usadas hace más tiempo
+const MEDIA_MAX_ENTRIES = 60;
+
+const PRECACHE_URLS = {{ precache_urls|safe }};
+
+// Catálogo: stale-while-revalidate
+const CATALOGUE_PATTERNS = [
+    /^\/adopciones\/$/,
+    /^\/adopciones\/mas\/$/,
+    /^\/adopciones\/perro\/\d+\/$/,
+];
+
+// Siempre a la red: formularios, pagos WebPay y administración
+const NETWORK_ONLY_PATTERNS = [
+    /^\/donaciones\//,
+    /^\/adopciones\/perro\/\d+\/solicitar\//,
+    /^\/voluntariado\//,
+    /^\/admin\//,
+];
+
+// Tras un POST la siguiente navegación va a la red (mensajes flash, estado actualizado)
+let bypassNextNavigation = false;
+
+self.addEventListener('install', event => {
+    event.waitUntil(
+        caches.open(PRECACHE)
+            .then(cache => cache.addAll(PRECACHE_URLS))
+            .then(() => self.skipWaiting())
+    );
+});
+
+self.addEventListener('activate', event => {
+    const current = [PRECACHE, PAGES, MEDIA];
+    event.waitUntil(
+        caches.keys()
+            .then(keys => Promise.all(
+                keys.filter(key => !current.includes(key)).map(key => caches.delete(key))
+            ))
+            .then(() => self.clients.claim())
+    );
+});
+
+self.addEventListener('fetch', event => {
+    const request = event.request;
+    const url = new URL(request.url);
+
+    if (request.method !== 'GET') {
+        bypassNextNavigation = true;
+        return;
+    }
+    if (url.origin !== self.location.origin) {
+        return;
+    }
+    if (NETWORK_ONLY_PATTERNS.some(pattern => pattern.test(url.pathname))) {
+        return;
+    }
+
+    if (url.pathname.startsWith('{{ static_url }}') || url.pathname.startsWith('{{ media_url }}')) {
+        if (url.pathname.startsWith('{{ media_url }}')) {
+            event.respondWith(cacheFirst(event, request, MEDIA, MEDIA_MAX_ENTRIES));
+        } else {
+            event.respondWith(cacheFirst(event, request, PRECACHE));
+        }
+        return;
+    }
+
+    if (CATALOGUE_PATTERNS.some(pattern => pattern.test(url.pathname))) {
+        if (request.mode === 'navigate' && bypassNextNavigation) {
+            bypassNextNavigation = false;
+            return;
+        }
+        event.respondWith(staleWhileRevalidate(event, request));
+    }
+});
+
+async function cacheFirst(event, request, cacheName, maxEntries) {
+    const cache = await caches.open(cacheName);
+    const cached = await cache.match(request);
+    if (cached) {
+        if (maxEntries) {
+            // Volver a guardarla la pasa al final de cache.keys(): el orden es el de último uso
+            event.waitUntil(cache.delete(request).then(() => cache.put(request, cached.clone())));
+        }
+        return cached;
+    }
+    const response = await fetch(request);
+    if (response.ok) {
+        const stored = cache.put(request, response.clone());
+        event.waitUntil(maxEntries ? stored.then(() => trimCache(cache, maxEntries)) : stored);
+    }
+    return response;
+}
+
+async function trimCache(cache, maxEntries) {
+    const keys = await cache.keys();
+    await Promise.all(keys.slice(0, Math.max(0, keys.length - maxEntries)).map(key => cache.delete(key)));
+}
+
+// Páginas con mensajes flash (no-store, core.middleware.MessagesNoStoreMiddleware): no se guardan
+// para no volver a mostrar el mensaje al servirlas desde la caché
+function cacheable(response) {
+    return response.ok && !response.redirected && !/no-store/.test(response.headers.get('Cache-Control') || '');
+}
+
+// El parcial AJAX y la página completa comparten URL: se guardan con claves distintas
+function pageCacheKey(request) {
+    if (request.headers.get('X-Requested-With') === 'XMLHttpRequest') {
+        const url = new URL(request.url);
+        url.searchParams.set('__parcial', '1');
+        return url.toString();
+    }
+    return request.url;
+}
+
+async function staleWhileRevalidate(event, request) {
+    const cache = await caches.open(PAGES);
+    const key = pageCacheKey(request);
+    const cached = await cache.match(key);
+
+    const network = fetch(request).then(response => {
+        if (cacheable(response)) {
+            cache.put(key, response.clone());
+        }
+        return response;
+    });
+
+    if (cached) {
+        event.waitUntil(network.catch(() => undefined));
+        return cached;
+    }
+    return network;
+}